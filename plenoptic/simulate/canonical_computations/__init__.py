@@ -1,4 +1,7 @@
 from .laplacian_pyramid import Laplacian_Pyramid
-from .steerable_pyramid_freq import Steerable_Pyramid_Freq
+from .steerable_pyramid_freq import Steerable_Pyramid_Freq, PackedPyramid
+from .tiled_steerable_pyramid import Tiled_Steerable_Pyramid_Freq
+from .steerable_pyramid_space import (Steerable_Pyramid_Space, steerable_pyramid,
+                                     benchmark_steerable_pyramids)
 from .non_linearities import *
 from .filters import *
@@ -1,18 +1,258 @@
+import copy
 import warnings
+import weakref
 from collections import OrderedDict
+from collections.abc import Mapping
 import numpy as np
 from scipy.special import factorial
 from ...tools.signal import (interpolate1d,
-                             raised_cosine, steer)
+                             raised_cosine, steering_weights)
 import torch
 import torch.fft as fft
 import torch.nn as nn
-from einops import rearrange
 from scipy.special import factorial
 
 
 complex_types = [torch.cdouble, torch.cfloat]
 
+# process-wide cache of pyramid masks, shared by all pyramids with the same
+# parameters, dtype and device. values are weak references, so masks are
+# freed once no pyramid uses them anymore
+_MASK_CACHE = weakref.WeakValueDictionary()
+
+
+def _is_compiling():
+    r"""Whether we're being traced by ``torch.compile``
+
+    ``torch.compiler.is_compiling`` only exists for torch>=2.1 (and
+    ``torch.compile`` for torch>=2.0), so older versions are never compiling.
+
+    """
+    is_compiling = getattr(getattr(torch, 'compiler', None), 'is_compiling', None)
+    if is_compiling is None:
+        is_compiling = getattr(getattr(torch, '_dynamo', None), 'is_compiling', lambda: False)
+    return is_compiling()
+
+
+def _mask_names(scale):
+    r"""Names of the mask buffers built together for ``scale``
+
+    ``scale`` is either an int, ``'residual'``, for the masks used to
+    compute the residuals, or ``('lopass', i)``, for the product of all
+    the lowpass masks applied before scale ``i``.
+
+    """
+    if scale == 'residual':
+        return ['lo0mask', 'hi0mask']
+    if isinstance(scale, tuple):
+        return [f'_lopass_{scale[1]}']
+    return [f'_himask_{scale}', f'_lomask_{scale}', f'_anglemask_{scale}',
+            f'_anglemask_recon_{scale}']
+
+
+def _mask_cache_get(key, dtype, device, names):
+    r"""Get the masks called ``names`` for pyramids with ``key`` from the cache, or None if they're not all present"""
+    masks = OrderedDict()
+    for name in names:
+        mask = _MASK_CACHE.get((key, dtype, device, name))
+        if mask is None:
+            return None
+        masks[name] = mask
+    return masks
+
+
+def _mask_cache_set(key, masks):
+    r"""Add the dictionary of mask tensors to the cache"""
+    mask = next(iter(masks.values()))
+    dtype, device = mask.dtype, mask.device
+    for name, mask in masks.items():
+        _MASK_CACHE[(key, dtype, device, name)] = mask
+
+
+def _unshifted_crop_indices(n, n_crop):
+    r"""Indices of an unshifted spectrum of length ``n`` kept when cropping it to ``n_crop``
+
+    Cropping the centered spectrum (as returned by ``fftshift``) around the
+    zero frequency is equivalent to gathering these indices from the
+    unshifted spectrum, and the result is again unshifted.
+
+    """
+    # center of the cropped spectrum, following fftshift's convention
+    ctr = int(np.ceil((n_crop + 0.5) / 2))
+    freqs = np.arange(n_crop)
+    freqs[freqs > n_crop - ctr] -= n_crop
+    return freqs % n
+
+
+def _half_spectrum(mask, parity=1):
+    r"""Symmetrize an unshifted Fourier mask and restrict it to the half-plane used by rfft2
+
+    For a real input, ``ifft2(X * M).real == ifft2(X * Mh)``, where ``Mh(k) =
+    (M(k) + conj(M(-k))) / 2`` is the Hermitian part of the mask. For a
+    real-valued mask multiplied by the constant ``(-1j)**order``, this is
+    the same as multiplying the constant by ``(M(k) + parity * M(-k)) / 2``,
+    with ``parity = (-1)**order``. The symmetrized mask only needs to be
+    known on the non-negative frequencies of the last dimension, which is
+    the layout returned by ``torch.fft.rfft2``.
+
+    Parameters
+    ----------
+    mask : torch.Tensor
+        Real-valued mask of shape ``(..., H, W)``, in the unshifted layout
+        returned by ``fft2``.
+    parity : {1, -1}
+        Whether the mask should be made even (1) or odd (-1) around the
+        origin.
+
+    Returns
+    -------
+    half_mask : torch.Tensor
+        Mask of shape ``(..., H, W//2+1)``, in the (unshifted) layout of
+        ``rfft2``: columns correspond to the non-negative frequencies.
+
+    """
+    # index k -> -k (modulo the size of each dimension)
+    flipped = mask.flip((-2, -1)).roll((1, 1), (-2, -1))
+    mask = (mask + parity * flipped) / 2
+    return mask[..., :mask.shape[-1]//2+1]
+
+
+# the adjoint of a fft with a given normalization is the inverse fft with
+# the "opposite" one (and vice versa)
+_ADJOINT_NORM = {"backward": "forward", "ortho": "ortho", "forward": "backward"}
+
+
+def _rfft_column_weights(n, interior, like):
+    r"""Weights of the columns of an rfft2 spectrum, for a signal with ``n`` columns
+
+    The non-negative frequencies stored by ``rfft2`` stand for themselves
+    and their negative counterparts, except for the zero (and, if ``n`` is
+    even, the Nyquist) frequency. This returns a vector that is
+    ``interior`` for the former and 1 for the latter, with the real dtype
+    and the device of ``like``.
+
+    """
+    weights = torch.ones(n//2+1, dtype=like.real.dtype, device=like.device)
+    weights[1:(n+1)//2] = interior
+    return weights
+
+
+class _AdjointPyramid(torch.autograd.Function):
+    r"""The steerable pyramid transform, differentiated using its adjoint
+
+    The transform is linear, so the gradient of the image is the adjoint
+    transform applied to the gradients of the coefficients (see
+    ``Steerable_Pyramid_Freq._adjoint``), and the directional derivative is
+    the transform of the tangent. Neither needs any of the intermediate
+    spectra, so nothing but the shape of the image is saved for backward.
+    The adjoint is written with differentiable operations, so higher order
+    derivatives work as well.
+
+    """
+
+    @staticmethod
+    def forward(ctx, pyr, scales, x):
+        ctx.set_materialize_grads(False)
+        ctx.pyr, ctx.scales, ctx.shape = pyr, scales, x.shape[-2:]
+        ctx.keys = pyr._coeff_keys(scales)
+        return tuple(pyr._forward(x, scales, OrderedDict()).values())
+
+    @staticmethod
+    def backward(ctx, *grads):
+        grads = dict(zip(ctx.keys, grads))
+        return None, None, ctx.pyr._adjoint(grads, ctx.scales, ctx.shape)
+
+    @staticmethod
+    def jvp(ctx, pyr_t, scales_t, x_t):
+        return tuple(ctx.pyr._forward(x_t, ctx.scales, OrderedDict()).values())
+
+
+class PackedPyramid(Mapping):
+    r"""Pyramid coefficients packed into a single contiguous buffer
+
+    Behaves like the (read-only) ``OrderedDict`` of coefficients returned by
+    ``Steerable_Pyramid_Freq.forward``, but all bands, from all scales,
+    downsampled or not, live in one flat, preallocated tensor of shape
+    ``(batch, channel, n_values)`` (``(batch, channel, time, n_values)`` for
+    videos). Indexing with a key returns a view into
+    that buffer, so flattening the pyramid (e.g., for computing a loss) does
+    not require any copies.
+
+    Complex bands are stored with their real and imaginary parts
+    interleaved (the layout of ``torch.view_as_real``), and returned as
+    complex views. In order for those views to be valid, each band starts
+    at an even offset, so a real band with an odd number of values is
+    followed by a single (zero) padding value.
+
+    Parameters
+    ----------
+    band_shapes : `OrderedDict`
+        Keys are the pyramid keys, values the spatial shape of each band.
+    complex_keys : `list`
+        The keys of ``band_shapes`` whose bands are complex-valued.
+    batch_shape : `tuple`
+        The batch and channel (and time) dimensions of the coefficients.
+    dtype : `torch.dtype`
+        The (real) dtype of the buffer.
+    device : `torch.device`
+        The device of the buffer.
+
+    Attributes
+    ----------
+    buffer : `torch.Tensor`
+        The tensor containing all coefficients.
+
+    """
+
+    def __init__(self, band_shapes, complex_keys, batch_shape, dtype=torch.float32,
+                 device=None):
+        self._shapes = OrderedDict()
+        self._offsets = OrderedDict()
+        self._complex_keys = set(complex_keys)
+        n_values = 0
+        for k, shape in band_shapes.items():
+            shape = tuple(shape)
+            numel = int(np.prod(shape))
+            if k in self._complex_keys:
+                shape = shape + (2, )
+                numel *= 2
+            self._shapes[k] = shape
+            self._offsets[k] = n_values
+            n_values += numel + numel % 2
+        self.buffer = torch.zeros(*batch_shape, n_values, dtype=dtype, device=device)
+
+    def __getitem__(self, key):
+        offset = self._offsets[key]
+        shape = self._shapes[key]
+        band = self.buffer[..., offset:offset+int(np.prod(shape))]
+        band = band.view(*band.shape[:-1], *shape)
+        if key in self._complex_keys:
+            band = torch.view_as_complex(band)
+        return band
+
+    def __setitem__(self, key, value):
+        # write value into the buffer, rather than replacing the band
+        self[key].copy_(value)
+
+    def __iter__(self):
+        return iter(self._shapes)
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def flatten(self):
+        r"""Get all coefficients as a single real tensor, without copying
+
+        Returns
+        -------
+        coeffs : `torch.Tensor`
+            Tensor of shape ``(batch, channel, n_values)``. Complex bands
+            are included as interleaved real and imaginary parts.
+
+        """
+        return self.buffer
+
+
 class Steerable_Pyramid_Freq(nn.Module):
     r"""Steerable frequency pyramid in Torch
 
@@ -30,10 +270,20 @@ class Steerable_Pyramid_Freq(nn.Module):
     Transform described in [1]_, filter kernel design described in [2]_.
     For further information see the project webpage_
 
+    The masks that define the filters are built the first time each scale
+    is used, directly on the device and with the dtype of the pyramid
+    (i.e., after any calls to ``to()``).
+
+    If ``image_shape`` is None, the pyramid accepts inputs of any shape.
+    The first time it sees a shape, it creates a pyramid for it (whose masks
+    are, as usual, built when first used) and keeps it in a
+    least-recently-used cache. The cache is bounded by ``max_shapes`` and,
+    optionally, by the memory taken up by the masks, ``max_mask_bytes``.
+
     Parameters
     ----------
-    image_shape : `list or tuple`
-        shape of input image
+    image_shape : `list or tuple` or None
+        shape of input image. If None, any shape is accepted (see above).
     height : 'auto' or `int`
         The height of the pyramid. If 'auto', will automatically determine
         based on the size of `image`.
@@ -54,6 +304,29 @@ class Steerable_Pyramid_Freq(nn.Module):
         Whether the pyramid obeys the generalized parseval theorem or not (i.e. is a tight frame).
         If True, the energy of the pyr_coeffs = energy of the image. If not this is not true.
         In order to match the matlabPyrTools or pyrtools pyramids, this must be set to False
+    use_rfft: `bool` default: False
+        Whether to compute the transform of real pyramids using only half of
+        the (Hermitian-symmetric) spectrum, with ``torch.fft.rfft2`` and
+        ``torch.fft.irfft2``. This roughly halves the time and memory spent
+        on ffts. Coefficients match those of the full-spectrum pyramid to
+        within floating point error for even-sized images. Only supported
+        for real pyramids (``is_complex=False``).
+    max_shapes: `int` default: 8
+        If ``image_shape`` is None, the maximum number of input shapes whose
+        pyramids are kept around. Ignored otherwise.
+    max_mask_bytes: `int` or None default: None
+        If ``image_shape`` is None and this is not None, the least recently
+        used shapes are also evicted when the masks of all the shapes take
+        up more than this many bytes (though the most recent shape is always
+        kept). Ignored otherwise.
+    adjoint_backward: `bool` default: True
+        Whether to compute gradients through forward by applying the
+        adjoint of the (linear) transform to the gradients of the
+        coefficients, instead of backpropagating through each of its
+        operations. The results are the same (to within floating point
+        error), but none of the intermediate spectra are kept around for
+        backward, which greatly reduces the memory taken up by the
+        autograd graph when, e.g., synthesizing metamers.
 
     Attributes
     ----------
@@ -79,7 +352,8 @@ class Steerable_Pyramid_Freq(nn.Module):
     """
 
     def __init__(self, image_shape, height='auto', order=3, twidth=1, is_complex=False,
-                  downsample=True,  tight_frame=False):
+                  downsample=True,  tight_frame=False, use_rfft=False, max_shapes=8,
+                  max_mask_bytes=None, adjoint_backward=True):
 
         super().__init__()
 
@@ -87,17 +361,27 @@ class Steerable_Pyramid_Freq(nn.Module):
         self.order = order
         self.image_shape = image_shape
 
-        if (self.image_shape[0] % 2 != 0) or (self.image_shape[1] % 2 != 0):
-            warnings.warn(
-                "Reconstruction will not be perfect with odd-sized images")
-
         self.is_complex = is_complex
         self.downsample = downsample
         self.tight_frame = tight_frame
+        if use_rfft and self.is_complex:
+            warnings.warn("use_rfft is only supported for real pyramids. Setting to False.")
+            use_rfft = False
+        self.use_rfft = use_rfft
+        self.adjoint_backward = adjoint_backward
         if self.tight_frame:
             self.fft_norm = "ortho"
         else:
             self.fft_norm = "backward"
+
+        self._shape_pyrs = None
+        if self.image_shape is None:
+            self._init_polymorphic(height, twidth, max_shapes, max_mask_bytes)
+            return
+
+        if (self.image_shape[0] % 2 != 0) or (self.image_shape[1] % 2 != 0):
+            warnings.warn(
+                "Reconstruction will not be perfect with odd-sized images")
         # cache constants
         self.lutsize = 1024
         self.Xcosn = np.pi * \
@@ -119,6 +403,21 @@ class Steerable_Pyramid_Freq(nn.Module):
                 "order must be an integer in the range [1,15]. Truncating.")
             self.order = min(max(self.order, 1), 15)
         self.num_orientations = int(self.order + 1)
+        # the oriented filters are (up to these constants) the fourier
+        # transforms of the derivatives of a gaussian
+        self._complex_const = complex(np.power(complex(0, -1), self.order))
+        self._complex_const_recon = complex(np.power(complex(0, 1), self.order))
+
+        const = ((2 ** (2*self.order)) * (factorial(self.order, exact=True)**2) /
+                 float(self.num_orientations * factorial(2*self.order, exact=True)))
+        # angular transition functions, as lookup tables
+        if self.is_complex:
+            self._Ycosn_forward = (2.0 * np.sqrt(const) * (np.cos(self.Xcosn) ** self.order) *
+                                   (np.abs(self.alpha) < np.pi/2.0).astype(int))
+            self._Ycosn_recon = np.sqrt(const) * (np.cos(self.Xcosn))**self.order
+        else:
+            self._Ycosn_forward = np.sqrt(const) * (np.cos(self.Xcosn))**self.order
+            self._Ycosn_recon = self._Ycosn_forward
 
         if twidth <= 0:
             warnings.warn("twidth must be positive. Setting to 1.")
@@ -126,17 +425,13 @@ class Steerable_Pyramid_Freq(nn.Module):
         twidth = int(twidth)
 
         dims = np.array(self.image_shape)
-
-        # make a grid for the raised cosine interpolation
-        ctr = np.ceil((np.array(dims)+0.5)/2).astype(int)
-
-        (xramp, yramp) = np.meshgrid(np.linspace(-1, 1, dims[1]+1)[:-1],
-                                     np.linspace(-1, 1, dims[0]+1)[:-1])
-
-        self.angle = np.arctan2(yramp, xramp)
-        log_rad = np.sqrt(xramp**2 + yramp**2)
-        log_rad[ctr[0]-1, ctr[1]-1] = log_rad[ctr[0]-1, ctr[1]-2]
-        self.log_rad = np.log2(log_rad)
+        # frequencies of the rows and columns of the (centered) spectrum,
+        # normalized so that the Nyquist frequency is 1
+        ramps = (np.linspace(-1, 1, dims[0]+1)[:-1], np.linspace(-1, 1, dims[1]+1)[:-1])
+        # the zero frequency is given the radius of its neighbor when
+        # building the masks, so the log is finite
+        ctr = np.ceil((dims+0.5)/2).astype(int)
+        self._ctr_rad = float(np.sqrt(ramps[0][ctr[0]-1]**2 + ramps[1][ctr[1]-2]**2))
 
         # radial transition function (a raised cosine in log-frequency):
         self.Xrcos, Yrcos = raised_cosine(twidth, (-twidth/2.0), np.array([0, 1]))
@@ -144,145 +439,537 @@ class Steerable_Pyramid_Freq(nn.Module):
 
         self.YIrcos = np.sqrt(1.0 - self.Yrcos**2)
 
-        # create low and high masks
-        lo0mask = interpolate1d(self.log_rad, self.YIrcos, self.Xrcos)
-        hi0mask = interpolate1d(self.log_rad, self.Yrcos, self.Xrcos)
-        self.lo0mask = torch.tensor(lo0mask).unsqueeze(0)
-        self.hi0mask = torch.tensor(hi0mask).unsqueeze(0)
-
-        # pre-generate the angle, hi and lo masks, as well as the
-        # indices used for down-sampling
-        self._anglemasks = []
-        self._anglemasks_recon = []
-        self._himasks = []
-        self._lomasks = []
-        self._loindices = []
-
-        # need a mock image to down-sample so that we correctly
-        # construct the differently-sized masks
-        mock_image = np.random.rand(*self.image_shape)
-        imdft = np.fft.fftshift(np.fft.fft2(mock_image))
-        lodft = imdft * lo0mask
-
         # this list, used by coarse-to-fine optimization, gives all the
         # scales (including residuals) from coarse to fine
         self.scales = (['residual_lowpass'] + list(range(self.num_scales))[::-1] +
                        ['residual_highpass'])
 
-        # we create these copies because they will be modified in the
-        # following loops
-        Xrcos = self.Xrcos.copy()
-        angle = self.angle.copy()
-        log_rad = self.log_rad.copy()
+        # pre-generate the indices used for down-sampling
+        self._loindices = []
+        cumrows = np.arange(dims[0])
+        cumcols = np.arange(dims[1] // 2 + 1 if self.use_rfft else dims[1])
+        # frequencies of the rows and columns of the spectrum at each scale
+        self._ramps = [ramps]
+        # spatial shape of the coefficients at each scale (and, in the
+        # last entry, of the residual lowpass). needed to invert rffts
+        self._scale_shapes = [tuple(int(d) for d in self.image_shape)]
         for i in range(self.num_scales):
-            Xrcos -= np.log2(2)
-            const = ((2 ** (2*self.order)) * (factorial(self.order, exact=True)**2) /
-                     float(self.num_orientations * factorial(2*self.order, exact=True)))
-
-            if self.is_complex:
-                Ycosn_forward = (2.0 * np.sqrt(const) * (np.cos(self.Xcosn) ** self.order) *
-                                 (np.abs(self.alpha) < np.pi/2.0).astype(int))
-                Ycosn_recon = np.sqrt(const) * (np.cos(self.Xcosn))**self.order
-
-            else:
-                Ycosn_forward = np.sqrt(
-                    const) * (np.cos(self.Xcosn))**self.order
-                Ycosn_recon = Ycosn_forward
-
-            himask = interpolate1d(log_rad, self.Yrcos, Xrcos)
-            self._himasks.append(torch.tensor(himask).unsqueeze(0))
-
-            anglemasks = []
-            anglemasks_recon = []
-            for b in range(self.num_orientations):
-                anglemask = interpolate1d(angle, Ycosn_forward,
-                                    self.Xcosn + np.pi*b/self.num_orientations)
-                anglemask_recon = interpolate1d(
-                    angle, Ycosn_recon, self.Xcosn + np.pi*b/self.num_orientations)
-                anglemasks.append(torch.tensor(anglemask).unsqueeze(0))
-                anglemasks_recon.append(torch.tensor(anglemask_recon).unsqueeze(0))
-
-            self._anglemasks.append(anglemasks)
-            self._anglemasks_recon.append(anglemasks_recon)
             if not self.downsample:
-                lomask = interpolate1d(log_rad, self.YIrcos, Xrcos)
-                self._lomasks.append(torch.tensor(lomask).unsqueeze(0))
                 self._loindices.append([np.array([0, 0]), dims])
-                lodft = lodft * lomask
-
+                self._ramps.append(ramps)
+                self._scale_shapes.append(self._scale_shapes[0])
             else:
                 # subsample lowpass
-                dims = np.array([lodft.shape[0], lodft.shape[1]])
                 ctr = np.ceil((dims+0.5)/2).astype(int)
                 lodims = np.ceil((dims-0.5)/2).astype(int)
                 loctr = np.ceil((lodims+0.5)/2).astype(int)
                 lostart = ctr - loctr
                 loend = lostart + lodims
                 self._loindices.append([lostart, loend])
+                ramps = (ramps[0][lostart[0]:loend[0]], ramps[1][lostart[1]:loend[1]])
+                self._ramps.append(ramps)
+                self._scale_shapes.append(tuple(int(d) for d in lodims))
+                # the spectra are stored unshifted, so the centered crop
+                # [lostart, loend) corresponds to gathering the lowest
+                # frequencies (positive then negative) along each dimension
+                lorows = _unshifted_crop_indices(dims[0], lodims[0])
+                if self.use_rfft:
+                    # the half-spectrum columns start at the zero frequency
+                    locols = np.arange(lodims[1] // 2 + 1)
+                else:
+                    locols = _unshifted_crop_indices(dims[1], lodims[1])
+                self.register_buffer(f'_lorows_{i}', torch.as_tensor(lorows), persistent=False)
+                self.register_buffer(f'_locols_{i}', torch.as_tensor(locols), persistent=False)
+                # indices of the full-resolution spectrum kept for scale
+                # i+1, so that we can crop it to any scale in one go
+                cumrows, cumcols = cumrows[lorows], cumcols[locols]
+                self.register_buffer(f'_cumrows_{i+1}', torch.as_tensor(cumrows), persistent=False)
+                self.register_buffer(f'_cumcols_{i+1}', torch.as_tensor(cumcols), persistent=False)
+                dims = lodims
+        # store them in the unshifted layout of the spectrum returned by fft2.
+        # with fftshift's convention, the zero frequency is then the first one
+        self._ramps = [tuple(torch.as_tensor(np.fft.ifftshift(r)) for r in ramps)
+                       for ramps in self._ramps]
+
+        # the shapes of the coefficients only depend on the image shape,
+        # so we compute them once here instead of on every forward call
+        self.pyr_size['residual_highpass'] = self._scale_shapes[0]
+        for i in range(self.num_scales):
+            for b in range(self.num_orientations):
+                self.pyr_size[(i, b)] = self._scale_shapes[i]
+        self.pyr_size['residual_lowpass'] = self._scale_shapes[-1]
+
+        # the masks only depend on the arguments in this key (and on their
+        # dtype and device, which are part of the cache keys), so pyramids
+        # with the same key share them (see _share_masks)
+        self._mask_key = (tuple(self.image_shape), self.num_scales, self.order, twidth,
+                          self.is_complex, self.downsample, self.tight_frame,
+                          self.fft_norm, self.use_rfft)
+        # the masks are only built when first used (see __getattr__), with
+        # the dtype and device of this (empty) tensor, which to() and
+        # friends move around like any other buffer. reasonable default
+        # dtype
+        self.register_buffer('_dtype_ref', torch.empty(0, dtype=torch.float32), persistent=False)
+        self._mask_scale = {name: scale for scale in self._mask_groups()
+                            for name in _mask_names(scale)}
+
+    def __getattr__(self, name):
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            # masks are built lazily, the first time they're needed
+            scale = self.__dict__.get('_mask_scale', {}).get(name)
+            if scale is None:
+                raise
+            dtype, device = self._dtype_ref.dtype, self._dtype_ref.device
+            if _is_compiling():
+                # we can't add buffers while tracing, so the masks get
+                # built inside the graph. to avoid that, call the pyramid
+                # once before compiling it
+                return self._build_masks(scale, dtype, device)[name]
+            masks = _mask_cache_get(self._mask_key, dtype, device, _mask_names(scale))
+            if masks is None:
+                masks = self._build_masks(scale, dtype, device)
+                _mask_cache_set(self._mask_key, masks)
+            # not using register_buffer, which would call __getattr__ again
+            for k, v in masks.items():
+                self._buffers[k] = v
+                self._non_persistent_buffers_set.add(k)
+            return masks[name]
+
+    def _init_polymorphic(self, height, twidth, max_shapes, max_mask_bytes):
+        r"""Set up a pyramid that accepts inputs of any shape. Called by ``__init__``"""
+        if self.order > 15 or self.order <= 0:
+            warnings.warn(
+                "order must be an integer in the range [1,15]. Truncating.")
+            self.order = min(max(self.order, 1), 15)
+        self.num_orientations = int(self.order + 1)
+        # with height='auto', the number of scales depends on the shape
+        self.num_scales = None if height == 'auto' else int(height)
+        if self.num_scales is not None:
+            self.scales = (['residual_lowpass'] + list(range(self.num_scales))[::-1] +
+                           ['residual_highpass'])
+        else:
+            self.scales = None
+        self.max_shapes = max_shapes
+        self.max_mask_bytes = max_mask_bytes
+        self._shape_kwargs = dict(height=height, order=self.order, twidth=twidth,
+                                  is_complex=self.is_complex, downsample=self.downsample,
+                                  tight_frame=self.tight_frame, use_rfft=self.use_rfft,
+                                  adjoint_backward=self.adjoint_backward)
+        # the pyramid of each shape, from least to most recently used
+        self._shape_pyrs = OrderedDict()
+        self.register_buffer('_dtype_ref', torch.empty(0, dtype=torch.float32), persistent=False)
+
+    def _pyr_for_shape(self, shape):
+        r"""Get the pyramid for inputs of ``shape``, creating it if needed
+
+        Only used if ``image_shape`` is None.
 
-                # subsample indices
-                log_rad = log_rad[lostart[0]:loend[0], lostart[1]:loend[1]]
-                angle = angle[lostart[0]:loend[0], lostart[1]:loend[1]]
+        """
+        shape = tuple(int(d) for d in shape)
+        pyr = self._shape_pyrs.pop(shape, None)
+        if pyr is None:
+            pyr = Steerable_Pyramid_Freq(shape, **self._shape_kwargs)
+            pyr.to(self._dtype_ref.device, self._dtype_ref.dtype)
+        self._shape_pyrs[shape] = pyr
+        return pyr
+
+    def _evict_shapes(self):
+        r"""Drop the least recently used pyramids until we're within the cache's limits
 
-                lomask = interpolate1d(log_rad, self.YIrcos, Xrcos)
-                self._lomasks.append(torch.tensor(lomask).unsqueeze(0))
-                # subsampling
-                lodft = lodft[lostart[0]:loend[0], lostart[1]:loend[1]]
-                # convolution in spatial domain
-                lodft = lodft * lomask
+        The masks are built when first used, so this is called after using
+        the pyramid of a shape. Masks shared by several pyramids (see
+        ``_share_masks``) are only counted once.
 
-        # reasonable default dtype
-        self = self.to(torch.float32)
+        """
+        def mask_bytes():
+            masks = {id(m): m for pyr in self._shape_pyrs.values() for m in pyr._buffers.values()}
+            return sum(m.numel() * m.element_size() for m in masks.values())
 
-    def to(self, *args, **kwargs):
-        r"""Moves and/or casts the parameters and buffers.
+        while len(self._shape_pyrs) > max(self.max_shapes, 1):
+            self._shape_pyrs.popitem(last=False)
+        if self.max_mask_bytes is not None:
+            while len(self._shape_pyrs) > 1 and mask_bytes() > self.max_mask_bytes:
+                self._shape_pyrs.popitem(last=False)
 
-        This can be called as
+    def _mask_groups(self):
+        r"""All the groups of masks that can be built (see ``_mask_names``)"""
+        return ['residual', *range(self.num_scales),
+                *[('lopass', i) for i in range(1, self.num_scales+1)]]
 
-        .. function:: to(device=None, dtype=None, non_blocking=False)
+    def _grid(self, scale, device):
+        r"""Compute the log-radius and angle of the frequencies at ``scale``
 
-        .. function:: to(dtype, non_blocking=False)
+        Returns tensors in the unshifted layout returned by ``fft2``, with
+        the frequencies normalized so that the Nyquist frequency of the
+        input image is 1. ``scale=self.num_scales`` gives those of the
+        residual lowpass.
+
+        """
+        yramp, xramp = (r.to(device) for r in self._ramps[scale])
+        yramp = yramp.unsqueeze(-1)
+        angle = torch.atan2(yramp, xramp)
+        rad = (yramp**2 + xramp**2).sqrt()
+        rad[0, 0] = self._ctr_rad
+        return rad.log2(), angle
+
+    def _build_masks(self, scale, dtype=torch.float32, device=torch.device('cpu')):
+        r"""Construct the masks used to compute the pyramid at ``scale``
+
+        The masks are computed in float64 on ``device``, by interpolating
+        the lookup tables of the radial and angular transition functions
+        on the log-radius and angle of each frequency.
+
+        Parameters
+        ----------
+        scale : `int`, `'residual'` or `('lopass', int)`
+            Which scale to build the masks for (see ``_mask_names``)
+        dtype : torch.dtype
+            dtype of the masks
+        device : torch.device
+            device to build the masks on
 
-        .. function:: to(tensor, non_blocking=False)
+        Returns
+        -------
+        masks : `OrderedDict`
+            The masks, in the unshifted layout of the spectrum returned by
+            ``fft2`` (or ``rfft2``, if ``use_rfft``). Keys are
+            ``'lo0mask'`` and ``'hi0mask'`` for ``scale='residual'`` and
+            ``'_himask_i'``, ``'_lomask_i'``, ``'_anglemask_i'`` and
+            ``'_anglemask_recon_i'`` for an int, ``'_lopass_i'`` for
+            ``('lopass', i)``. The angle masks of a scale
+            are stacked into a single ``[num_orientations, H, W]`` tensor,
+            so that all bands of a scale can be computed with one broadcast
+            multiply and one batched ifft.
 
-        Its signature is similar to :meth:`torch.Tensor.to`, but only accepts
-        floating point desired :attr:`dtype` s. In addition, this method will
-        only cast the floating point parameters and buffers to :attr:`dtype`
-        (if given). The integral parameters and buffers will be moved
-        :attr:`device`, if that is given, but with dtypes unchanged. When
-        :attr:`non_blocking` is set, it tries to convert/move asynchronously
-        with respect to the host if possible, e.g., moving CPU Tensors with
-        pinned memory to CUDA devices.
+        """
+        masks = OrderedDict()
+        if scale == 'residual':
+            log_rad, _ = self._grid(0, device)
+            masks['lo0mask'] = interpolate1d(log_rad, self.YIrcos, self.Xrcos).unsqueeze(0)
+            masks['hi0mask'] = interpolate1d(log_rad, self.Yrcos, self.Xrcos).unsqueeze(0)
+        elif isinstance(scale, tuple):
+            # the product of lo0mask and the lowpass masks of all the scales
+            # above scale[1], cropped like the spectrum is, so that forward
+            # can go straight from the image to that scale
+            return OrderedDict([(f'_lopass_{scale[1]}', self._build_lopass(scale[1], dtype, device))])
+        else:
+            log_rad, angle = self._grid(scale, device)
+            # each scale is an octave lower than the previous one
+            Xrcos = self.Xrcos - (scale + 1)
+            masks[f'_himask_{scale}'] = interpolate1d(log_rad, self.Yrcos, Xrcos).unsqueeze(0)
 
-        See below for examples.
+            anglemasks = []
+            anglemasks_recon = []
+            for b in range(self.num_orientations):
+                Xcosn = self.Xcosn + np.pi*b/self.num_orientations
+                anglemasks.append(interpolate1d(angle, self._Ycosn_forward, Xcosn))
+                if self.is_complex:
+                    anglemasks_recon.append(interpolate1d(angle, self._Ycosn_recon, Xcosn))
+            masks[f'_anglemask_{scale}'] = torch.stack(anglemasks)
+            if self.is_complex:
+                masks[f'_anglemask_recon_{scale}'] = torch.stack(anglemasks_recon)
+            else:
+                # the real pyramid uses the same masks for both directions
+                masks[f'_anglemask_recon_{scale}'] = masks[f'_anglemask_{scale}']
+
+            if self.downsample:
+                log_rad, _ = self._grid(scale+1, device)
+            masks[f'_lomask_{scale}'] = interpolate1d(log_rad, self.YIrcos, Xrcos).unsqueeze(0)
+
+        if self.use_rfft:
+            # only keep the half of the symmetrized masks that rfft2 needs. the
+            # angle masks are multiplied by (-1j)**order, so they get the
+            # parity of the order
+            parity = (-1) ** self.order
+            for k, v in masks.items():
+                masks[k] = _half_spectrum(v, parity if k.startswith('_anglemask') else 1)
+
+        # masks that are the same tensor should remain so after the conversion
+        converted = {}
+        for v in masks.values():
+            converted.setdefault(id(v), v.to(dtype))
+        return OrderedDict((k, converted[id(masks[k])]) for k in _mask_names(scale))
+
+    def _build_lopass(self, scale, dtype=torch.float32, device=torch.device('cpu')):
+        r"""Construct the mask of the lowpass component that's the input of ``scale``
+
+        That is, the product of ``lo0mask`` and of the ``_lomask`` of
+        every finer scale, computed in float64. With ``downsample``, it's
+        cropped to the shape of ``scale``, as ``_cumrows`` and ``_cumcols``
+        crop the spectrum of the image. Unlike ``_build_masks`` for an
+        int scale, this doesn't compute the angle masks of the finer
+        scales.
 
-        .. note::
-            This method modifies the module in-place.
-        Args:
-            device (:class:`torch.device`): the desired device of the parameters
-                and buffers in this module
-            dtype (:class:`torch.dtype`): the desired floating point type of
-                the floating point parameters and buffers in this module
-            tensor (torch.Tensor): Tensor whose dtype and device are the desired
-                dtype and device for all parameters and buffers in this module
+        """
+        def half(mask):
+            return _half_spectrum(mask) if self.use_rfft else mask
+
+        log_rad, _ = self._grid(0, device)
+        lopass = half(interpolate1d(log_rad, self.YIrcos, self.Xrcos).unsqueeze(0))
+        for i in range(scale):
+            Xrcos = self.Xrcos - (i + 1)
+            if self.downsample:
+                rows, cols = (idx.to(device) for idx in self._lo_indices(i))
+                lopass = lopass[..., rows, cols]
+                log_rad, _ = self._grid(i+1, device)
+            lopass = lopass * half(interpolate1d(log_rad, self.YIrcos, Xrcos).unsqueeze(0))
+            if not self.downsample and self.fft_norm != "ortho":
+                # see forward
+                lopass = 2 * lopass
+        return lopass.to(dtype)
+
+    @property
+    def _himasks(self):
+        return [getattr(self, f'_himask_{i}') for i in range(self.num_scales)]
+
+    @property
+    def _lomasks(self):
+        return [getattr(self, f'_lomask_{i}') for i in range(self.num_scales)]
+
+    @property
+    def _anglemasks(self):
+        return [getattr(self, f'_anglemask_{i}') for i in range(self.num_scales)]
+
+    @property
+    def _anglemasks_recon(self):
+        return [getattr(self, f'_anglemask_recon_{i}') for i in range(self.num_scales)]
+
+    def _share_masks(self):
+        r"""Replace our masks with identical ones already held by other pyramids
+
+        The masks are never modified, so all pyramids with the same
+        ``_mask_key``, dtype and device can use the same tensors.
 
-        Returns:
-            Module: self
         """
-        self.lo0mask = self.lo0mask.to(*args, **kwargs)
-        self.hi0mask = self.hi0mask.to(*args, **kwargs)
-        self._himasks = [m.to(*args, **kwargs) for m in self._himasks]
-        self._lomasks = [m.to(*args, **kwargs) for m in self._lomasks]
-        angles = []
-        angles_recon = []
-        for a, ar in zip(self._anglemasks, self._anglemasks_recon):
-            angles.append([m.to(*args, **kwargs) for m in a])
-            angles_recon.append([m.to(*args, **kwargs) for m in ar])
-        self._anglemasks = angles
-        self._anglemasks_recon = angles_recon
+        dtype, device = self._dtype_ref.dtype, self._dtype_ref.device
+        for scale in self._mask_groups():
+            names = _mask_names(scale)
+            if names[0] not in self._buffers:
+                # not built yet
+                continue
+            masks = _mask_cache_get(self._mask_key, dtype, device, names)
+            if masks is None:
+                _mask_cache_set(self._mask_key, OrderedDict(
+                    (name, self._buffers[name]) for name in names))
+            else:
+                for name, mask in masks.items():
+                    self._buffers[name] = mask
+
+    def _apply(self, fn, *args, **kwargs):
+        # called by to(), cuda(), double(), etc.
+        super()._apply(fn, *args, **kwargs)
+        if self._shape_pyrs is not None:
+            for pyr in self._shape_pyrs.values():
+                pyr._apply(fn, *args, **kwargs)
+            return self
+        self._share_masks()
         return self
 
-    def forward(self, x, scales=[]):
+    def __deepcopy__(self, memo):
+        # the masks are constant, so copies can share them with the original
+        for mask in self._buffers.values():
+            memo[id(mask)] = mask
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        for k, v in self.__dict__.items():
+            new.__dict__[k] = copy.deepcopy(v, memo)
+        return new
+
+    def _fft2(self, x):
+        r"""Compute the 2d fft of the last two dimensions of ``x``
+
+        If ``self.use_rfft``, this only contains the non-negative frequencies
+        of the last dimension. The spectrum is not shifted: the masks are
+        stored in the same layout.
+
+        """
+        if self.use_rfft:
+            return fft.rfft2(x, dim=(-2, -1), norm=self.fft_norm)
+        return fft.fft2(x, dim=(-2, -1), norm=self.fft_norm)
+
+    def _ifft2(self, xdft, shape):
+        r"""Invert ``_fft2``, returning a signal with spatial shape ``shape``
+
+        The output is real if ``self.use_rfft``, complex otherwise.
+
+        """
+        if self.use_rfft:
+            return fft.irfft2(xdft, s=tuple(shape), dim=(-2, -1), norm=self.fft_norm)
+        return fft.ifft2(xdft, dim=(-2, -1), norm=self.fft_norm)
+
+    def _lo_indices(self, scale):
+        r"""Get the indices of the spectrum at ``scale`` kept for the next (downsampled) scale
+
+        Returns index tensors for the rows and columns, shaped so that
+        ``dft[..., rows, cols]`` gathers the cropped spectrum.
+
+        """
+        rows = getattr(self, f'_lorows_{scale}')
+        cols = getattr(self, f'_locols_{scale}')
+        return rows.unsqueeze(-1), cols
+
+    def _lowpass_from_image(self, imdft, scale):
+        r"""Get the dft of the input of ``scale`` from the dft of the image
+
+        With ``scale=0``, this is the lowpass residual. Otherwise, the
+        spectrum is cropped directly to the shape of ``scale`` and
+        multiplied by the product of all the lowpass masks above it, which
+        gives the same result as going through all those scales in turn
+        (see ``_lowpass_step``) at a fraction of the cost.
+
+        """
+        if scale == 0:
+            return imdft * self.lo0mask
+        lopass = getattr(self, f'_lopass_{scale}')
+        if self.downsample:
+            rows = getattr(self, f'_cumrows_{scale}')
+            cols = getattr(self, f'_cumcols_{scale}')
+            imdft = imdft[..., rows.unsqueeze(-1), cols]
+        return imdft * lopass
+
+    def _lowpass_step(self, lodft, scale):
+        r"""Get the dft of the input of ``scale+1`` from that of the input of ``scale``"""
+        if not self.downsample:
+            # no subsampling of angle and rad
+            # just use lo0mask
+            lomask = getattr(self, f'_lomask_{scale}')
+            lodft = lodft * lomask
+
+            # because we don't subsample here, if we are not using orthonormalization that
+            # we need to manually account for the subsampling, so that energy in each band remains the same
+            # the energy is cut by factor of 4 so we need to scale magnitudes by factor of 2
+
+            if self.fft_norm != "ortho":
+                lodft = 2*lodft
+        else:
+            # subsampling of the dft for next scale
+            lodft = lodft[(..., *self._lo_indices(scale))]
+            # low-pass filter mask is selected
+            lomask = getattr(self, f'_lomask_{scale}')
+            # again multiply dft by subsampled mask (convolution in spatial domain)
+
+            lodft = lodft * lomask
+        return lodft
+
+    def _dft_shape(self, scale):
+        r"""Get the shape of the dft of the input of ``scale``, as returned by ``_fft2``"""
+        shape = self._scale_shapes[scale]
+        if self.use_rfft:
+            return (shape[0], shape[1]//2+1)
+        return tuple(shape)
+
+    def _fft2_adjoint(self, xdft, shape):
+        r"""Apply the adjoint of ``_fft2`` (for real inputs of spatial shape ``shape``)"""
+        norm = _ADJOINT_NORM[self.fft_norm]
+        if self.use_rfft:
+            # the negative frequencies of the last dimension are implicit
+            # in the output of rfft2, so their gradient is split between
+            # them and their positive counterparts
+            xdft = xdft * _rfft_column_weights(shape[-1], .5, xdft)
+            return fft.irfft2(xdft, s=tuple(shape), dim=(-2, -1), norm=norm)
+        return fft.ifft2(xdft, dim=(-2, -1), norm=norm).real
+
+    def _ifft2_adjoint(self, x):
+        r"""Apply the adjoint of ``_ifft2`` (followed, for real pyramids, by taking the real part)"""
+        norm = _ADJOINT_NORM[self.fft_norm]
+        if self.use_rfft:
+            # irfft2 uses the positive frequencies of the last dimension
+            # twice, for themselves and their negative counterparts
+            xdft = fft.rfft2(x, dim=(-2, -1), norm=norm)
+            return xdft * _rfft_column_weights(x.shape[-1], 2, xdft)
+        return fft.fft2(x, dim=(-2, -1), norm=norm)
+
+    def _lowpass_from_image_adjoint(self, lograd, scale):
+        r"""Apply the adjoint of ``_lowpass_from_image``"""
+        if scale == 0:
+            return lograd * self.lo0mask
+        lograd = lograd * getattr(self, f'_lopass_{scale}')
+        if self.downsample:
+            rows = getattr(self, f'_cumrows_{scale}')
+            cols = getattr(self, f'_cumcols_{scale}')
+            imgrad = lograd.new_zeros((*lograd.shape[:-2], *self._dft_shape(0)))
+            imgrad[..., rows.unsqueeze(-1), cols] = lograd
+            lograd = imgrad
+        return lograd
+
+    def _lowpass_step_adjoint(self, lograd, scale):
+        r"""Apply the adjoint of ``_lowpass_step``"""
+        lograd = lograd * getattr(self, f'_lomask_{scale}')
+        if not self.downsample:
+            if self.fft_norm != "ortho":
+                lograd = 2*lograd
+            return lograd
+        resgrad = lograd.new_zeros((*lograd.shape[:-2], *self._dft_shape(scale)))
+        resgrad[(..., *self._lo_indices(scale))] = lograd
+        return resgrad
+
+    def _adjoint(self, grads, scales, shape):
+        r"""Apply the adjoint of forward to the gradients of the coefficients
+
+        The pyramid transform is linear, so this gives the gradient of the
+        image. It goes through the steps of forward in reverse order, much
+        like ``_recon_levels``, but using the masks of the analysis
+        filters.
+
+        Parameters
+        ----------
+        grads : `dict`
+            Gradients of the coefficients computed by forward for
+            ``scales``. Those of coefficients that didn't contribute to the
+            loss can be missing or None.
+        scales : `list`
+            The ``scales`` argument of forward.
+        shape : `tuple`
+            The spatial shape of the image.
+
+        Returns
+        -------
+        imgrad : `torch.Tensor` or None
+            The gradient of the image, or None if all of ``grads`` are None.
+
+        """
+        def add(total, term):
+            return term if total is None else total + term
+
+        imdft_grad = None
+        grad = grads.get('residual_highpass')
+        if grad is not None:
+            imdft_grad = self._ifft2_adjoint(grad) * self.hi0mask
+
+        lograd = None
+        for i, from_prev in reversed(self._scale_plan(scales)):
+            if i == self.num_scales:
+                grad = grads.get('residual_lowpass')
+                if grad is not None:
+                    lograd = self._ifft2_adjoint(grad)
+            else:
+                bandgrads = [grads.get((i, b)) for b in range(self.num_orientations)]
+                ref = next((g for g in bandgrads if g is not None), None)
+                if ref is not None:
+                    bandgrad = torch.stack([torch.zeros_like(ref) if g is None else g
+                                            for g in bandgrads], dim=-3)
+                    if self.is_complex and self.tight_frame:
+                        bandgrad = bandgrad/np.sqrt(2)
+                    banddft = self._ifft2_adjoint(bandgrad)
+                    himask = getattr(self, f'_himask_{i}')
+                    anglemasks = getattr(self, f'_anglemask_{i}')
+                    banddft = np.conj(self._complex_const) * banddft * anglemasks * himask
+                    lograd = add(lograd, banddft.sum(-3))
+            if lograd is None:
+                continue
+            if from_prev:
+                lograd = self._lowpass_step_adjoint(lograd, i-1)
+            else:
+                imdft_grad = add(imdft_grad, self._lowpass_from_image_adjoint(lograd, i))
+                lograd = None
+
+        if imdft_grad is None:
+            return None
+        return self._fft2_adjoint(imdft_grad, shape)
+
+    def forward(self, x, scales=[], packed=False, chunk_size=None):
         r"""Generate the steerable pyramid coefficients for an image
 
         Parameters
@@ -290,7 +977,10 @@ class Steerable_Pyramid_Freq(nn.Module):
         x : torch.Tensor
             A tensor containing the image to analyze. We want to operate
             on this in the pytorch-y way, so we want it to be 4d (batch,
-            channel, height, width).
+            channel, height, width). Videos can be passed as 5d tensors
+            (batch, channel, time, height, width): all frames are
+            transformed at once, with the same masks, and the
+            coefficients keep the time dimension.
         scales : list, optional
             Which scales to include in the returned representation. If
             an empty list (the default), we include all
@@ -299,11 +989,24 @@ class Steerable_Pyramid_Freq(nn.Module):
             ``self.num_scales-1`` and the strs 'residual_highpass' and
             'residual_lowpass'. Can contain a single value or multiple
             values. If it's an int, we include all orientations from
-            that scale. Order within the list does not matter.
+            that scale. Order within the list does not matter. Only the
+            requested scales are computed: the spectrum of the image is
+            cropped straight to the finest of them, so that asking for
+            the coarse scales only is much cheaper than the full pyramid.
+        packed : bool, optional
+            If True, return the coefficients as a ``PackedPyramid``, which
+            stores all of them in a single contiguous tensor.
+        chunk_size : int or None, optional
+            For 5d inputs, the number of frames to transform at once. The
+            intermediate (complex) spectra of all frames can take up much
+            more memory than the coefficients, so long videos can be
+            transformed in chunks of frames, which are written into the
+            preallocated coefficients. If None, all frames are transformed
+            at once.
 
         Returns
         -------
-        representation: torch.Tensor or OrderedDict
+        representation: torch.Tensor, OrderedDict or PackedPyramid
             if the not downsampled version is used, representation is returned
             as a torch tensor with each band as a channel in BxCxHxW. The order
             of the channels is the same order as the keys in the pyr_coeffs dictonary.
@@ -313,7 +1016,14 @@ class Steerable_Pyramid_Freq(nn.Module):
             If downsample is true, representation is an OrderedDict of the coefficients.
 
         """
-        pyr_coeffs = OrderedDict()
+        if self._shape_pyrs is not None:
+            pyr = self._pyr_for_shape(x.shape[-2:])
+            pyr.adjoint_backward = self.adjoint_backward
+            pyr_coeffs = pyr.forward(x, scales, packed, chunk_size)
+            self._evict_shapes()
+            return pyr_coeffs
+        if chunk_size is not None and x.ndim == 5 and x.shape[2] > chunk_size:
+            return self._forward_chunked(x, scales, packed, chunk_size)
         if not isinstance(scales, list):
             raise Exception("scales must be a list!")
         if not scales:
@@ -322,101 +1032,149 @@ class Steerable_Pyramid_Freq(nn.Module):
         if len(scale_ints) != 0:
             assert (max(scale_ints) < self.num_scales) and (
                 min(scale_ints) >= 0), "Scales must be within 0 and num_scales-1"
-        angle = self.angle.copy()
-        log_rad = self.log_rad.copy()
-        lo0mask = self.lo0mask.clone()
-        hi0mask = self.hi0mask.clone()
+        # x is a torch tensor batch of images of size [N,C,W,H], or of
+        # videos of size [N,C,T,W,H]. everything below only deals with the
+        # last two dimensions
+        assert len(x.shape) in [4, 5], ("Input must be batch of images of shape BxCxHxW "
+                                        "or of videos of shape BxCxTxHxW")
+        if packed:
+            pyr_coeffs = self._packed_pyramid(x, scales)
+        else:
+            pyr_coeffs = OrderedDict()
+        if self.adjoint_backward and torch.is_grad_enabled() and x.requires_grad:
+            coeffs = _AdjointPyramid.apply(self, tuple(scales), x)
+            for k, v in zip(self._coeff_keys(scales), coeffs):
+                pyr_coeffs[k] = v
+            return pyr_coeffs
+        return self._forward(x, scales, pyr_coeffs)
+
+    def _coeff_keys(self, scales):
+        r"""Get the keys of the coefficients that forward computes for ``scales``, in order"""
+        keys = ['residual_highpass'] if 'residual_highpass' in scales else []
+        for i, _ in self._scale_plan(scales):
+            if i < self.num_scales:
+                keys.extend([(i, b) for b in range(self.num_orientations)])
+        if 'residual_lowpass' in scales:
+            keys.append('residual_lowpass')
+        return keys
 
-        # x is a torch tensor batch of images of size [N,C,W,H]
-        assert len(x.shape) == 4, "Input must be batch of images of shape BxCxHxW"
-        
-        imdft = fft.fft2(x, dim=(-2,-1), norm = self.fft_norm)
-        imdft = fft.fftshift(imdft)
+    def _scale_plan(self, scales):
+        r"""Get the scales whose input forward computes for ``scales``, and how
+
+        Returns a list of ``(scale, from_prev)`` tuples, from fine to
+        coarse, where the input of scale ``num_scales`` is the lowpass
+        residual. If ``from_prev``, the input is computed from that of the
+        previous scale (see ``_lowpass_step``), otherwise straight from the
+        dft of the image (see ``_lowpass_from_image``).
+
+        """
+        needed = sorted(set(s for s in scales if isinstance(s, int)))
+        if 'residual_lowpass' in scales:
+            needed.append(self.num_scales)
+        return [(i, j > 0 and needed[j-1] == i-1) for j, i in enumerate(needed)]
+
+    def _forward(self, x, scales, pyr_coeffs):
+        r"""Compute the coefficients of ``x`` for ``scales``, writing them into ``pyr_coeffs``
+
+        This is forward without any of the argument handling, and is
+        differentiated by autograd like any other function.
+
+        """
+        imdft = self._fft2(x)
         
         if 'residual_highpass' in scales:
             # high-pass
-            hi0dft = imdft * hi0mask
-            hi0 = fft.ifftshift(hi0dft)
-            hi0 = fft.ifft2(hi0, dim=(-2,-1), norm=self.fft_norm)
+            hi0dft = imdft * self.hi0mask
+            hi0 = self._ifft2(hi0dft, self._scale_shapes[0])
             pyr_coeffs['residual_highpass'] = hi0.real
-            self.pyr_size['residual_highpass'] = tuple(hi0.real.shape[-2:])
 
-        #input to the next scale is the low-pass filtered component
-        lodft = imdft * lo0mask
+        # the scales whose input (the lowpass component of the previous
+        # scale) we need, from fine to coarse. the residual lowpass is the
+        # input of scale num_scales
+        for i, from_prev in self._scale_plan(scales):
+            if from_prev:
+                # input to the next scale is the low-pass filtered component
+                lodft = self._lowpass_step(lodft, i-1)
+            else:
+                # skip the scales in between: crop the spectrum of the image
+                # straight to this scale
+                lodft = self._lowpass_from_image(imdft, i)
+            if i == self.num_scales:
+                break
+
+            #high-pass mask is selected based on the current scale
+            himask = getattr(self, f'_himask_{i}')
+            # anglemasks has shape [num_orientations, H, W]
+            anglemasks = getattr(self, f'_anglemask_{i}')
+
+            # band pass filtering is done in the fourier space as multiplying by the fft of a gaussian derivative.
+            # The oriented dft is computed as a product of the fft of the low-passed component,
+            # the precomputed anglemask (specifies orientation), and the precomputed hipass mask (creating a bandpass filter)
+            # the complex_const variable comes from the Fourier transform of a gaussian derivative.
+            # Based on the order of the gaussian, this constant changes.
+            # All orientations are computed at once: lodft gets a new
+            # orientation dimension, so banddft is BxCxOxHxW (BxCxTxOxHxW
+            # for videos)
+            banddft = self._complex_const * lodft.unsqueeze(-3) * anglemasks * himask
+            # ifft is applied to recover the filtered representation in spatial domain
+            band = self._ifft2(banddft, self._scale_shapes[i])
+
+            #for real pyramid, take the real component of the complex band
+            if not self.is_complex:
+                band = band.real
+            elif self.tight_frame:
+                # Because the input signal is real, to maintain a tight frame
+                # if the complex pyramid is used, magnitudes need to be divided by sqrt(2)
+                # because energy is doubled.
+                band = band/np.sqrt(2)
+            for b in range(self.num_orientations):
+                pyr_coeffs[(i, b)] = band[..., b, :, :]
 
-        for i in range(self.num_scales):
+        if 'residual_lowpass' in scales:
+            # compute residual lowpass when height <=1
+            lo0 = self._ifft2(lodft, self._scale_shapes[-1])
+            pyr_coeffs['residual_lowpass'] = lo0.real
 
-            if i in scales:
-                #high-pass mask is selected based on the current scale
-                himask = self._himasks[i]
-                #compute filter output at each orientation
-                for b in range(self.num_orientations):
-                    
-                    # band pass filtering is done in the fourier space as multiplying by the fft of a gaussian derivative.
-                    # The oriented dft is computed as a product of the fft of the low-passed component,
-                    # the precomputed anglemask (specifies orientation), and the precomputed hipass mask (creating a bandpass filter)
-                    # the complex_const variable comes from the Fourier transform of a gaussian derivative.
-                    # Based on the order of the gaussian, this constant changes.
-                    
-                  
-                    anglemask = self._anglemasks[i][b]
-                    complex_const = np.power(complex(0, -1), self.order)
-                    banddft = complex_const * lodft * anglemask * himask
-                    # fft output is then shifted to center frequencies
-                    band = fft.ifftshift(banddft)
-                    # ifft is applied to recover the filtered representation in spatial domain
-                    band = fft.ifft2(band, dim=(-2,-1), norm=self.fft_norm)
-                    
-                    #for real pyramid, take the real component of the complex band
-                    if not self.is_complex:
-                        pyr_coeffs[(i, b)] = band.real
-                    else:
-                        
-                        # Because the input signal is real, to maintain a tight frame 
-                        # if the complex pyramid is used, magnitudes need to be divided by sqrt(2) 
-                        # because energy is doubled.
-                
-                        if self.tight_frame:
-                            band = band/np.sqrt(2)
-                        pyr_coeffs[(i, b)] = band
-                    self.pyr_size[(i, b)] = tuple(band.shape[-2:])
+        return pyr_coeffs
+    
+    def _forward_chunked(self, x, scales, packed, chunk_size):
+        r"""Compute the coefficients of the video ``x``, ``chunk_size`` frames at a time
 
-            if not self.downsample:
-                # no subsampling of angle and rad
-                # just use lo0mask
-                lomask = self._lomasks[i]
-                lodft = lodft * lomask
-                
-                # because we don't subsample here, if we are not using orthonormalization that
-                # we need to manually account for the subsampling, so that energy in each band remains the same
-                # the energy is cut by factor of 4 so we need to scale magnitudes by factor of 2
-                
-                if self.fft_norm != "ortho":
-                    lodft = 2*lodft
-            else:
-                # subsample indices
-                lostart, loend = self._loindices[i]
+        The coefficients of each chunk are written into those of the whole
+        video, allocated once the shapes are known, so the peak memory is
+        that of the coefficients plus the intermediates of a single chunk.
 
-                log_rad = log_rad[lostart[0]:loend[0], lostart[1]:loend[1]]
-                angle = angle[lostart[0]:loend[0], lostart[1]:loend[1]]
+        """
+        pyr_coeffs = self._packed_pyramid(x, scales or self.scales) if packed else None
+        n_frames = x.shape[2]
+        for t in range(0, n_frames, chunk_size):
+            chunk_coeffs = self.forward(x[:, :, t:t+chunk_size], scales)
+            if pyr_coeffs is None:
+                pyr_coeffs = OrderedDict((k, v.new_empty((*v.shape[:2], n_frames, *v.shape[3:])))
+                                         for k, v in chunk_coeffs.items())
+            for k, v in chunk_coeffs.items():
+                pyr_coeffs[k][:, :, t:t+chunk_size] = v
+        return pyr_coeffs
 
-                # subsampling of the dft for next scale
-                lodft = lodft[:, :, lostart[0]:loend[0], lostart[1]:loend[1]]
-                # low-pass filter mask is selected
-                lomask = self._lomasks[i]
-                # again multiply dft by subsampled mask (convolution in spatial domain)
+    def _packed_pyramid(self, x, scales):
+        r"""Preallocate the ``PackedPyramid`` that forward fills in for input ``x``
 
-                lodft = lodft * lomask
+        The keys are in the same order as those of the ``OrderedDict``
+        returned by forward.
 
+        """
+        band_shapes = OrderedDict()
+        if 'residual_highpass' in scales:
+            band_shapes['residual_highpass'] = self._scale_shapes[0]
+        for i in range(self.num_scales):
+            if i in scales:
+                for b in range(self.num_orientations):
+                    band_shapes[(i, b)] = self._scale_shapes[i]
         if 'residual_lowpass' in scales:
-            # compute residual lowpass when height <=1
-            lo0 = fft.ifftshift(lodft)
-            lo0 = fft.ifft2(lo0, dim=(-2,-1), norm=self.fft_norm)
-            pyr_coeffs['residual_lowpass'] = lo0.real
-            self.pyr_size['residual_lowpass'] = tuple(lo0.real.shape[-2:])
+            band_shapes['residual_lowpass'] = self._scale_shapes[-1]
+        complex_keys = [k for k in band_shapes if self.is_complex and not isinstance(k, str)]
+        return PackedPyramid(band_shapes, complex_keys, x.shape[:-2], x.dtype, x.device)
 
-        return pyr_coeffs
-    
     @staticmethod
     def convert_pyr_to_tensor(pyr_coeffs, split_complex=False):
         r"""
@@ -449,12 +1207,22 @@ class Steerable_Pyramid_Freq(nn.Module):
             in the convert_pyr_to_tensor, and the list of pyramid keys for the dictionary
 
         
-        Note:conversion to tensor only works for pyramids without downsampling of feature maps 
+        Note:conversion to tensor only works for pyramids without downsampling of feature maps.
+        To flatten the coefficients of downsampled pyramids, use ``forward(x, packed=True)`` and
+        ``PackedPyramid.flatten()``. If ``pyr_coeffs`` is a real-valued ``PackedPyramid``, the
+        returned tensor is a view of its buffer.
         """
         
         pyr_keys = tuple(pyr_coeffs.keys())
         test_band = pyr_coeffs[pyr_keys[0]]
         num_channels = test_band.size(1)
+        if isinstance(pyr_coeffs, PackedPyramid) and not pyr_coeffs._complex_keys:
+            # the bands of each channel are already contiguous and in the
+            # right order, so if they're all the same size, this is a view
+            buffer = pyr_coeffs.flatten()
+            if buffer.shape[-1] == len(pyr_keys) * test_band[0, 0].numel():
+                pyr_tensor = buffer.view(buffer.shape[0], -1, *test_band.shape[-2:])
+                return pyr_tensor, tuple([num_channels, split_complex, pyr_keys])
         coeff_list = []
         key_list = []
         for ch in range(num_channels):
@@ -486,7 +1254,8 @@ class Steerable_Pyramid_Freq(nn.Module):
         except RuntimeError as e:
             raise Exception("""feature maps could not be concatenated into tensor. 
             Check that you are using coefficients that are not downsampled across scales. 
-            This is done with the 'downsample=False' argument for the pyramid""")
+            This is done with the 'downsample=False' argument for the pyramid. To flatten
+            downsampled coefficients, use forward(x, packed=True) and PackedPyramid.flatten()""")
             
 
         return pyr_tensor, pyr_info
@@ -535,7 +1304,7 @@ class Steerable_Pyramid_Freq(nn.Module):
                     i += 1
                 else:
                     if split_complex:
-                        band = torch.view_as_complex(rearrange(pyr_tensor[:,i:i+2,...], 'b c h w -> b h w c').unsqueeze(1).contiguous())
+                        band = torch.complex(pyr_tensor[:, i], pyr_tensor[:, i+1]).unsqueeze(1)
                         i += 2
                     else:
                         band = pyr_tensor[:,i,...].unsqueeze(1)
@@ -706,6 +1475,10 @@ class Steerable_Pyramid_Freq(nn.Module):
             Output is of size BxCxHxW
 
         """
+        if self._shape_pyrs is not None:
+            # the residual highpass and the first scale have the shape of the image
+            shape = next(v for k, v in pyr_coeffs.items() if k != 'residual_lowpass').shape[-2:]
+            return self._pyr_for_shape(shape).recon_pyr(pyr_coeffs, levels, bands, twidth)
         # For reconstruction to work, last time we called forward needed
         # to include all levels
         for s in self.scales:
@@ -726,41 +1499,46 @@ class Steerable_Pyramid_Freq(nn.Module):
             twidth = 1
 
         recon_keys = self._recon_keys(levels, bands)
-        scale = 0
 
         # load masks from model
         lo0mask = self.lo0mask
         hi0mask = self.hi0mask
 
-        # Recursively generate the reconstruction - function starts with
-        # fine scales going down to coarse and then the reconstruction
-        # is built recursively from the coarse scale up
-
-        recondft = self._recon_levels(pyr_coeffs, recon_keys, scale)
+        # Iteratively generate the reconstruction, starting from the
+        # coarsest scale and working up to the finest one
+        recondft = self._recon_levels(pyr_coeffs, recon_keys)
 
         # generate highpass residual Reconstruction
         if 'residual_highpass' in recon_keys:
-            hidft = fft.fft2(pyr_coeffs['residual_highpass'], dim=(-2,-1), norm=self.fft_norm)
-            hidft = fft.fftshift(hidft)
-
-            # output dft is the sum of the recondft from the recursive
-            # function times the lomask (low pass component) with the
-            # highpass dft * the highpass mask
-            outdft = recondft * lo0mask + hidft * hi0mask
-        else:
+            hidft = self._fft2(pyr_coeffs['residual_highpass'])
+            outdft = hidft * hi0mask
+            # output dft is the sum of the recondft from the
+            # lower scales times the lomask (low pass component) with
+            # the highpass dft * the highpass mask
+            if recondft is not None:
+                outdft = outdft + recondft * lo0mask
+        elif recondft is not None:
             outdft = recondft * lo0mask
+        else:
+            # nothing to reconstruct from, so the reconstruction is empty
+            return torch.zeros_like(pyr_coeffs['residual_highpass'])
 
         # get output reconstruction by inverting the fft
-        reconstruction = fft.ifftshift(outdft)
-        reconstruction = fft.ifft2(reconstruction, dim=(-2,-1), norm=self.fft_norm)
+        reconstruction = self._ifft2(outdft, self._scale_shapes[0])
 
         # get real part of reconstruction (if complex)
         reconstruction = reconstruction.real
 
         return reconstruction
 
-    def _recon_levels(self, pyr_coeffs, recon_keys, scale):
-        """Recursive function used to build the reconstruction. Called by recon_pyr
+    def _recon_levels(self, pyr_coeffs, recon_keys):
+        """Build the reconstruction of all scales below the highpass. Called by recon_pyr
+
+        We start from the low-pass residual and work up to the finest
+        scale, at each one adding the orientation bands to the upsampled
+        reconstruction of the coarser scales. Only the coefficients in
+        ``recon_keys`` are transformed: scales with nothing to add are
+        skipped, and the result keeps the dtype of ``pyr_coeffs``.
 
         Parameters
         ----------
@@ -769,69 +1547,57 @@ class Steerable_Pyramid_Freq(nn.Module):
             values are 1d or 2d numpy arrays (same number of dimensions as the input image)
         recon_keys : `list of tuples and/or strings`
             list of the keys that index into the pyr_coeffs Dictionary
-        scale : `int`
-            current scale that is being used to build the reconstruction
-            scale is incremented by 1 on each call of the function
 
         Returns
         -------
-        recondft : `torch.Tensor`
-            Current reconstruction based on the orientation band dft from the current scale
-            summed with the output of recursive call with the next scale incremented
+        recondft : `torch.Tensor` or None
+            dft of the reconstruction at the finest scale (only half of
+            it if ``use_rfft``), which still has to be multiplied by
+            ``lo0mask``. None if no coefficients below the highpass are
+            in ``recon_keys``.
 
         """
-        # base case, return the low-pass residual
-        if scale == self.num_scales:
-            if 'residual_lowpass' in recon_keys:
-                lodft = fft.fft2(pyr_coeffs['residual_lowpass'], dim=(-2,-1), norm=self.fft_norm)
-                lodft = fft.fftshift(lodft)
-            else:
-                lodft = fft.fft2(torch.zeros_like(pyr_coeffs['residual_lowpass'], dtype=torch.float64), dim=(-2,-1),
-                                   norm=self.fft_norm)
-
-            return lodft
-
-        # Reconstruct from orientation bands
-        # update himask
-        himask = self._himasks[scale]
-        if self.is_complex:
-            tensor_type = torch.complex64
+        if 'residual_lowpass' in recon_keys:
+            recondft = self._fft2(pyr_coeffs['residual_lowpass'])
         else:
-            tensor_type = torch.float64
-        orientdft = torch.zeros_like(pyr_coeffs[(scale, 0)], dtype=tensor_type)
-
-        for b in range(self.num_orientations):
-            if (scale, b) in recon_keys:
-                anglemask = self._anglemasks_recon[scale][b]
-                coeffs = pyr_coeffs[(scale,b)]
-                if self.tight_frame and self.is_complex:
-                    coeffs = coeffs*np.sqrt(2)
-
-                banddft = fft.fft2(coeffs, dim=(-2,-1), norm=self.fft_norm)
-                banddft = fft.fftshift(banddft)
-
-                complex_const = np.power(complex(0, 1), self.order)
-                banddft = complex_const * banddft * anglemask * himask
-                orientdft = orientdft + banddft
-
-        # get the bounding box indices for the low-pass component
-        lostart, loend = self._loindices[scale]
-
-        # create lowpass mask
-        lomask = self._lomasks[scale]
-        # Recursively reconstruct by going to the next scale
-        reslevdft = self._recon_levels(pyr_coeffs, recon_keys, scale+1)
-        #in not downsampled case, rescale the magnitudes of the reconstructed dft at each level by factor of 2 to account for the scaling in the forward 
-        if (not self.tight_frame) and (not self.downsample):
-            reslevdft = reslevdft/2
-        # create output for reconstruction result
-        resdft = torch.zeros_like(pyr_coeffs[(scale, 0)], dtype=torch.complex64)
-
-        # place upsample and convolve lowpass component
-        resdft[:, :, lostart[0]:loend[0],
-               lostart[1]:loend[1]] = reslevdft*lomask
-        recondft = resdft + orientdft
-        # add orientation interpolated and added images to the lowpass image
+            recondft = None
+
+        for scale in reversed(range(self.num_scales)):
+            if recondft is not None:
+                #in not downsampled case, rescale the magnitudes of the reconstructed dft at each level by factor of 2 to account for the scaling in the forward
+                if (not self.tight_frame) and (not self.downsample):
+                    recondft = recondft/2
+                lomask = getattr(self, f'_lomask_{scale}')
+                if self.downsample:
+                    # place upsample and convolve lowpass component
+                    himask = getattr(self, f'_himask_{scale}')
+                    resdft = recondft.new_zeros((*recondft.shape[:-2], *himask.shape[-2:]))
+                    resdft[(..., *self._lo_indices(scale))] = recondft*lomask
+                    recondft = resdft
+                else:
+                    recondft = recondft*lomask
+
+            # Reconstruct from orientation bands
+            bands = [b for b in range(self.num_orientations) if (scale, b) in recon_keys]
+            if not bands:
+                continue
+            # stack the bands so we can transform them all at once: coeffs
+            # is then ...xOxHxW, with one entry per band
+            coeffs = torch.stack([pyr_coeffs[(scale, b)] for b in bands], dim=-3)
+            if self.tight_frame and self.is_complex:
+                coeffs = coeffs*np.sqrt(2)
+            anglemasks = getattr(self, f'_anglemask_recon_{scale}')
+            if len(bands) != self.num_orientations:
+                anglemasks = anglemasks[bands]
+            banddft = self._fft2(coeffs)
+            himask = getattr(self, f'_himask_{scale}')
+            orientdft = (self._complex_const_recon * banddft * anglemasks * himask).sum(-3)
+
+            # add orientation interpolated and added images to the lowpass image
+            if recondft is None:
+                recondft = orientdft
+            else:
+                recondft = recondft + orientdft
         return recondft
 
 
@@ -839,7 +1605,10 @@ class Steerable_Pyramid_Freq(nn.Module):
         """Steer pyramid coefficients to the specified angles
 
         This allows you to have filters that have the Gaussian derivative order specified in
-        construction, but arbitrary angles or number of orientations.
+        construction, but arbitrary angles or number of orientations. All scales are steered to
+        all ``angles`` at once, and the steering weights are cached per number of orientations
+        and angles. The real and imaginary parts of complex coefficients are steered with the
+        same weights.
 
         Parameters
         ----------
@@ -858,24 +1627,39 @@ class Steerable_Pyramid_Freq(nn.Module):
             like `pyr_coeffs`, keys are 2-tuples of ints indexing the scale and orientation,
             but now we're indexing `angles` instead of `self.num_orientations`.
         resteering_weights : `dict`
-            dictionary of weights used to re-steer the pyramid coefficients. will have the same
-            keys as `resteered_coeffs`.
+            dictionary of weights used to re-steer the pyramid coefficients. keys are 2-tuples of
+            ints indexing the scale and `angles`.
 
         """
-        assert  pyr_coeffs[(0,0)].dtype not in complex_types, "steering only implemented for real coefficients"
+        if self._shape_pyrs is not None:
+            return self._pyr_for_shape(pyr_coeffs[(0, 0)].shape[-2:]).steer_coeffs(
+                pyr_coeffs, angles, even_phase)
         resteered_coeffs = {}
         resteering_weights = {}
-        num_scales = self.num_scales
         num_orientations = self.num_orientations
-        for i in range(num_scales):
-            basis = torch.cat([pyr_coeffs[(i, j)].squeeze().unsqueeze(-1) for j in
-                               range(num_orientations)], dim=-1)
-
-            for j, a in enumerate(angles):
-                res, steervect = steer(
-                    basis, a, return_weights=True, even_phase=even_phase)
-                resteering_weights[(i, j)] = steervect
-                resteered_coeffs[(i, num_orientations + j)] = res.reshape(pyr_coeffs[(i, 0)].shape)
-
+        coeffs = pyr_coeffs[(0, 0)]
+        # cached, so steering to the same angles again is cheap. complex
+        # coefficients are steered with the same (real) weights
+        weights = steering_weights(num_orientations, angles, even_phase=even_phase)
+        weights = torch.tensor(weights, dtype=coeffs.dtype, device=coeffs.device)
+
+        # gather the orientations of all scales in a single ...xOxP tensor,
+        # with the (flattened) pixels of each scale one after the other, so
+        # that one einsum steers all scales to all angles at once
+        shapes = [pyr_coeffs[(i, 0)].shape[-2:] for i in range(self.num_scales)]
+        sizes = [h * w for h, w in shapes]
+        basis = coeffs.new_empty((*coeffs.shape[:-2], num_orientations, sum(sizes)))
+        start = 0
+        for i, size in enumerate(sizes):
+            for b in range(num_orientations):
+                basis[..., b, start:start+size] = pyr_coeffs[(i, b)].flatten(-2)
+            start += size
+        steered = torch.einsum('ao,...op->...ap', weights, basis)
+
+        for i, band in enumerate(steered.split(sizes, dim=-1)):
+            band = band.unflatten(-1, shapes[i])
+            for j in range(weights.shape[0]):
+                resteering_weights[(i, j)] = weights[j]
+                resteered_coeffs[(i, num_orientations + j)] = band[..., j, :, :]
 
         return resteered_coeffs, resteering_weights
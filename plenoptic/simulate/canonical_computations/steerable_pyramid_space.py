@@ -0,0 +1,432 @@
+import time
+from collections import OrderedDict
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from pyrtools.pyramids.filters import parse_filter
+from pyrtools.pyramids.pyr_utils import max_pyr_height
+from .steerable_pyramid_freq import Steerable_Pyramid_Freq
+
+# padding modes of torch.nn.functional.pad corresponding to the
+# boundary-handling of pyrtools' corrDn / upConv
+_PAD_MODES = {'circular': 'circular', 'reflect1': 'reflect', 'zero': 'constant'}
+
+# backend picked by steerable_pyramid(backend='auto') for each combination of
+# image shape, pyramid parameters, device and dtype, so that we only
+# benchmark once
+_BACKEND_CACHE = {}
+
+
+def _num_scales(image_shape, lofilt_shape, height):
+    r"""Number of scales of a ``Steerable_Pyramid_Space`` with lowpass filter of ``lofilt_shape``"""
+    max_ht = max_pyr_height(tuple(int(d) for d in image_shape), lofilt_shape)
+    if height == 'auto':
+        return int(max_ht)
+    elif height > max_ht:
+        raise ValueError("Cannot build pyramid higher than %d levels." % (max_ht))
+    return int(height)
+
+
+class Steerable_Pyramid_Space(nn.Module):
+    r"""Steerable pyramid in Torch, using spatial convolutions
+
+    Same transform as pyrtools' ``SteerablePyramidSpace``: the image is
+    convolved with the small precomputed kernels of [2]_ (``sp*_filters``)
+    and downsampled by 2 between scales, instead of being multiplied by
+    masks in the Fourier domain as in ``Steerable_Pyramid_Freq``. The cost
+    of the convolutions grows with the number of pixels, not their
+    logarithm, but they avoid the ffts of the whole image, so this is
+    faster for small images (see ``steerable_pyramid`` to pick the fastest
+    of the two for a given image size). The kernels are not exactly those
+    of ``Steerable_Pyramid_Freq``, so the coefficients differ, and
+    reconstruction is only approximate.
+
+    All orientation bands of a scale are computed with a single ``conv2d``
+    and the batch and channel dimensions are folded together, so the
+    kernels are shared by all images and channels.
+
+    Parameters
+    ----------
+    image_shape : `list or tuple`
+        shape of input image
+    height : 'auto' or `int`
+        The height of the pyramid. If 'auto', will automatically determine
+        based on the size of `image` and of the lowpass filter.
+    order : {0, 1, 3, 5}
+        The Gaussian derivative order used for the steerable filters. The
+        number of orientations is `order` + 1.
+    edge_type : {'reflect1', 'circular', 'zero'}
+        How to handle the image boundaries: reflect about the edge pixels,
+        wrap around (as ``Steerable_Pyramid_Freq`` does) or assume zeros
+        outside of the image.
+
+    Attributes
+    ----------
+    image_shape : `list or tuple`
+        shape of input image
+    pyr_size : `dict`
+        Dictionary containing the sizes of the pyramid coefficients. Keys are `(level, band)`
+        tuples and values are tuples.
+    is_complex : `bool`
+        Whether the coefficients are complex- or real-valued. Always False.
+
+    References
+    ----------
+    .. [1] E P Simoncelli and W T Freeman, "The Steerable Pyramid: A Flexible Architecture for
+       Multi-Scale Derivative Computation," Second Int'l Conf on Image Processing, Washington, DC,
+       Oct 1995.
+    .. [2] A Karasaridis and E P Simoncelli, "A Filter Design Technique for Steerable Pyramid
+       Image Transforms", ICASSP, Atlanta, GA, May 1996.
+
+    """
+
+    def __init__(self, image_shape, height='auto', order=1, edge_type='reflect1'):
+        super().__init__()
+        if order not in [0, 1, 3, 5]:
+            raise ValueError("order must be one of 0, 1, 3 or 5! For other orders, use "
+                             "Steerable_Pyramid_Freq")
+        if edge_type not in _PAD_MODES:
+            raise ValueError(f"edge_type must be one of {list(_PAD_MODES.keys())}!")
+        self.image_shape = image_shape
+        self.order = order
+        self.num_orientations = order + 1
+        self.edge_type = edge_type
+        self.is_complex = False
+        self.downsample = True
+        # only used by the shared steer_coeffs: this pyramid is never
+        # shape-polymorphic
+        self._shape_pyrs = None
+
+        filters = parse_filter(f"sp{order}_filters", normalize=False)
+        self.num_scales = _num_scales(image_shape, filters['lofilt'].shape, height)
+
+        # the kernels are stored as conv2d weights: out_channels x
+        # in_channels x height x width. bfilts holds one kernel per
+        # orientation, so all the bands of a scale come out of one conv2d
+        bfiltsz = int(np.floor(np.sqrt(filters['bfilts'].shape[0])))
+        bfilts = np.stack([filters['bfilts'][:, b].reshape(bfiltsz, bfiltsz).T
+                           for b in range(self.num_orientations)])
+        for name, filt in [('hi0filt', filters['hi0filt']), ('lo0filt', filters['lo0filt']),
+                           ('lofilt', filters['lofilt'])]:
+            self.register_buffer(name, torch.as_tensor(filt, dtype=torch.float32)[None, None],
+                                 persistent=False)
+        self.register_buffer('bfilts', torch.as_tensor(bfilts, dtype=torch.float32).unsqueeze(1),
+                             persistent=False)
+
+        self.scales = (['residual_lowpass'] + list(range(self.num_scales))[::-1] +
+                       ['residual_highpass'])
+        # spatial shape of the coefficients at each scale (and, in the
+        # last entry, of the residual lowpass)
+        self._scale_shapes = [tuple(int(d) for d in self.image_shape)]
+        for i in range(self.num_scales):
+            self._scale_shapes.append(tuple((d + 1) // 2 for d in self._scale_shapes[-1]))
+        self.pyr_size = OrderedDict()
+        self.pyr_size['residual_highpass'] = self._scale_shapes[0]
+        for i in range(self.num_scales):
+            for b in range(self.num_orientations):
+                self.pyr_size[(i, b)] = self._scale_shapes[i]
+        self.pyr_size['residual_lowpass'] = self._scale_shapes[-1]
+
+    # the checks of the reconstruction arguments and the steering only
+    # depend on the number of scales and orientations, so they're shared
+    # with the frequency-domain pyramid
+    _recon_levels_check = Steerable_Pyramid_Freq._recon_levels_check
+    _recon_bands_check = Steerable_Pyramid_Freq._recon_bands_check
+    _recon_keys = Steerable_Pyramid_Freq._recon_keys
+    steer_coeffs = Steerable_Pyramid_Freq.steer_coeffs
+    convert_pyr_to_tensor = staticmethod(Steerable_Pyramid_Freq.convert_pyr_to_tensor)
+    convert_tensor_to_pyr = staticmethod(Steerable_Pyramid_Freq.convert_tensor_to_pyr)
+
+    def _pad(self, x, filt):
+        r"""Pad ``x`` so that correlating it with ``filt`` gives an output of the same size"""
+        ph, pw = filt.shape[-2] // 2, filt.shape[-1] // 2
+        return F.pad(x, (pw, filt.shape[-1] - 1 - pw, ph, filt.shape[-2] - 1 - ph),
+                     mode=_PAD_MODES[self.edge_type])
+
+    def _correlate(self, x, filt, step=1):
+        r"""Correlate ``x`` (N x C_in x H x W) with ``filt`` and downsample by ``step``
+
+        Equivalent to pyrtools' ``corrDn``, with the filter centered on
+        each pixel.
+
+        """
+        return F.conv2d(self._pad(x, filt), filt, stride=step)
+
+    def _upconvolve(self, x, filt, shape, step=1):
+        r"""Upsample ``x`` to ``shape`` by ``step`` and convolve it with ``filt``
+
+        This is the adjoint of ``_correlate`` (for circular and zero
+        boundaries) and corresponds to pyrtools' ``upConv``. Here, ``filt``
+        has the same layout as in ``_correlate``, so the C_in channels of
+        ``x`` are summed over.
+
+        """
+        if step != 1:
+            up = x.new_zeros((*x.shape[:-2], *shape))
+            up[..., ::step, ::step] = x
+            x = up
+        filt = filt.transpose(0, 1).flip((-2, -1))
+        return F.conv2d(self._pad(x, filt), filt)
+
+    def forward(self, x, scales=[]):
+        r"""Generate the steerable pyramid coefficients for an image
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            A tensor containing the image to analyze, of shape (batch,
+            channel, height, width).
+        scales : list, optional
+            Which scales to include in the returned representation. If
+            an empty list (the default), we include all
+            scales. Otherwise, can contain subset of values present in
+            this model's ``scales`` attribute (ints from 0 up to
+            ``self.num_scales-1`` and the strs 'residual_highpass' and
+            'residual_lowpass'. Can contain a single value or multiple
+            values. If it's an int, we include all orientations from
+            that scale. Order within the list does not matter.
+
+        Returns
+        -------
+        representation: OrderedDict
+            The coefficients, with the same keys as those returned by
+            ``Steerable_Pyramid_Freq.forward``.
+
+        """
+        if not isinstance(scales, list):
+            raise Exception("scales must be a list!")
+        if not scales:
+            scales = self.scales
+        scale_ints = [s for s in scales if isinstance(s, int)]
+        if len(scale_ints) != 0:
+            assert (max(scale_ints) < self.num_scales) and (
+                min(scale_ints) >= 0), "Scales must be within 0 and num_scales-1"
+        assert len(x.shape) == 4, "Input must be batch of images of shape BxCxHxW"
+        pyr_coeffs = OrderedDict()
+        batch_shape = x.shape[:2]
+        # fold the channels into the batch, so that every image is filtered
+        # with the same single-channel kernels
+        x = x.reshape(-1, 1, *x.shape[-2:])
+
+        if 'residual_highpass' in scales:
+            hi0 = self._correlate(x, self.hi0filt)
+            pyr_coeffs['residual_highpass'] = hi0.reshape(*batch_shape, *hi0.shape[-2:])
+
+        lo = self._correlate(x, self.lo0filt)
+        for i in range(self.num_scales):
+            if i in scales:
+                # all orientations at once: the output channels are the bands
+                bands = self._correlate(lo, self.bfilts)
+                bands = bands.reshape(*batch_shape, *bands.shape[-3:])
+                for b in range(self.num_orientations):
+                    pyr_coeffs[(i, b)] = bands[:, :, b]
+            lo = self._correlate(lo, self.lofilt, step=2)
+
+        if 'residual_lowpass' in scales:
+            pyr_coeffs['residual_lowpass'] = lo.reshape(*batch_shape, *lo.shape[-2:])
+        return pyr_coeffs
+
+    def recon_pyr(self, pyr_coeffs, levels='all', bands='all'):
+        r"""Reconstruct the image or batch of images, optionally using subset of pyramid coefficients.
+
+        Parameters
+        ----------
+        pyr_coeffs : `OrderedDict`
+            pyramid coefficients to reconstruct from
+        levels : `list`, `int`,  or {`'all'`, `'residual_highpass'`}
+            If `list` should contain some subset of integers from `0` to `self.num_scales-1`
+            (inclusive) and `'residual_lowpass'`. If `'all'`, returned value will contain all
+            valid levels. Otherwise, must be one of the valid levels.
+        bands : `list`, `int`, or `'all'`.
+            If list, should contain some subset of integers from `0` to `self.num_orientations-1`.
+            If `'all'`, returned value will contain all valid orientations. Otherwise, must be one
+            of the valid orientations.
+
+        Returns
+        -------
+        recon : `torch.Tensor`
+            The reconstructed image or batch of images.
+            Output is of size BxCxHxW
+
+        """
+        recon_keys = self._recon_keys(levels, bands)
+        batch_shape = pyr_coeffs['residual_highpass'].shape[:2]
+
+        def fold(coeffs):
+            return coeffs.reshape(-1, *coeffs.shape[-3:])
+
+        if 'residual_lowpass' in recon_keys:
+            recon = fold(pyr_coeffs['residual_lowpass'].unsqueeze(-3))
+        else:
+            recon = None
+        for scale in reversed(range(self.num_scales)):
+            if recon is not None:
+                recon = self._upconvolve(recon, self.lofilt, self._scale_shapes[scale], step=2)
+            bands = [b for b in range(self.num_orientations) if (scale, b) in recon_keys]
+            if not bands:
+                continue
+            # the bands are the input channels, which upconvolving sums over
+            coeffs = fold(torch.stack([pyr_coeffs[(scale, b)] for b in bands], dim=-3))
+            bfilts = self.bfilts if len(bands) == self.num_orientations else self.bfilts[bands]
+            band_recon = self._upconvolve(coeffs, bfilts, self._scale_shapes[scale])
+            recon = band_recon if recon is None else recon + band_recon
+
+        if recon is not None:
+            recon = self._upconvolve(recon, self.lo0filt, self._scale_shapes[0])
+        if 'residual_highpass' in recon_keys:
+            hi0 = self._upconvolve(fold(pyr_coeffs['residual_highpass'].unsqueeze(-3)),
+                                   self.hi0filt, self._scale_shapes[0])
+            recon = hi0 if recon is None else recon + hi0
+        if recon is None:
+            return torch.zeros_like(pyr_coeffs['residual_highpass'])
+        return recon.reshape(*batch_shape, *recon.shape[-2:])
+
+
+def _time_forward(pyr, x, n_repeats):
+    r"""Median time, in seconds, that ``pyr`` takes to analyze ``x``"""
+    def sync():
+        if x.device.type == 'cuda':
+            torch.cuda.synchronize(x.device)
+    times = []
+    with torch.no_grad():
+        # warm up: builds the masks of Steerable_Pyramid_Freq, picks the
+        # cuda kernels, etc.
+        pyr(x)
+        for _ in range(n_repeats):
+            sync()
+            start = time.perf_counter()
+            pyr(x)
+            sync()
+            times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def _create_pyramid(image_shape, backend, height, order, edge_type, device, dtype):
+    r"""Create the pyramid of ``backend`` (``'fft'`` or ``'spatial'``), see ``steerable_pyramid``"""
+    if edge_type not in _PAD_MODES:
+        raise ValueError(f"edge_type must be one of {list(_PAD_MODES.keys())}!")
+    if backend == 'spatial':
+        return Steerable_Pyramid_Space(image_shape, height=height, order=order,
+                                       edge_type=edge_type).to(device, dtype)
+    if order == 0:
+        # Steerable_Pyramid_Freq needs at least two orientations
+        raise ValueError("The fft backend doesn't support order 0!")
+    if order not in [1, 3, 5]:
+        raise ValueError("order must be one of 0, 1, 3 or 5! For other orders, use "
+                         "Steerable_Pyramid_Freq")
+    # same height as Steerable_Pyramid_Space
+    lofilt = parse_filter(f"sp{order}_filters", normalize=False)['lofilt']
+    return Steerable_Pyramid_Freq(image_shape, height=_num_scales(image_shape, lofilt.shape, height),
+                                  order=order).to(device, dtype)
+
+
+def steerable_pyramid(image_shape, height='auto', order=1, backend='auto', edge_type='reflect1',
+                      batch_shape=(1, 1), device=None, dtype=torch.float32, n_repeats=5):
+    r"""Create a real steerable pyramid, in the frequency or the spatial domain
+
+    ``Steerable_Pyramid_Freq`` filters the whole spectrum of the image at
+    every scale, while ``Steerable_Pyramid_Space`` convolves it with small
+    kernels, and which one is faster depends on the image size, the
+    hardware and the torch build. With ``backend='auto'``, we time the
+    forward pass of both on a random input (see
+    ``benchmark_steerable_pyramids``) and return the fastest one. The
+    choice is cached per image shape (and the other arguments), so the
+    benchmark only runs once per process.
+
+    Both pyramids have the same number of scales and orientations and
+    return coefficients with the same keys and shapes, but they're built
+    from different filters (and handle the boundaries differently), so the
+    coefficients themselves differ. Since the choice of ``'auto'`` depends
+    on the machine (and on the timings of the process), so do the
+    coefficients it returns: use ``'fft'`` or ``'spatial'`` when they have
+    to be reproducible.
+
+    Parameters
+    ----------
+    image_shape : `list or tuple`
+        shape of input image
+    height : 'auto' or `int`
+        The height of the pyramid. If 'auto', will use the maximum height
+        of ``Steerable_Pyramid_Space``, whichever backend is picked.
+    order : {0, 1, 3, 5}
+        The Gaussian derivative order used for the steerable filters.
+    backend : {'auto', 'fft', 'spatial'}
+        Which pyramid to create: ``'fft'`` for ``Steerable_Pyramid_Freq``,
+        ``'spatial'`` for ``Steerable_Pyramid_Space`` or ``'auto'`` to
+        benchmark both and pick the fastest.
+    edge_type : {'reflect1', 'circular', 'zero'}
+        Boundary-handling of ``Steerable_Pyramid_Space`` (the frequency
+        pyramid is always circular).
+    batch_shape : tuple, optional
+        Batch and channel dimensions of the input used in the benchmark.
+    device : torch.device or None, optional
+        Device to create the pyramid (and run the benchmark) on. If None,
+        the cpu.
+    dtype : torch.dtype, optional
+        dtype of the pyramid and of the benchmark input.
+    n_repeats : int, optional
+        Number of times each pyramid is timed in the benchmark.
+
+    Returns
+    -------
+    pyr : Steerable_Pyramid_Freq or Steerable_Pyramid_Space
+        The pyramid, on ``device`` and with ``dtype``.
+
+    """
+    if backend not in ['auto', 'fft', 'spatial']:
+        raise ValueError("backend must be one of 'auto', 'fft' or 'spatial'!")
+    device = torch.device('cpu') if device is None else torch.device(device)
+    if backend == 'auto':
+        if order == 0:
+            # only Steerable_Pyramid_Space supports it
+            backend = 'spatial'
+        else:
+            key = (tuple(image_shape), height, order, edge_type, tuple(batch_shape), device, dtype)
+            if key not in _BACKEND_CACHE:
+                times = benchmark_steerable_pyramids(image_shape, height, order, edge_type,
+                                                     batch_shape, device, dtype, n_repeats)
+                _BACKEND_CACHE[key] = min(times, key=times.get)
+            backend = _BACKEND_CACHE[key]
+    return _create_pyramid(image_shape, backend, height, order, edge_type, device, dtype)
+
+
+def benchmark_steerable_pyramids(image_shape, height='auto', order=1, edge_type='reflect1',
+                                 batch_shape=(1, 1), device=None, dtype=torch.float32,
+                                 n_repeats=5):
+    r"""Time the forward pass of the frequency- and space-domain steerable pyramids
+
+    The pyramids are those returned by ``steerable_pyramid`` with the same
+    arguments, and they're timed on a random input.
+
+    Parameters
+    ----------
+    image_shape : `list or tuple`
+        shape of input image
+    height : 'auto' or `int`
+        The height of the pyramids, see ``steerable_pyramid``.
+    order : {1, 3, 5}
+        The Gaussian derivative order used for the steerable filters.
+    edge_type : {'reflect1', 'circular', 'zero'}
+        Boundary-handling of ``Steerable_Pyramid_Space``.
+    batch_shape : tuple, optional
+        Batch and channel dimensions of the input.
+    device : torch.device or None, optional
+        Device to run the benchmark on. If None, the cpu.
+    dtype : torch.dtype, optional
+        dtype of the pyramids and of the input.
+    n_repeats : int, optional
+        Number of times each pyramid is timed.
+
+    Returns
+    -------
+    times : dict
+        The median time (in seconds) of the forward pass of the ``'fft'``
+        and ``'spatial'`` backends.
+
+    """
+    device = torch.device('cpu') if device is None else torch.device(device)
+    x = torch.randn(*batch_shape, *image_shape, device=device, dtype=dtype)
+    return {backend: _time_forward(_create_pyramid(image_shape, backend, height, order,
+                                                   edge_type, device, dtype), x, n_repeats)
+            for backend in ['fft', 'spatial']}
@@ -0,0 +1,220 @@
+import os.path as op
+from collections import OrderedDict
+import numpy as np
+import torch
+import torch.nn as nn
+from .steerable_pyramid_freq import Steerable_Pyramid_Freq
+
+
+def _tile_index(start, stop, n):
+    r"""Index of the pixels ``start`` through ``stop`` of a circular dimension of length ``n``
+
+    Returns a slice if no wrapping around is needed, so that reading from
+    array-likes (e.g., memory-mapped arrays) stays cheap.
+
+    """
+    if start >= 0 and stop <= n:
+        return slice(start, stop)
+    return np.arange(start, stop) % n
+
+
+class Tiled_Steerable_Pyramid_Freq(nn.Module):
+    r"""Steerable pyramid of arbitrarily large images, computed tile by tile
+
+    ``Steerable_Pyramid_Freq`` needs the spectrum of the whole image, so it
+    cannot analyze images that don't fit in memory (whole-slide images,
+    panoramas, etc.). This computes (an approximation of) the same
+    coefficients by cutting the image into tiles, padding each of them with
+    a halo of surrounding pixels, analyzing the padded tiles with a
+    ``Steerable_Pyramid_Freq`` and keeping only the coefficients of the
+    central, un-padded, region of each. Those are written into
+    preallocated arrays, which can be memory-mapped files, so peak memory
+    is set by the tile size, not the image size.
+
+    Boundary-handling is circular, as for ``Steerable_Pyramid_Freq``: tiles
+    on the edges of the image are padded with pixels from the opposite
+    edge. The filters are not compactly supported in space, so the
+    coefficients are only approximately those of the full-image transform.
+    The error decreases with ``halo``, and can be measured with
+    ``boundary_error`` on an image (or crop) that fits in memory.
+
+    In order for the coefficients of the tiles to line up with those of
+    the full image, all of the image shape, ``tile_shape`` and ``halo``
+    must be multiples of ``2**num_scales`` when downsampling.
+
+    Parameters
+    ----------
+    tile_shape : `list or tuple`
+        shape of the tiles, without the halo
+    halo : `int`
+        number of pixels the tiles are padded with on each side
+    height : 'auto' or `int`
+        The height of the pyramid. If 'auto', will automatically determine
+        based on the size of the padded tiles.
+    order : `int`.
+        The Gaussian derivative order used for the steerable filters.
+    twidth : `int`
+        The width of the transition region of the radial lowpass function, in octaves
+    is_complex : `bool`
+        Whether the pyramid coefficients should be complex or not.
+    downsample : `bool`
+        Whether to downsample each scale in the pyramid.
+    tight_frame : `bool`
+        Whether the pyramid obeys the generalized parseval theorem.
+    use_rfft : `bool`
+        Whether to compute the transform of each tile using only half of
+        its spectrum (see ``Steerable_Pyramid_Freq``).
+
+    Attributes
+    ----------
+    pyr : `Steerable_Pyramid_Freq`
+        The pyramid used to analyze the padded tiles.
+
+    """
+
+    def __init__(self, tile_shape, halo, height='auto', order=3, twidth=1, is_complex=False,
+                 downsample=True, tight_frame=False, use_rfft=False):
+        super().__init__()
+        self.tile_shape = tuple(tile_shape)
+        self.halo = halo
+        self.pyr = Steerable_Pyramid_Freq([s + 2*halo for s in self.tile_shape], height=height,
+                                          order=order, twidth=twidth, is_complex=is_complex,
+                                          downsample=downsample, tight_frame=tight_frame,
+                                          use_rfft=use_rfft)
+        self.twidth = twidth
+        if downsample:
+            # downsampling factor of the coarsest coefficients
+            self._block = 2 ** self.pyr.num_scales
+        else:
+            self._block = 1
+        if any([s % self._block for s in self.tile_shape]) or halo % self._block:
+            raise ValueError(f"tile_shape and halo must be multiples of {self._block} (2**num_scales)!")
+
+    def _factors(self):
+        r"""Downsampling factor of each of the pyramid's keys, in the order of its coefficients"""
+        factors = OrderedDict()
+        factors['residual_highpass'] = 1
+        for i in range(self.pyr.num_scales):
+            for b in range(self.pyr.num_orientations):
+                factors[(i, b)] = 2**i if self.pyr.downsample else 1
+        factors['residual_lowpass'] = self._block
+        return factors
+
+    def _allocate(self, lead_shape, image_shape, out_dir):
+        r"""Preallocate the coefficients of the whole image"""
+        dtype = self.pyr._dtype_ref.dtype
+        real_dtype = torch.empty(0, dtype=dtype).numpy().dtype
+        complex_dtype = np.result_type(real_dtype, np.complex64)
+        pyr_coeffs = OrderedDict()
+        for k, f in self._factors().items():
+            shape = (*lead_shape, image_shape[0] // f, image_shape[1] // f)
+            dt = complex_dtype if self.pyr.is_complex and not isinstance(k, str) else real_dtype
+            if out_dir is None:
+                pyr_coeffs[k] = np.zeros(shape, dtype=dt)
+            else:
+                name = k if isinstance(k, str) else f'{k[0]}_{k[1]}'
+                pyr_coeffs[k] = np.lib.format.open_memmap(op.join(out_dir, f'{name}.npy'), mode='w+',
+                                                          dtype=dt, shape=shape)
+        return pyr_coeffs
+
+    def forward(self, image, out_dir=None):
+        r"""Compute the steerable pyramid coefficients of ``image``, one tile at a time
+
+        Parameters
+        ----------
+        image : array_like
+            Image of shape ``(..., H, W)``: a numpy array, memory-mapped
+            array or tensor. Only one padded tile at a time is read from
+            it. ``H`` and ``W`` must be at least as large as
+            ``tile_shape`` and, when downsampling, multiples of
+            ``2**num_scales``.
+        out_dir : str or None, optional
+            If None, the coefficients are returned as numpy arrays.
+            Otherwise, they are written to memory-mapped ``.npy`` files in
+            this directory, one per band, named after the keys (e.g.,
+            ``'residual_highpass.npy'``, ``'0_1.npy'``).
+
+        Returns
+        -------
+        pyr_coeffs : `OrderedDict`
+            Coefficients of the whole image, with the same keys as those
+            returned by ``Steerable_Pyramid_Freq.forward`` and values of
+            shape ``(..., H_band, W_band)``.
+
+        """
+        lead_shape, image_shape = tuple(image.shape[:-2]), tuple(image.shape[-2:])
+        if any([s % self._block for s in image_shape]):
+            raise ValueError(f"image shape must be a multiple of {self._block} (2**num_scales)!")
+        if any([s < t for s, t in zip(image_shape, self.tile_shape)]):
+            raise ValueError("image must be at least as large as tile_shape!")
+        pyr_coeffs = self._allocate(lead_shape, image_shape, out_dir)
+        factors = self._factors()
+        device = self.pyr._dtype_ref.device
+        dtype = self.pyr._dtype_ref.dtype
+
+        # the last tile of each dimension is shifted back so it stays
+        # within the image, overlapping the previous one
+        starts = [sorted(set([min(s, n - t) for s in range(0, n, t)]))
+                  for n, t in zip(image_shape, self.tile_shape)]
+        h = self.halo
+        for r in starts[0]:
+            rows = _tile_index(r - h, r + self.tile_shape[0] + h, image_shape[0])
+            for c in starts[1]:
+                cols = _tile_index(c - h, c + self.tile_shape[1] + h, image_shape[1])
+                if isinstance(rows, slice) or isinstance(cols, slice):
+                    tile = image[..., rows, cols]
+                else:
+                    tile = image[..., rows[:, None], cols]
+                tile = torch.as_tensor(np.asarray(tile) if not torch.is_tensor(tile) else tile)
+                tile = tile.to(device=device, dtype=dtype).reshape(1, -1, *tile.shape[-2:])
+                tile_coeffs = self.pyr(tile)
+                for k, f in factors.items():
+                    band = tile_coeffs[k][..., h//f:(h+self.tile_shape[0])//f,
+                                          h//f:(h+self.tile_shape[1])//f]
+                    band = band.reshape(*lead_shape, *band.shape[-2:])
+                    pyr_coeffs[k][..., r//f:(r+self.tile_shape[0])//f,
+                                  c//f:(c+self.tile_shape[1])//f] = band.detach().cpu().numpy()
+        if out_dir is not None:
+            for v in pyr_coeffs.values():
+                v.flush()
+        return pyr_coeffs
+
+    def boundary_error(self, image, pyr_coeffs=None):
+        r"""Compare the tiled coefficients of ``image`` to those of the full-image transform
+
+        The full-image transform is computed with ``Steerable_Pyramid_Freq``,
+        so ``image`` must fit in memory: use a representative crop of a
+        larger image to pick ``halo``.
+
+        Parameters
+        ----------
+        image : array_like
+            Image of shape ``(..., H, W)``.
+        pyr_coeffs : `OrderedDict` or None, optional
+            The tiled coefficients of ``image``, as returned by
+            ``forward``. If None, we compute them.
+
+        Returns
+        -------
+        errors : `OrderedDict`
+            For each key, the maximum absolute difference between the
+            tiled and full-image coefficients, relative to the maximum
+            absolute value of the full-image coefficients.
+
+        """
+        if pyr_coeffs is None:
+            pyr_coeffs = self.forward(image)
+        image = torch.as_tensor(np.asarray(image) if not torch.is_tensor(image) else image)
+        device = self.pyr._dtype_ref.device
+        dtype = self.pyr._dtype_ref.dtype
+        full_pyr = Steerable_Pyramid_Freq(image.shape[-2:], height=self.pyr.num_scales,
+                                          order=self.pyr.order, twidth=self.twidth,
+                                          is_complex=self.pyr.is_complex,
+                                          downsample=self.pyr.downsample,
+                                          tight_frame=self.pyr.tight_frame).to(device, dtype)
+        full_coeffs = full_pyr(image.to(device=device, dtype=dtype).reshape(1, -1, *image.shape[-2:]))
+        errors = OrderedDict()
+        for k, v in full_coeffs.items():
+            v = v.reshape(*image.shape[:-2], *v.shape[-2:]).detach().cpu().numpy()
+            errors[k] = float(np.abs(pyr_coeffs[k] - v).max() / np.abs(v).max())
+        return errors
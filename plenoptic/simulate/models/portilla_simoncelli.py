@@ -3,6 +3,7 @@ import torch.fft
 import torch.nn as nn
 from ..canonical_computations.steerable_pyramid_freq import Steerable_Pyramid_Freq
 from ...tools.conv import blur_downsample
+from ...tools.signal import upsample_fourier, _upsample_fourier_indices
 import numpy as np
 from collections import OrderedDict
 import matplotlib.pyplot as plt
@@ -16,10 +17,23 @@ class PortillaSimoncelli(nn.Module):
     synthesizing texture metamers. These statistics are proposed in [1] as a sufficient set
     measurements for describing and synthesizing a given visual texture.
 
-    Currently we do not support batch measurement of images.
+    The statistics of each image and channel are computed independently,
+    all at once. If ``n_channels`` is given, the channels of each image
+    (e.g., those of a color image) are instead analyzed jointly: the
+    statistics of each channel are complemented with the correlations between
+    the bands of different channels, and they're all returned as a single
+    vector per image. ``forward`` does not store anything on the model, so a
+    single model can be used to analyze several images concurrently (e.g.,
+    from different threads); the intermediate results, such as the pyramid
+    coefficients, are returned when ``return_intermediates=True``.
 
     Parameters
     ----------
+    im_shape: tuple or None
+        The shape of the images to analyze. If None, images of any shape are
+        accepted: the pyramids used to compute the statistics then keep the
+        masks of the ``max_shapes`` most recently seen shapes (see
+        ``Steerable_Pyramid_Freq``).
     n_scales: int, optional
         The number of pyramid scales used to measure the statistics (default=4)
     n_orientations: int, optional
@@ -32,23 +46,40 @@ class PortillaSimoncelli(nn.Module):
         scaled).  In order to match the original statistics use_true_correlations must be
         set to false. But in order to synthesize metamers from this model use_true_correlations
         must be set to true (default).
+    max_shapes: int, optional
+        If ``im_shape`` is None, the maximum number of image shapes whose
+        pyramid masks are kept around. Ignored otherwise.
+    max_mask_bytes: int or None, optional
+        If ``im_shape`` is None, the maximum memory taken up by the masks of
+        each of the pyramids, beyond which the least recently seen shapes
+        are evicted. Ignored otherwise.
+    compact: bool, optional
+        If True, the representation only contains the non-redundant
+        statistics: one half of each (symmetric) auto-correlation and
+        cross-orientation correlation, without the correlations that are
+        always zero or one (e.g., the padding of
+        ``cross_orientation_correlation_real`` and the cross-scale
+        correlations of the magnitudes at the coarsest scale). Use
+        ``compact_to_full`` (or ``convert_to_dict``) to get the full
+        representation back, e.g., for plotting. Note that this changes the
+        weight of the statistics in a loss computed on the representation.
+    n_channels: int or None, optional
+        If None (the default), each channel of the images is analyzed
+        separately. Otherwise, the number of channels (at least 2) of the
+        images, which are analyzed jointly: the representation then also
+        contains the correlations between the magnitudes and between the
+        real parts of the bands of each pair of channels, at each scale, as
+        well as those of their low-pass residuals.
 
     Attributes
     ----------
     pyr: Steerable_Pyramid_Freq
         The complex steerable pyramid object used to calculate the portilla-simoncelli representation
-    pyr_coeffs: OrderedDict
-        The coefficients of the complex steerable pyramid.
-    mag_pyr_coeffs: OrderedDict
-        The magnitude of the pyramid coefficients.
-    real_pyr_coeffs: OrderedDict
-        The real parts of the pyramid coefficients.
     scales: list
         The names of the unique scales of coefficients in the pyramid.
     representation_scales: list
-        The scale for each coefficient in its vector form
-    representation: dictionary
-        A dictionary containing the Portilla-Simoncelli statistics
+        The scale for each coefficient in its vector form (only the
+        non-redundant ones if ``compact``)
 
     References
     -----
@@ -67,43 +98,114 @@ class PortillaSimoncelli(nn.Module):
         n_orientations=4,
         spatial_corr_width=9,
         use_true_correlations=True,
+        max_shapes=8,
+        max_mask_bytes=None,
+        compact=False,
+        n_channels=None,
     ):
         super().__init__()
+        if n_channels is not None and n_channels < 2:
+            raise ValueError("n_channels must be None or at least 2!")
 
         self.image_shape = im_shape
         self.spatial_corr_width = spatial_corr_width
         self.n_scales = n_scales
         self.n_orientations = n_orientations
+        shape_kwargs = dict(max_shapes=max_shapes, max_mask_bytes=max_mask_bytes)
         self.pyr = Steerable_Pyramid_Freq(
             self.image_shape,
             height=self.n_scales,
             order=self.n_orientations - 1,
             is_complex=True,
             tight_frame=False,
+            **shape_kwargs,
         )
-        self.filterPyr = Steerable_Pyramid_Freq(
-            self.pyr._lomasks[-1].shape[-2:], height=0, order=1,
-            tight_frame=False
-        )
-        self.unoriented_band_pyrs = [
-            Steerable_Pyramid_Freq(
-                himask.shape[-2:],
+        if self.image_shape is None:
+            # these accept any shape as well, so a single one of them can
+            # handle the bands of every scale
+            self.filterPyr = Steerable_Pyramid_Freq(None, height=0, order=1, tight_frame=False,
+                                                    **shape_kwargs)
+            unoriented_band_pyr = Steerable_Pyramid_Freq(
+                None,
                 height=1,
                 order=self.n_orientations - 1,
                 is_complex=False,
                 tight_frame=False,
+                **shape_kwargs,
             )
-            # want to go through these masks backwards
-            for himask in self.pyr._himasks
-        ]
+            self.unoriented_band_pyrs = [unoriented_band_pyr] * self.n_scales
+        else:
+            self.filterPyr = Steerable_Pyramid_Freq(
+                self.pyr._scale_shapes[-1], height=0, order=1,
+                tight_frame=False
+            )
+            self.unoriented_band_pyrs = [
+                Steerable_Pyramid_Freq(
+                    shape,
+                    height=1,
+                    order=self.n_orientations - 1,
+                    is_complex=False,
+                    tight_frame=False,
+                )
+                # one for the bands of each scale
+                for shape in self.pyr._scale_shapes[:-1]
+            ]
 
         self.use_true_correlations = use_true_correlations
+        # indices of the central auto-correlation, see _autocorrelation_indices
+        self._autocorr_indices = {}
+        # indices of the statistics of some scales, see _representation_indices
+        self._scales_indices = {}
         self.scales = (
             ["pixel_statistics", "residual_lowpass"]
             + [ii for ii in range(n_scales - 1, -1, -1)]
             + ["residual_highpass"]
         )
-        self.representation_scales = self._get_representation_scales()
+        self.compact = compact
+        self.n_channels = n_channels
+        self._full_representation_scales = self._get_representation_scales()
+        # the number of statistics of each channel
+        self._n_channel_stats = len(self._full_representation_scales)
+        if self.n_channels is not None:
+            # the pairs of channels whose bands are correlated
+            self._channel_pairs = [(c1, c2) for c1 in range(n_channels)
+                                   for c2 in range(c1 + 1, n_channels)]
+            self._full_representation_scales = (
+                self.n_channels * self._full_representation_scales
+                + self._get_cross_channel_scales()
+            )
+        self.representation_scales = self._full_representation_scales
+        if self.compact:
+            self._compact_indices, full_indices = self._compact_mapping()
+            self._full_indices = {full_indices.device: full_indices}
+            self.representation_scales = [self._full_representation_scales[i]
+                                          for i in self._compact_indices]
+        self._cache_constants(self.pyr._dtype_ref.device, self.pyr._dtype_ref.dtype)
+
+    def _cache_constants(self, device, dtype):
+        r"""Compute the constants used by ``forward`` on ``device``, ahead of time
+
+        These are the indices of the central auto-correlations, of the
+        Fourier upsampling and of the compact representation. They depend on
+        the image shape, so they can only be computed ahead of time if it's
+        fixed. Once they're cached, ``forward`` doesn't need to copy any data
+        from the host or to wait for the device.
+
+        """
+        if self.compact:
+            if device not in self._full_indices:
+                self._full_indices[device] = self._full_indices[torch.device('cpu')].to(device)
+            self._representation_indices(None, device)
+        if self.image_shape is None:
+            return
+        for shape in self.pyr._scale_shapes:
+            self._autocorrelation_indices(shape, device)
+        # the reconstructed and the low-pass images are real, the bands are
+        # complex
+        for shape in self.pyr._scale_shapes[1:]:
+            _upsample_fourier_indices(shape, 2, True, device, dtype)
+        for shape in self.pyr._scale_shapes[1:-1]:
+            _upsample_fourier_indices(shape, 2, False, device, dtype)
 
     def _get_representation_scales(self):
         r"""returns a vector that indicates the scale of each value in the representation (Portilla-Simoncelli statistics)
@@ -150,7 +252,7 @@ class PortillaSimoncelli(nn.Module):
             self.n_orientations * self.n_orientations
         ) * scales_with_lowpass
         cross_orientation_correlation_real = (
-            4 * self.n_orientations * self.n_orientations
+            max(2 * self.n_orientations, 5) * max(2 * self.n_orientations, 5)
         ) * scales_with_lowpass
 
         cross_scale_correlation_magnitude = (
@@ -193,7 +295,213 @@ class PortillaSimoncelli(nn.Module):
 
         return scales
 
-    def forward(self, image, scales=None):
+    def _cross_channel_shapes(self):
+        r"""The shape of each of the cross-channel statistics, without the batch dimension"""
+        n_pairs = len(self._channel_pairs)
+        return OrderedDict(
+            cross_channel_correlation_magnitude=(
+                n_pairs, self.n_orientations, self.n_orientations, self.n_scales
+            ),
+            cross_channel_correlation_real=(
+                n_pairs, self.n_orientations, self.n_orientations, self.n_scales
+            ),
+            cross_channel_correlation_lowpass=(n_pairs,),
+        )
+
+    def _get_cross_channel_scales(self):
+        r"""returns a vector that indicates the scale of each of the cross-channel statistics,
+        which follow those of all the channels in the representation"""
+        n_pairs = len(self._channel_pairs)
+        scales = [s for s in range(0, self.n_scales)]
+        cross_channel_correlation_magnitude = (
+            n_pairs * self.n_orientations * self.n_orientations
+        ) * scales
+        cross_channel_correlation_real = (
+            n_pairs * self.n_orientations * self.n_orientations
+        ) * scales
+        cross_channel_correlation_lowpass = n_pairs * ["residual_lowpass"]
+        return (
+            cross_channel_correlation_magnitude
+            + cross_channel_correlation_real
+            + cross_channel_correlation_lowpass
+        )
+
+    def _compact_mapping(self):
+        r"""Map between the full representation vector and its non-redundant statistics
+
+        The auto-correlations are symmetric around their center, as are the
+        cross-orientation correlations, and some statistics are always zero
+        (e.g., the cross-scale correlations of the magnitudes at the
+        coarsest scale, or the central auto-correlation beyond the size of
+        small images) or one (the center of the auto-correlations, if
+        ``use_true_correlations``). With ``n_channels``, this holds for the
+        statistics of each channel, while the cross-channel correlations
+        are all kept.
+
+        Returns
+        -------
+        compact_indices: list
+            Indices of the non-redundant statistics in the full vector.
+        full_indices: torch.Tensor
+            For each statistic of the full vector, its index in the compact
+            vector, or ``len(compact_indices)`` if it is always zero and
+            ``len(compact_indices) + 1`` if it is always one.
+
+        """
+        n_stats = self._n_channel_stats
+        zero, one = n_stats, n_stats + 1
+        n_ori, n_sc = self.n_orientations, self.n_scales
+        # each statistic of a channel points to the first one it's equal to
+        # in the vector of that channel (possibly itself), or to zero or one
+        source = self._convert_to_channel_dict(torch.arange(n_stats))
+
+        # auto-correlations: the shift (-y, -x) is the same as (y, x), and the
+        # central auto-correlation only goes up to le, which is smaller than
+        # half of spatial_corr_width for small images
+        center = (self.spatial_corr_width - 1) // 2
+        offsets = (torch.arange(self.spatial_corr_width) - center).abs()
+        offsets = torch.maximum(offsets.unsqueeze(-1), offsets)
+        reflected = (2 * center - torch.arange(self.spatial_corr_width)).clamp(
+            0, self.spatial_corr_width - 1
+        )
+        for key in ["auto_correlation_magnitude", "auto_correlation_reconstructed"]:
+            ac = source[key]
+            ac = torch.minimum(ac, ac[reflected][:, reflected])
+            for scale in range(ac.shape[2]):
+                if self.image_shape is not None:
+                    le = int(min(min(self.pyr._scale_shapes[scale]) / 2.0 - 1, center))
+                    ac[offsets > le, scale] = zero
+            if self.use_true_correlations:
+                ac[center, center] = one
+            source[key] = ac
+
+        # cross-orientation correlations are symmetric, and only fill the
+        # first n_orientations rows and columns (or 5 for the low-pass
+        # residual)
+        corr = source["cross_orientation_correlation_magnitude"]
+        corr = torch.minimum(corr, corr.transpose(0, 1))
+        corr[..., n_sc] = zero
+        source["cross_orientation_correlation_magnitude"] = corr
+        corr = source["cross_orientation_correlation_real"]
+        corr = torch.minimum(corr, corr.transpose(0, 1))
+        filled = torch.zeros(corr.shape, dtype=torch.bool)
+        filled[:n_ori, :n_ori, :n_sc] = True
+        filled[:5, :5, n_sc] = True
+        source["cross_orientation_correlation_real"] = corr.masked_fill(~filled, zero)
+
+        # cross-scale correlations, with the 2*n_orientations parents of the
+        # real bands (or the 5 of the coarsest scale) and no parents for the
+        # magnitudes of the coarsest scale
+        source["cross_scale_correlation_magnitude"][..., n_sc - 1] = zero
+        corr = source["cross_scale_correlation_real"]
+        filled = torch.zeros(corr.shape, dtype=torch.bool)
+        filled[:n_ori, :2 * n_ori, :n_sc - 1] = True
+        filled[:n_ori, :5, n_sc - 1] = True
+        source["cross_scale_correlation_real"] = corr.masked_fill(~filled, zero)
+
+        source = self._channel_stats_vector(source).tolist()
+        if self.n_channels is not None:
+            # the channels follow each other, then the cross-channel
+            # correlations
+            n_cross = len(self._full_representation_scales) - self.n_channels * n_stats
+            zero = len(self._full_representation_scales)
+            one = zero + 1
+            source = [
+                {n_stats: zero, n_stats + 1: one}.get(src, src + c * n_stats)
+                for c in range(self.n_channels) for src in source
+            ] + list(range(self.n_channels * n_stats, self.n_channels * n_stats + n_cross))
+        compact_indices = [i for i, src in enumerate(source) if src == i]
+        position = {i: j for j, i in enumerate(compact_indices)}
+        position.update({zero: len(compact_indices), one: len(compact_indices) + 1})
+        full_indices = torch.tensor([position[src] for src in source])
+        return compact_indices, full_indices
+
+    def compact_to_full(self, vec):
+        r"""Convert a compact representation vector to the full one
+
+        Undoes the removal of the redundant statistics of a ``compact``
+        model (see ``_compact_mapping``).
+
+        Parameters
+        ----------
+        vec: torch.Tensor
+            Tensor of shape (..., n_statistics), as returned by ``forward``
+            of a ``compact`` model (for all scales).
+
+        Returns
+        -------
+        full_vec: torch.Tensor
+            Tensor of shape (..., n_full_statistics), as returned by
+            ``forward`` of the same model without ``compact``.
+
+        """
+        if vec.device not in self._full_indices:
+            self._cache_constants(vec.device, vec.dtype)
+        vec = torch.cat([vec, vec.new_zeros(*vec.shape[:-1], 1),
+                         vec.new_ones(*vec.shape[:-1], 1)], dim=-1)
+        return vec[..., self._full_indices[vec.device]]
+
+    def _pyr_keys(self):
+        r"""The keys of the pyramid coefficients, in the order of the ``magnitude_means``"""
+        return (
+            ["residual_highpass"]
+            + [(s, o) for s in range(self.n_scales) for o in range(self.n_orientations)]
+            + ["residual_lowpass"]
+        )
+
+    def _pyramid_scales(self, scales):
+        r"""The scales of the pyramid needed for the statistics of ``scales``
+
+        The statistics of a scale use its bands and those of the next
+        (coarser) scale, or the low-pass residual for the coarsest scale. The
+        reconstructed low-pass images use all the coarser scales and the
+        low-pass residual.
+
+        Parameters
+        ----------
+        scales : list
+            Subset of this model's ``scales`` attribute.
+
+        Returns
+        -------
+        pyr_scales : list
+            Subset of the pyramid's ``scales`` attribute, empty if no
+            pyramid coefficients are needed.
+
+        """
+        pyr_scales = set()
+        if "residual_highpass" in scales:
+            pyr_scales.add("residual_highpass")
+        if "residual_lowpass" in scales:
+            # the cross-correlations of the low-pass residual are computed
+            # along with those of the coarsest scale
+            pyr_scales.update(["residual_lowpass", self.n_scales - 1])
+        band_scales = [s for s in scales if isinstance(s, int)]
+        if band_scales:
+            pyr_scales.update(range(min(band_scales), self.n_scales))
+            pyr_scales.add("residual_lowpass")
+        return [s for s in self.pyr.scales if s in pyr_scales]
+
+    def _representation_indices(self, scales, device):
+        r"""Get the indices of the statistics of ``scales`` in the full representation vector
+
+        If ``scales`` is None, that's all the statistics. If ``compact``, only
+        the non-redundant statistics are included. The indices are computed
+        once per value of ``scales`` and device.
+
+        """
+        key = (None if scales is None else tuple(scales), device)
+        if key not in self._scales_indices:
+            indices = (self._compact_indices if self.compact
+                       else range(len(self._full_representation_scales)))
+            self._scales_indices[key] = torch.tensor(
+                [i for i in indices
+                 if scales is None or self._full_representation_scales[i] in scales],
+                device=device
+            )
+        return self._scales_indices[key]
+
+    def forward(self, image, scales=None, return_intermediates=False):
         r"""Generate Texture Statistics representation of an image (see reference [1]_)
 
         Parameters
@@ -202,39 +510,67 @@ class PortillaSimoncelli(nn.Module):
             A tensor containing the image to analyze. We want to operate
             on this in the pytorch-y way, so we want it to be 4d (batch,
             channel, height, width). If it has fewer than 4 dimensions,
-            we will unsqueeze it until its 4d
+            we will unsqueeze it until its 4d. Each image and channel is
+            analyzed separately, unless this model has ``n_channels``, in
+            which case the image must have that many channels, which are
+            analyzed jointly.
         scales : list, optional
-            Which scales to include in the returned representation. If an empty
-            list (the default), we include all scales. Otherwise, can contain
-            subset of values present in this model's ``scales`` attribute.
+            Which scales to include in the returned representation. If None
+            or an empty list (the default), we include all scales.
+            Otherwise, can contain subset of values present in this model's
+            ``scales`` attribute, and only the pyramid scales and statistics
+            needed for those are computed.
+        return_intermediates : bool, optional
+            If True, also return the intermediate results of the
+            computation, e.g., for plotting.
 
         Returns
         -------
         representation_vector: torch.Tensor
-            A flattened tensor (1d) containing the measured representation statistics.
+            A tensor of shape (batch, channel, n_statistics) containing the
+            measured representation statistics of each image and channel.
+            With ``n_channels``, a tensor of shape (batch, 1, n_statistics)
+            containing the statistics of all the channels of each image,
+            followed by the cross-channel ones.
+        intermediates: OrderedDict
+            Only returned if ``return_intermediates=True``. Contains the
+            statistics as a dictionary (``"representation"``, of all scales,
+            see ``convert_to_dict``; the statistics of the scales that were
+            not requested are zero), and the complex pyramid coefficients
+            (``"pyr_coeffs"``), their (mean-subtracted) magnitudes
+            (``"magnitude_pyr_coeffs"``) and their real parts
+            (``"real_pyr_coeffs"``).
 
         """
         while image.ndimension() < 4:
             image = image.unsqueeze(0)
-        if image.shape[0]>1:
-            raise ValueError("Batch size should be 1. Portilla Simoncelli doesn't support batch operations.")
-
-        self.pyr_coeffs = self.pyr.forward(image)
-        self.representation = OrderedDict()
+        if self.n_channels is not None and image.shape[1] != self.n_channels:
+            raise ValueError(f"Images must have {self.n_channels} channels, but"
+                             f" got shape {image.shape}!")
+
+        if not scales:
+            scales = None
+        # only compute what's needed for the requested scales
+        compute_scales = self.scales if scales is None else scales
+        pyr_scales = self._pyramid_scales(compute_scales)
+        pyr_coeffs = self.pyr.forward(image, pyr_scales) if pyr_scales else OrderedDict()
+        representation = OrderedDict()
+        # all statistics have the batch and channel dimensions first
+        batch_shape = image.shape[:2]
 
         ### SECTION 1 (STATISTIC: pixel_statistics) ##################
         #  Calculate pixel statistics (mean, variance, skew, kurtosis, min, max).
-        self.representation["pixel_statistics"] = OrderedDict()
-        self.representation["pixel_statistics"]["mean"] = torch.mean(image)
-        self.representation["pixel_statistics"]["var"] = torch.var(image)
-        self.representation["pixel_statistics"]["skew"] = self.__class__.skew(
+        representation["pixel_statistics"] = OrderedDict()
+        representation["pixel_statistics"]["mean"] = torch.mean(image, dim=(-2, -1))
+        representation["pixel_statistics"]["var"] = torch.var(image, dim=(-2, -1))
+        representation["pixel_statistics"]["skew"] = self.__class__.skew(
             image
         )
-        self.representation["pixel_statistics"][
+        representation["pixel_statistics"][
             "kurtosis"
         ] = self.__class__.kurtosis(image)
-        self.representation["pixel_statistics"]["min"] = torch.min(image)
-        self.representation["pixel_statistics"]["max"] = torch.max(image)
+        representation["pixel_statistics"]["min"] = torch.amin(image, dim=(-2, -1))
+        representation["pixel_statistics"]["max"] = torch.amax(image, dim=(-2, -1))
 
         ### SECTION 2 (STATISTIC: mean_magnitude) ####################
         # Calculate the mean of the magnitude of each band of pyramid
@@ -243,7 +579,15 @@ class PortillaSimoncelli(nn.Module):
         # and real_pyr_coeffs, which contain the magnitude of the
         # pyramid coefficients and the real part of the pyramid
         # coefficients respectively.
-        self.representation["magnitude_means"] = self._calculate_magnitude_means()
+        magnitude_means, magnitude_pyr_coeffs, real_pyr_coeffs = self._calculate_magnitude_means(
+            pyr_coeffs
+        )
+        # (the statistics of the scales that are not computed are zero)
+        zeros = torch.zeros(batch_shape, device=image.device)
+        representation["magnitude_means"] = OrderedDict(
+            (key, magnitude_means[key] if key in magnitude_means else zeros)
+            for key in self._pyr_keys()
+        )
 
         ### SECTION 3 (STATISTICS: auto_correlation_magnitude,
         #                          skew_reconstructed,
@@ -272,8 +616,9 @@ class PortillaSimoncelli(nn.Module):
 
         # Initialize statistics
         # let's remove the normalization from the auto_correlation statistics
-        self.representation["auto_correlation_magnitude"] = torch.zeros(
+        representation["auto_correlation_magnitude"] = torch.zeros(
             [
+                *batch_shape,
                 self.spatial_corr_width,
                 self.spatial_corr_width,
                 self.n_scales,
@@ -281,21 +626,22 @@ class PortillaSimoncelli(nn.Module):
             ],
             device=image.device
         )
-        self.representation["skew_reconstructed"] = torch.empty((self.n_scales + 1, 1),
-                                                                device=image.device)
-        self.representation["kurtosis_reconstructed"] = torch.empty(
-            (self.n_scales + 1, 1), device=image.device
+        representation["skew_reconstructed"] = torch.zeros((*batch_shape, self.n_scales + 1),
+                                                           device=image.device)
+        representation["kurtosis_reconstructed"] = torch.zeros(
+            (*batch_shape, self.n_scales + 1), device=image.device
         )
-        self.representation["auto_correlation_reconstructed"] = torch.zeros(
-            [self.spatial_corr_width, self.spatial_corr_width, self.n_scales + 1],
+        representation["auto_correlation_reconstructed"] = torch.zeros(
+            [*batch_shape, self.spatial_corr_width, self.spatial_corr_width, self.n_scales + 1],
             device=image.device
         )
 
         if self.use_true_correlations:
-            self.representation["std_reconstructed"] = torch.empty(self.n_scales + 1, 1,
-                                                                   device=image.device)
+            representation["std_reconstructed"] = torch.zeros(*batch_shape, self.n_scales + 1,
+                                                              device=image.device)
 
-        self._calculate_autocorrelation_skew_kurtosis()
+        self._calculate_autocorrelation_skew_kurtosis(representation, magnitude_pyr_coeffs,
+                                                      real_pyr_coeffs, compute_scales)
 
         ### SECTION 4 (STATISTICS: cross_orientation_correlation_magnitude,
         #                          cross_scale_correlation_magnitude,
@@ -306,81 +652,166 @@ class PortillaSimoncelli(nn.Module):
         #
 
         # Initialize statistics
-        self.representation["cross_orientation_correlation_magnitude"] = torch.zeros(
-            self.n_orientations, self.n_orientations, self.n_scales + 1,
+        representation["cross_orientation_correlation_magnitude"] = torch.zeros(
+            *batch_shape, self.n_orientations, self.n_orientations, self.n_scales + 1,
             device=image.device
         )
-        self.representation["cross_scale_correlation_magnitude"] = torch.zeros(
-            self.n_orientations, self.n_orientations, self.n_scales,
+        representation["cross_scale_correlation_magnitude"] = torch.zeros(
+            *batch_shape, self.n_orientations, self.n_orientations, self.n_scales,
             device=image.device
         )
-        self.representation["cross_orientation_correlation_real"] = torch.zeros(
+        representation["cross_orientation_correlation_real"] = torch.zeros(
+            *batch_shape,
             max(2 * self.n_orientations, 5),
             max(2 * self.n_orientations, 5),
             self.n_scales + 1,
             device=image.device
         )
-        self.representation["cross_scale_correlation_real"] = torch.zeros(
-            2 * self.n_orientations, max(2 * self.n_orientations, 5), self.n_scales,
+        representation["cross_scale_correlation_real"] = torch.zeros(
+            *batch_shape, 2 * self.n_orientations, max(2 * self.n_orientations, 5), self.n_scales,
             device=image.device
         )
+        if self.n_channels is not None:
+            for key, shape in self._cross_channel_shapes().items():
+                representation[key] = torch.zeros(*batch_shape[:1], *shape,
+                                                  device=image.device)
 
-        self._calculate_crosscorrelations()
+        self._calculate_crosscorrelations(representation, pyr_coeffs, magnitude_pyr_coeffs,
+                                          real_pyr_coeffs, compute_scales)
 
         # SECTION 5: var_highpass_residual or the variance of the high-pass residual
-        self.representation["var_highpass_residual"] = (
-            self.pyr_coeffs["residual_highpass"].pow(2).mean().unsqueeze(0)
-        )
+        if "residual_highpass" in compute_scales:
+            representation["var_highpass_residual"] = (
+                pyr_coeffs["residual_highpass"].pow(2).mean(dim=(-2, -1)).unsqueeze(-1)
+            )
+        else:
+            representation["var_highpass_residual"] = zeros.unsqueeze(-1)
 
-        representation_vector = self.convert_to_vector().unsqueeze(0).unsqueeze(0)
+        if self.n_channels is not None:
+            # the cross-channel statistics come last
+            for key in self._cross_channel_shapes():
+                representation.move_to_end(key)
 
-        if scales is not None:
-            ind = torch.tensor(
-                [
-                    i
-                    for i, s in enumerate(self.representation_scales)
-                    if s in scales
-                ]
-            ).to(image.device)
-            return representation_vector.index_select(-1, ind)
+        representation_vector = self._convert_to_full_vector(representation)
+
+        if scales is not None or self.compact:
+            ind = self._representation_indices(scales, image.device)
+            representation_vector = representation_vector.index_select(-1, ind)
 
+        if return_intermediates:
+            intermediates = OrderedDict(
+                representation=representation,
+                pyr_coeffs=pyr_coeffs,
+                magnitude_pyr_coeffs=magnitude_pyr_coeffs,
+                real_pyr_coeffs=real_pyr_coeffs,
+            )
+            return representation_vector, intermediates
         return representation_vector
 
-    def convert_to_vector(self):
+    def convert_to_vector(self, representation):
         r"""Converts dictionary of statistics to a vector (for synthesis).
 
+        Parameters
+        ----------
+        representation: OrderedDict
+            The statistics, as returned by ``convert_to_dict`` (or in the
+            intermediates of ``forward``).
+
         Returns
         -------
          -- : torch.Tensor
-            Flattened 1d vector of statistics.
+            Tensor of shape (..., n_statistics), e.g., (batch, channel,
+            n_statistics), with the statistics of each image and channel
+            flattened (only the non-redundant ones if ``compact``).
 
         """
+        vec = self._convert_to_full_vector(representation)
+        if self.compact:
+            vec = vec.index_select(-1, self._representation_indices(None, vec.device))
+        return vec
+
+    def _convert_to_full_vector(self, representation):
+        r"""Converts dictionary of statistics to a vector, with all the statistics"""
+        vec = self._channel_stats_vector(representation)
+        if self.n_channels is None:
+            return vec
+        # the statistics of all the channels, then the cross-channel ones
+        batch_shape = vec.shape[:-2]
+        list_of_stats = [vec.flatten(-2)] + [
+            representation[key].reshape(*batch_shape, -1)
+            for key in self._cross_channel_shapes()
+        ]
+        vec = torch.cat(list_of_stats, dim=-1)
+        # (with a single vector per image)
+        return vec.unsqueeze(-2) if batch_shape else vec
+
+    def _channel_stats_vector(self, representation):
+        r"""Converts dictionary of statistics to a vector per channel, without the cross-channel ones"""
+        # the leading dimensions shared by all statistics
+        batch_shape = representation["pixel_statistics"]["mean"].shape
         list_of_stats = [
-            torch.cat([vv.flatten() for vv in val.values()])
+            torch.stack(list(val.values()), dim=-1)
             if isinstance(val, OrderedDict)
-            else val.flatten()
-            for (key, val) in self.representation.items()
+            else val.reshape(*batch_shape, -1)
+            for (key, val) in representation.items()
+            if not key.startswith("cross_channel")
         ]
-        return torch.cat(list_of_stats)
+        return torch.cat(list_of_stats, dim=-1)
 
     def convert_to_dict(self, vec):
-        vec = vec.squeeze()
+        r"""Converts a vector of statistics to a dictionary, undoing ``convert_to_vector``
+
+        Parameters
+        ----------
+        vec: torch.Tensor
+            Tensor of shape (..., n_statistics), e.g., as returned by
+            ``forward``. For a ``compact`` model, either the compact or the
+            full vector.
+
+        Returns
+        -------
+        rep: OrderedDict
+            The statistics, each with the leading dimensions of ``vec``.
+            With ``n_channels``, the (singleton) channel dimension of ``vec``
+            is replaced by the channels for the statistics of each channel,
+            and by the pairs of channels for the cross-channel ones.
+
+        """
+        if vec.shape[-1] != len(self._full_representation_scales):
+            vec = self.compact_to_full(vec)
+        if self.n_channels is None:
+            return self._convert_to_channel_dict(vec)
+        if vec.ndim > 1:
+            vec = vec.squeeze(-2)
+        n_filled = self.n_channels * self._n_channel_stats
+        rep = self._convert_to_channel_dict(
+            vec[..., :n_filled].unflatten(-1, (self.n_channels, self._n_channel_stats))
+        )
+        for key, shape in self._cross_channel_shapes().items():
+            nn = int(np.prod(shape))
+            rep[key] = vec[..., n_filled : (n_filled + nn)].unflatten(-1, shape)
+            n_filled += nn
+        return rep
+
+    def _convert_to_channel_dict(self, vec):
+        r"""Converts the vector of statistics of each channel to a dictionary"""
         rep = OrderedDict()
         rep["pixel_statistics"] = OrderedDict()
-        rep["pixel_statistics"]["mean"] = vec[0]
-        rep["pixel_statistics"]["var"] = vec[1]
-        rep["pixel_statistics"]["skew"] = vec[2]
-        rep["pixel_statistics"]["kurtosis"] = vec[3]
-        rep["pixel_statistics"]["min"] = vec[4]
-        rep["pixel_statistics"]["max"] = vec[5]
+        rep["pixel_statistics"]["mean"] = vec[..., 0]
+        rep["pixel_statistics"]["var"] = vec[..., 1]
+        rep["pixel_statistics"]["skew"] = vec[..., 2]
+        rep["pixel_statistics"]["kurtosis"] = vec[..., 3]
+        rep["pixel_statistics"]["min"] = vec[..., 4]
+        rep["pixel_statistics"]["max"] = vec[..., 5]
 
         n_filled = 6
 
         # magnitude_means
         rep["magnitude_means"] = OrderedDict()
-        for ii, (k, v) in enumerate(self.representation["magnitude_means"].items()):
-            rep["magnitude_means"][k] = vec[n_filled + ii]
-        n_filled += ii + 1
+        keys = self._pyr_keys()
+        for ii, k in enumerate(keys):
+            rep["magnitude_means"][k] = vec[..., n_filled + ii]
+        n_filled += len(keys)
 
         # auto_correlation_magnitude
         nn = (
@@ -389,8 +820,8 @@ class PortillaSimoncelli(nn.Module):
             * self.n_scales
             * self.n_orientations
         )
-        rep["auto_correlation_magnitude"] = vec[n_filled : (n_filled + nn)].unflatten(
-            0,
+        rep["auto_correlation_magnitude"] = vec[..., n_filled : (n_filled + nn)].unflatten(
+            -1,
             (
                 self.spatial_corr_width,
                 self.spatial_corr_width,
@@ -402,38 +833,38 @@ class PortillaSimoncelli(nn.Module):
 
         # skew_reconstructed & kurtosis_reconstructed
         nn = self.n_scales + 1
-        rep["skew_reconstructed"] = vec[n_filled : (n_filled + nn)]
+        rep["skew_reconstructed"] = vec[..., n_filled : (n_filled + nn)]
         n_filled += nn
 
-        rep["kurtosis_reconstructed"] = vec[n_filled : (n_filled + nn)]
+        rep["kurtosis_reconstructed"] = vec[..., n_filled : (n_filled + nn)]
         n_filled += nn
 
         # auto_correlation_reconstructed
         nn = self.spatial_corr_width * self.spatial_corr_width * (self.n_scales + 1)
         rep["auto_correlation_reconstructed"] = vec[
-            n_filled : (n_filled + nn)
+            ..., n_filled : (n_filled + nn)
         ].unflatten(
-            0, (self.spatial_corr_width, self.spatial_corr_width, self.n_scales + 1)
+            -1, (self.spatial_corr_width, self.spatial_corr_width, self.n_scales + 1)
         )
         n_filled += nn
 
         if self.use_true_correlations:
             nn = self.n_scales + 1
-            rep["std_reconstructed"] = vec[n_filled : (n_filled + nn)]
+            rep["std_reconstructed"] = vec[..., n_filled : (n_filled + nn)]
             n_filled += nn
 
         # cross_orientation_correlation_magnitude
         nn = self.n_orientations * self.n_orientations * (self.n_scales + 1)
         rep["cross_orientation_correlation_magnitude"] = vec[
-            n_filled : (n_filled + nn)
-        ].unflatten(0, (self.n_orientations, self.n_orientations, self.n_scales + 1))
+            ..., n_filled : (n_filled + nn)
+        ].unflatten(-1, (self.n_orientations, self.n_orientations, self.n_scales + 1))
         n_filled += nn
 
         # cross_scale_correlation_magnitude
         nn = self.n_orientations * self.n_orientations * self.n_scales
         rep["cross_scale_correlation_magnitude"] = vec[
-            n_filled : (n_filled + nn)
-        ].unflatten(0, (self.n_orientations, self.n_orientations, self.n_scales))
+            ..., n_filled : (n_filled + nn)
+        ].unflatten(-1, (self.n_orientations, self.n_orientations, self.n_scales))
         n_filled += nn
 
         # cross_orientation_correlation_real
@@ -443,9 +874,9 @@ class PortillaSimoncelli(nn.Module):
             * (self.n_scales + 1)
         )
         rep["cross_orientation_correlation_real"] = vec[
-            n_filled : (n_filled + nn)
+            ..., n_filled : (n_filled + nn)
         ].unflatten(
-            0,
+            -1,
             (
                 max(2 * self.n_orientations, 5),
                 max(2 * self.n_orientations, 5),
@@ -456,63 +887,77 @@ class PortillaSimoncelli(nn.Module):
 
         # cross_scale_correlation_real
         nn = 2 * self.n_orientations * max(2 * self.n_orientations, 5) * self.n_scales
-        rep["cross_scale_correlation_real"] = vec[n_filled : (n_filled + nn)].unflatten(
-            0, (2 * self.n_orientations, max(2 * self.n_orientations, 5), self.n_scales)
+        rep["cross_scale_correlation_real"] = vec[..., n_filled : (n_filled + nn)].unflatten(
+            -1, (2 * self.n_orientations, max(2 * self.n_orientations, 5), self.n_scales)
         )
         n_filled += nn
 
         # var_highpass_residual
-        rep["var_highpass_residual"] = vec[n_filled]
+        rep["var_highpass_residual"] = vec[..., n_filled]
         n_filled += 1
 
         return rep
 
-    def _calculate_magnitude_means(self):
+    def _calculate_magnitude_means(self, pyr_coeffs):
         r"""Calculates the mean of the pyramid coefficient magnitudes.  Also
-        stores two dictionaries, one containing the magnitudes of the pyramid
-        coefficient and the other containing the real parts.
+        returns two dictionaries, one containing the (mean-subtracted)
+        magnitudes of the pyramid coefficient and the other containing the
+        real parts.
+
+        Parameters
+        ----------
+        pyr_coeffs: OrderedDict
+            The coefficients of the complex steerable pyramid. They are not
+            modified.
 
         Returns
         -------
         magnitude_means: OrderedDict
             The mean of the pyramid coefficient magnitudes.
+        magnitude_pyr_coeffs: OrderedDict
+            The magnitudes of the pyramid coefficients, minus their mean.
+        real_pyr_coeffs: OrderedDict
+            The real parts of the pyramid coefficients, with the mean of the
+            low-pass residual subtracted.
 
         """
 
-        # subtract mean from lowest scale band
-        self.pyr_coeffs["residual_lowpass"] = self.pyr_coeffs[
-            "residual_lowpass"
-        ] - torch.mean(self.pyr_coeffs["residual_lowpass"])
-
         # calculate two new sets of coefficients: 1) magnitude of the pyramid coefficients, 2) real part of the pyramid coefficients
-        self.magnitude_pyr_coeffs = OrderedDict()
-        self.real_pyr_coeffs = OrderedDict()
-        for key, val in self.pyr_coeffs.items():
+        magnitude_pyr_coeffs = OrderedDict()
+        real_pyr_coeffs = OrderedDict()
+        for key, val in pyr_coeffs.items():
+            if key == "residual_lowpass":
+                # subtract mean from lowest scale band
+                val = val - torch.mean(val, dim=(-2, -1), keepdim=True)
             if key in ["residual_lowpass", "residual_highpass"]:  # not complex
-                self.magnitude_pyr_coeffs[key] = torch.abs(val).squeeze()
-                self.real_pyr_coeffs[key] = val.squeeze()
+                magnitude_pyr_coeffs[key] = torch.abs(val)
+                real_pyr_coeffs[key] = val
             else:  # complex
-                self.magnitude_pyr_coeffs[key] = val.abs().squeeze()
-                self.real_pyr_coeffs[key] = val.real.squeeze()
+                magnitude_pyr_coeffs[key] = val.abs()
+                real_pyr_coeffs[key] = val.real
 
         # STATISTIC: magnitude_means or the mean magnitude of each pyramid band
         magnitude_means = OrderedDict()
-        for (key, val) in self.magnitude_pyr_coeffs.items():
-            magnitude_means[key] = torch.mean(val)
-            self.magnitude_pyr_coeffs[key] = (
-                self.magnitude_pyr_coeffs[key] - magnitude_means[key]
+        for (key, val) in magnitude_pyr_coeffs.items():
+            magnitude_means[key] = torch.mean(val, dim=(-2, -1))
+            magnitude_pyr_coeffs[key] = (
+                val - magnitude_means[key][..., None, None]
             )  # subtract mean of magnitude
 
-        return magnitude_means
+        return magnitude_means, magnitude_pyr_coeffs, real_pyr_coeffs
 
     @staticmethod
     def expand(im, mult):
         r"""Resize an image (im) by a multiplier (mult).
 
+        The image is upsampled in the Fourier domain, see
+        ``plenoptic.tools.signal.upsample_fourier``.
+
         Parameters
         ----------
         im: torch.Tensor
-            An image for expansion.
+            An image for expansion, or a tensor of images whose last two
+            dimensions are height and width.
         mult: int
             Multiplier by which to resize image.
 
@@ -522,286 +967,300 @@ class PortillaSimoncelli(nn.Module):
             resized image
 
         """
-        im = im.squeeze()
+        return upsample_fourier(im, mult)
 
-        mx = im.shape[1]
-        my = im.shape[0]
-        my = mult * my
-        mx = mult * mx
-
-        fourier = mult ** 2 * torch.fft.fftshift(torch.fft.fftn(im))
-        fourier_large = torch.zeros(my, mx, device=fourier.device,
-                                    dtype=fourier.dtype)
-
-        y1 = int(my / 2 + 1 - my / (2 * mult))
-        y2 = int(my / 2 + my / (2 * mult))
-        x1 = int(mx / 2 + 1 - mx / (2 * mult))
-        x2 = int(mx / 2 + mx / (2 * mult))
-
-        fourier_large[y1:y2, x1:x2] = fourier[1 : int(my / mult), 1 : int(mx / mult)]
-        fourier_large[y1 - 1, x1:x2] = fourier[0, 1 : int(mx / mult)] / 2
-        fourier_large[y2, x1:x2] = fourier[0, 1 : int(mx / mult)].flip(0) / 2
-        fourier_large[y1:y2, x1 - 1] = fourier[1 : int(my / mult), 0] / 2
-        fourier_large[y1:y2, x2] = fourier[1 : int(my / mult), 0].flip(0) / 2
-        esq = fourier[0, 0] / 4
-        fourier_large[y1 - 1, x1 - 1] = esq
-        fourier_large[y1 - 1, x2] = esq
-        fourier_large[y2, x1 - 1] = esq
-        fourier_large[y2, x2] = esq
-
-        fourier_large = torch.fft.fftshift(fourier_large)
-
-        # finish this
-        im_large = torch.fft.ifft2(fourier_large)
-
-        return im_large.type(im.dtype)
-
-    def _calculate_autocorrelation_skew_kurtosis(self):
+    def _calculate_autocorrelation_skew_kurtosis(self, representation, magnitude_pyr_coeffs,
+                                                 real_pyr_coeffs, scales):
         r"""Calculate the autocorrelation for the real parts and magnitudes of the
         coefficients. Calculate the skew and kurtosis at each scale.
 
+        The statistics of ``scales`` are written into ``representation``.
+
         """
+        # the low-pass images are reconstructed from the coarsest scale down
+        # to the finest requested one
+        finest_scale = min([s for s in scales if isinstance(s, int)], default=self.n_scales)
+        if finest_scale == self.n_scales and "residual_lowpass" not in scales:
+            return
 
+        pixel_var = representation["pixel_statistics"]["var"]
         # low-pass filter the low-pass residual.  We're still not sure why the original matlab code does this...
-        lowpass = self.pyr_coeffs["residual_lowpass"]
+        lowpass = real_pyr_coeffs["residual_lowpass"]
         filter_pyr_coeffs = self.filterPyr.forward(lowpass)
-        reconstructed_image = filter_pyr_coeffs["residual_lowpass"].squeeze()
-
-        # Find the auto-correlation of the low-pass residual
-        channel_size = torch.min(torch.tensor(lowpass.shape[-2:])).to(float)
-        center = int(np.floor([(self.spatial_corr_width - 1) / 2]))
-        le = int(np.min((channel_size / 2 - 1, center)))
+        reconstructed_image = filter_pyr_coeffs["residual_lowpass"]
+
+        # Find the auto-correlation of the low-pass residual. the central
+        # auto-correlation is smaller than spatial_corr_width for small
+        # images, so it only fills the middle of the statistic
+        center = (self.spatial_corr_width - 1) // 2
+        ac, vari = self.compute_autocorrelation(reconstructed_image)
+        le = ac.shape[-1] // 2
+        representation["auto_correlation_reconstructed"][
+            ...,
+            center - le : center + le + 1,
+            center - le : center + le + 1,
+            self.n_scales,
+        ] = ac
         (
-            self.representation["auto_correlation_reconstructed"][
-                center - le : center + le + 1,
-                center - le : center + le + 1,
-                self.n_scales,
-            ],
-            vari,
-        ) = self.compute_autocorrelation(reconstructed_image)
-        (
-            self.representation["skew_reconstructed"][self.n_scales],
-            self.representation["kurtosis_reconstructed"][self.n_scales],
-        ) = self.compute_skew_kurtosis(reconstructed_image, vari)
+            representation["skew_reconstructed"][..., self.n_scales],
+            representation["kurtosis_reconstructed"][..., self.n_scales],
+        ) = self.compute_skew_kurtosis(reconstructed_image, vari, pixel_var)
 
         if self.use_true_correlations:
-            self.representation["std_reconstructed"][self.n_scales] = vari ** 0.5
-
-        for this_scale in range(self.n_scales - 1, -1, -1):
-            for nor in range(0, self.n_orientations):
-                ch = self.magnitude_pyr_coeffs[(this_scale, nor)]
-                channel_size = np.min((ch.shape[-1], ch.shape[-2]))
-                le = int(np.min((channel_size / 2.0 - 1, center)))
-                # Find the auto-correlation of the magnitude band
-                (
-                    self.representation["auto_correlation_magnitude"][
-                        center - le : center + le + 1,
-                        center - le : center + le + 1,
-                        this_scale,
-                        nor,
-                    ],
-                    vari,
-                ) = self.compute_autocorrelation(ch)
-
-            reconstructed_image = (
-                self.__class__.expand(reconstructed_image, 2) / 4.0
-            )
-            reconstructed_image = reconstructed_image.unsqueeze(0).unsqueeze(0)
+            representation["std_reconstructed"][..., self.n_scales] = vari ** 0.5
+
+        for this_scale in range(self.n_scales - 1, finest_scale - 1, -1):
+            # Find the auto-correlation of the magnitude bands, all
+            # orientations at once
+            if this_scale in scales:
+                mags = torch.stack([magnitude_pyr_coeffs[(this_scale, nor)]
+                                    for nor in range(0, self.n_orientations)], dim=-3)
+                ac, _ = self.compute_autocorrelation(mags)
+                le = ac.shape[-1] // 2
+                representation["auto_correlation_magnitude"][
+                    ...,
+                    center - le : center + le + 1,
+                    center - le : center + le + 1,
+                    this_scale,
+                    :,
+                ] = ac.movedim(-3, -1)
+
+            reconstructed_image = upsample_fourier(reconstructed_image, 2) / 4.0
 
             # reconstruct the unoriented band for this scale
             unoriented_band_pyr = self.unoriented_band_pyrs[this_scale]
             unoriented_pyr_coeffs = unoriented_band_pyr.forward(reconstructed_image)
             for ii in range(0, self.n_orientations):
-                unoriented_pyr_coeffs[(0, ii)] = (
-                    self.real_pyr_coeffs[(this_scale, ii)].unsqueeze(0).unsqueeze(0)
-                )
+                unoriented_pyr_coeffs[(0, ii)] = real_pyr_coeffs[(this_scale, ii)]
             unoriented_band = unoriented_band_pyr.recon_pyr(unoriented_pyr_coeffs,levels=[0])
 
             # Add the unoriented band to the image reconstruction
             reconstructed_image = reconstructed_image + unoriented_band
+            if this_scale not in scales:
+                continue
 
             # Find auto-correlation of the reconstructed image
-            (
-                self.representation["auto_correlation_reconstructed"][
-                    center - le : center + le + 1,
-                    center - le : center + le + 1,
-                    this_scale,
-                ],
-                vari,
-            ) = self.compute_autocorrelation(reconstructed_image)
+            ac, vari = self.compute_autocorrelation(reconstructed_image)
+            representation["auto_correlation_reconstructed"][
+                ...,
+                center - le : center + le + 1,
+                center - le : center + le + 1,
+                this_scale,
+            ] = ac
             if self.use_true_correlations:
-                self.representation["std_reconstructed"][this_scale] = vari ** 0.5
+                representation["std_reconstructed"][..., this_scale] = vari ** 0.5
             # Find skew and kurtosis of the reconstructed image
             (
-                self.representation["skew_reconstructed"][this_scale],
-                self.representation["kurtosis_reconstructed"][this_scale],
-            ) = self.compute_skew_kurtosis(reconstructed_image, vari)
+                representation["skew_reconstructed"][..., this_scale],
+                representation["kurtosis_reconstructed"][..., this_scale],
+            ) = self.compute_skew_kurtosis(reconstructed_image, vari, pixel_var)
 
-    def _calculate_crosscorrelations(self):
+    def _calculate_crosscorrelations(self, representation, pyr_coeffs, magnitude_pyr_coeffs,
+                                     real_pyr_coeffs, scales):
         r"""Calculate the cross-orientation and cross-scale correlations for the real parts
         and the magnitudes of the pyramid coefficients.
 
+        The statistics of ``scales`` are written into ``representation``.
+
         """
 
+        n_ori = self.n_orientations
         for this_scale in range(0, self.n_scales):
-            band_num_el = self.real_pyr_coeffs[(this_scale, 0)].numel()
+            # the correlations of the low-pass residual are computed along
+            # with those of the coarsest scale
+            if this_scale not in scales and not (this_scale == self.n_scales - 1
+                                                 and "residual_lowpass" in scales):
+                continue
+            band_shape = real_pyr_coeffs[(this_scale, 0)].shape
+            band_num_el = band_shape[-2] * band_shape[-1]
+            # the rows of this matrix are the magnitude and real bands of
+            # this scale and their "parents": the (upsampled) bands of the
+            # next scale. all covariances between them are then computed
+            # with a single matmul.
+            rows = [magnitude_pyr_coeffs[(this_scale, nor)] for nor in range(n_ori)]
+            rows += [real_pyr_coeffs[(this_scale, nor)] for nor in range(n_ori)]
             if this_scale < self.n_scales - 1:
-                next_scale_mag = torch.empty((band_num_el, self.n_orientations),
-                                             device=self.pyr.hi0mask.device)
-                next_scale_real = torch.empty((band_num_el, self.n_orientations * 2),
-                                              device=self.pyr.hi0mask.device)
-
-                for nor in range(0, self.n_orientations):
-                    
-                    upsampled = (
-                        self.__class__.expand(
-                            self.pyr_coeffs[(this_scale + 1, nor)].squeeze(), 2
-                        )
-                        / 4.0
-                    )
-
-                    # Here we double the phase of the upsampled band.  This trick
-                    # allows us to find the correlation between content in two adjacent
-                    # spatial scales.
-                    X = upsampled.abs() * torch.cos(
-                        2 * torch.atan2(upsampled.real, upsampled.imag)
-                    )
-                    Y = upsampled.abs() * torch.sin(
-                        2 * torch.atan2(upsampled.real, upsampled.imag)
-                    )
-
-                    # Save the components
-                    next_scale_real[:, nor] = X.t().flatten()
-                    next_scale_real[:, nor + self.n_orientations] = Y.t().flatten()
-
-                    # Save the magnitude
-                    mag = (X ** 2 + Y ** 2) ** 0.5
-                    next_scale_mag[:, nor] = (mag - mag.mean()).t().flatten()
-
+                upsampled = upsample_fourier(
+                    torch.stack([pyr_coeffs[(this_scale + 1, nor)]
+                                 for nor in range(n_ori)], dim=-3), 2
+                ) / 4.0
+
+                # Here we double the phase of the upsampled band.  This trick
+                # allows us to find the correlation between content in two adjacent
+                # spatial scales. The magnitude is that of the upsampled
+                # band, and is shared with the real and imaginary parts of
+                # the phase-doubled band.
+                mag = upsampled.abs()
+                phase = 2 * torch.atan2(upsampled.real, upsampled.imag)
+                X = mag * torch.cos(phase)
+                Y = mag * torch.sin(phase)
+                rows += [*(mag - mag.mean(dim=(-2, -1), keepdim=True)).unbind(-3),
+                         *X.unbind(-3), *Y.unbind(-3)]
+                # the parents of the magnitude and real bands
+                groups = [slice(0, n_ori), slice(n_ori, 2*n_ori),
+                          slice(2*n_ori, 3*n_ori), slice(3*n_ori, 5*n_ori)]
+                n_rows = 2 * n_ori
             else:
-                upsampled = (
-                    self.__class__.expand(
-                        self.real_pyr_coeffs["residual_lowpass"].squeeze(), 2
-                    )
-                    / 4.0
-                )
-                upsampled = upsampled.t()
-                next_scale_real = torch.stack(
-                    (
-                        upsampled.flatten(),
-                        upsampled.roll(1, 0).flatten(),
-                        upsampled.roll(-1, 0).flatten(),
-                        upsampled.roll(1, 1).flatten(),
-                        upsampled.roll(-1, 1).flatten(),
-                    ),
-                    1,
-                )
-                next_scale_mag = torch.empty((0), device=upsampled.device)
-
-            orientation_bands_mag = (
-                torch.stack(
-                    tuple(
-                        [
-                            aa.t()
-                            for aa in [
-                                self.magnitude_pyr_coeffs[(this_scale, ii)]
-                                for ii in range(0, self.n_orientations)
-                            ]
-                        ]
-                    )
-                )
-                .view((self.n_orientations, band_num_el))
-                .t()
-            )
+                # the parents of the coarsest bands are the (upsampled)
+                # low-pass residual and its shifts by one pixel
+                upsampled = upsample_fourier(
+                    real_pyr_coeffs["residual_lowpass"], 2
+                ) / 4.0
+                rows += [
+                    upsampled,
+                    upsampled.roll(1, -1),
+                    upsampled.roll(-1, -1),
+                    upsampled.roll(1, -2),
+                    upsampled.roll(-1, -2),
+                ]
+                # the magnitude bands have no parents, and we also need the
+                # covariances among those of the real bands
+                groups = [slice(0, n_ori), slice(n_ori, 2*n_ori), None,
+                          slice(2*n_ori, 2*n_ori + 5)]
+                n_rows = 2*n_ori + 5
+            # matrix of shape (batch, channel, bands, pixels)
+            bands = torch.stack(rows, dim=-3).flatten(-2)
+            covariances = bands[..., :n_rows, :] @ bands.transpose(-1, -2)
+            # the variance and mean of each band, for normalizing
+            mean = bands.mean(dim=-1)
+            moments = ((bands - mean.unsqueeze(-1)).pow(2).mean(dim=-1), mean, bands.shape[-1])
+
+            mag_cols, real_cols, mag_parents, real_parents = groups
+            representation["cross_orientation_correlation_magnitude"][
+                ..., 0 : n_ori, 0 : n_ori, this_scale
+            ] = self.compute_crosscorrelation(covariances, moments, mag_cols, mag_cols, band_num_el)
+            representation["cross_orientation_correlation_real"][
+                ..., 0 : n_ori, 0 : n_ori, this_scale
+            ] = self.compute_crosscorrelation(covariances, moments, real_cols, real_cols, band_num_el)
+
+            if mag_parents is not None:
+                representation["cross_scale_correlation_magnitude"][
+                    ..., 0 : n_ori, 0 : n_ori, this_scale
+                ] = self.compute_crosscorrelation(covariances, moments, mag_cols, mag_parents,
+                                                  band_num_el)
+            nrp = real_parents.stop - real_parents.start
+            representation["cross_scale_correlation_real"][
+                ..., 0 : n_ori, 0:nrp, this_scale
+            ] = self.compute_crosscorrelation(covariances, moments, real_cols, real_parents,
+                                              band_num_el)
+            if this_scale == self.n_scales - 1:
+                # correlations on the low-pass residuals
+                representation["cross_orientation_correlation_real"][
+                    ..., 0:nrp, 0:nrp, this_scale + 1
+                ] = self.compute_crosscorrelation(covariances, moments, real_parents, real_parents,
+                                                  band_num_el / 4.0)
+            if self.n_channels is not None:
+                self._calculate_cross_channel_correlations(representation, bands, moments,
+                                                           this_scale)
+
+    def _calculate_cross_channel_correlations(self, representation, bands, moments, this_scale):
+        r"""Calculate the correlations between the bands of each pair of channels.
+
+        ``bands`` and ``moments`` are the matrix of bands of ``this_scale``
+        and their moments, as computed by ``_calculate_crosscorrelations``:
+        the covariances between the magnitude and real bands of all channels
+        (and, at the coarsest scale, their upsampled low-pass residuals) are
+        computed with a single matmul. The correlations are written into
+        ``representation``.
 
-            if next_scale_mag.shape[0] > 0:
-                np0 = next_scale_mag.shape[1]
+        """
+        n_ori = self.n_orientations
+        groups = OrderedDict(magnitude=slice(0, n_ori), real=slice(n_ori, 2 * n_ori))
+        if this_scale == self.n_scales - 1:
+            groups["lowpass"] = slice(2 * n_ori, 2 * n_ori + 1)
+        n_rows = max(group.stop for group in groups.values())
+        # matrix of shape (batch, channel * bands, pixels)
+        joint = bands[..., :n_rows, :].flatten(-3, -2)
+        covariances = (joint @ joint.transpose(-1, -2)) / bands.shape[-1]
+        # of shape (batch, channel, bands, channel, bands)
+        covariances = covariances.unflatten(-1, (self.n_channels, n_rows)).unflatten(
+            -3, (self.n_channels, n_rows)
+        )
+        for name, group in groups.items():
+            corr = torch.stack([covariances[:, c1, group, c2, group]
+                                for c1, c2 in self._channel_pairs], dim=1)
+            if self.use_true_correlations:
+                # standard deviation of all the entries of each group
+                std = self._group_std(*moments, group)
+                corr = corr / torch.stack([std[:, c1] * std[:, c2]
+                                           for c1, c2 in self._channel_pairs], dim=1)[..., None, None]
+            if name == "lowpass":
+                representation["cross_channel_correlation_lowpass"] = corr[..., 0, 0]
             else:
-                np0 = 0
+                representation[f"cross_channel_correlation_{name}"][..., this_scale] = corr
 
-            self.representation["cross_orientation_correlation_magnitude"][
-                0 : self.n_orientations, 0 : self.n_orientations, this_scale
-            ] = self.compute_crosscorrelation( orientation_bands_mag.t(), orientation_bands_mag, band_num_el)
+    @staticmethod
+    def _group_std(var, mean, n_pixels, group):
+        r"""Standard deviation of all the entries of a group of bands, from the variance and mean of each
 
-            if np0 > 0:
-                self.representation["cross_scale_correlation_magnitude"][
-                    0 : self.n_orientations, 0:np0, this_scale
-                ] = self.compute_crosscorrelation(
-                    orientation_bands_mag.t(), next_scale_mag, band_num_el
-                )
+        This is the (unbiased) standard deviation of ``bands[..., group,
+        :]``, without having to index into ``bands``.
 
-                # correlations on the low-pass residuals
-                if this_scale == self.n_scales - 1:
-                    self.representation["cross_orientation_correlation_magnitude"][
-                        0:np0, 0:np0, this_scale + 1
-                    ] = self.compute_crosscorrelation(
-                        next_scale_mag.t(), next_scale_mag, band_num_el / 4.0
-                    )
-
-            orientation_bands_real = (
-                torch.stack(
-                    tuple(
-                        [
-                            aa.t()
-                            for aa in [
-                                self.real_pyr_coeffs[(this_scale, ii)].squeeze()
-                                for ii in range(0, self.n_orientations)
-                            ]
-                        ]
-                    )
-                )
-                .view((self.n_orientations, band_num_el))
-                .t()
-            )
+        """
+        mean = mean[..., group]
+        sum_sq = n_pixels * (var[..., group] + (mean - mean.mean(-1, keepdim=True)).pow(2)).sum(-1)
+        return (sum_sq / (n_pixels * mean.shape[-1] - 1)).sqrt()
 
-            if next_scale_real.shape[0] > 0:
-                nrp = next_scale_real.shape[1]
-            else:
-                nrp = 0
-            self.representation["cross_orientation_correlation_real"][
-                0 : self.n_orientations, 0 : self.n_orientations, this_scale
-            ] = self.compute_crosscorrelation(
-                orientation_bands_real.t(), orientation_bands_real, band_num_el
-            )
-            if nrp > 0:
-                self.representation["cross_scale_correlation_real"][
-                    0 : self.n_orientations, 0:nrp, this_scale
-                ] = self.compute_crosscorrelation(
-                    orientation_bands_real.t(), next_scale_real, band_num_el
-                )
-                if (
-                    this_scale == self.n_scales - 1
-                ):  # correlations on the low-pass residuals
-                    self.representation["cross_orientation_correlation_real"][
-                        0:nrp, 0:nrp, this_scale + 1
-                    ] = self.compute_crosscorrelation(
-                        next_scale_real.t(), next_scale_real, (band_num_el / 4.0)
-                    )
-
-    def compute_crosscorrelation(self, ch1, ch2, band_num_el):
-        r"""Computes either the covariance of the two matrices or the cross-correlation
+    def compute_crosscorrelation(self, covariances, moments, rows, cols, band_num_el):
+        r"""Computes either the covariance of two groups of bands or their cross-correlation
         depending on the value self.use_true_correlations.
 
         Parameters
         ----------
-        ch1: torch.Tensor
-            First matrix for cross correlation.
-        ch2: torch.Tensor
-            Second matrix for cross correlation.
+        covariances: torch.Tensor
+            Products of the rows of a matrix of bands of shape (...,
+            n_bands, pixels), of shape (..., n_rows, n_bands), i.e.,
+            ``bands[..., :n_rows, :] @ bands.transpose(-1, -2)``.
+        moments: tuple
+            The (biased) variance and mean of each band, each of shape
+            (..., n_bands), and the number of pixels of the bands.
+        rows: slice
+            Rows of bands in the first group (at most n_rows).
+        cols: slice
+            Rows of bands in the second group.
         band_num_el: int
             Number of elements for bands in the scale
 
         Returns
         -------
         torch.Tensor
-            cross-correlation.
+            cross-correlation, of shape (..., len(rows), len(cols)).
 
         """
 
         if self.use_true_correlations:
-            return ch1 @ ch2 / (band_num_el * ch1.std() * ch2.std())
+            # standard deviation of all the entries of each group
+            std1 = self._group_std(*moments, rows)[..., None, None]
+            std2 = self._group_std(*moments, cols)[..., None, None]
+            return covariances[..., rows, cols] / (band_num_el * std1 * std2)
         else:
-            return ch1 @ ch2 / (band_num_el)
+            return covariances[..., rows, cols] / (band_num_el)
+
+    def _autocorrelation_indices(self, shape, device):
+        r"""Get the indices of the central auto-correlation of images of ``shape``
+
+        The central auto-correlation contains the shifts from ``-le`` to
+        ``le`` (in both dimensions), where ``le`` is the smaller of half
+        of ``spatial_corr_width`` and half the size of the image (minus
+        one). In the unshifted output of the inverse fft, negative shifts
+        wrap around to the end. The indices are computed once per shape and
+        device.
+
+        Returns
+        -------
+        rows, cols: torch.Tensor
+            Indices such that ``ac[..., rows, cols]`` is the central
+            auto-correlation.
+
+        """
+        key = (tuple(shape), device)
+        if key not in self._autocorr_indices:
+            center = (self.spatial_corr_width - 1) // 2
+            le = int(min(min(shape) / 2.0 - 1, center))
+            shifts = torch.arange(-le, le + 1, device=device)
+            self._autocorr_indices[key] = ((shifts % shape[0]).unsqueeze(-1),
+                                           shifts % shape[1])
+        return self._autocorr_indices[key]
 
     def compute_autocorrelation(self, ch):
         r"""Computes the autocorrelation and variance of a given matrix (ch)
@@ -809,42 +1268,36 @@ class PortillaSimoncelli(nn.Module):
         Parameters
         ----------
         ch: torch.Tensor
+            Tensor whose last two dimensions are the matrix.
 
         Returns
         -------
         ac: torch.Tensor
-            Autocorrelation of matrix (ch).
+            Autocorrelation of matrix (ch), with the leading dimensions of
+            ch.
         vari: torch.Tensor
-            Variance of matrix (ch).
+            Variance of matrix (ch), with the leading dimensions of ch.
 
         """
 
-        channel_size = torch.min(torch.tensor(ch.shape[-2:])).to(float)
+        rows, cols = self._autocorrelation_indices(ch.shape[-2:], ch.device)
 
-        # Calculate the edges of the central auto-correlation
-        center = int(np.floor([(self.spatial_corr_width - 1) / 2]))
-        le = int(np.min((channel_size / 2.0 - 1, center)))  # center of the image ???
-
-        # Find the center of the channel
-        cy = int(ch.shape[-1] / 2)
-        cx = int(ch.shape[-2] / 2)
-
-        # Calculate the auto-correlation
-        ac = torch.fft.fft2(ch.squeeze())
+        # Calculate the auto-correlation, using the real-valued fft
+        ac = torch.fft.rfft2(ch)
         ac = ac.real.pow(2) + ac.imag.pow(2)
-        ac = torch.fft.ifft2(ac)
-        ac = torch.fft.fftshift(ac.unsqueeze(0)).squeeze() / torch.numel(ch)
+        ac = torch.fft.irfft2(ac, s=ch.shape[-2:]) / (ch.shape[-2] * ch.shape[-1])
 
         # Return only the central auto-correlation
-        ac = ac.real[cx - le : cx + le + 1, cy - le : cy + le + 1]
-        vari = ac[le, le]
+        ac = ac[..., rows, cols]
+        le = ac.shape[-1] // 2
+        vari = ac[..., le, le]
 
         if self.use_true_correlations:
-            ac = ac / vari
+            ac = ac / vari[..., None, None]
 
         return ac, vari
 
-    def compute_skew_kurtosis(self, ch, vari):
+    def compute_skew_kurtosis(self, ch, vari, pixel_var):
         r"""Computes the skew and kurtosis of ch.
 
         Skew and kurtosis of ch are computed.  If the ratio of its variance (vari)
@@ -854,8 +1307,12 @@ class PortillaSimoncelli(nn.Module):
         Parameters
         ----------
         ch: torch.Tensor
+            Tensor whose last two dimensions are the matrix.
         vari: torch.Tensor
-            variance of ch
+            variance of ch, with its leading dimensions.
+        pixel_var: torch.Tensor
+            pixel variance of the original image, with the leading
+            dimensions of ch.
 
         Returns
         -------
@@ -866,13 +1323,16 @@ class PortillaSimoncelli(nn.Module):
 
         """
 
-        # Find the skew and the kurtosis of the low-pass residual
-        if vari / self.representation["pixel_statistics"]["var"] > 1e-6:
-            skew = self.__class__.skew(ch, mu=0, var=vari)
-            kurtosis = self.__class__.kurtosis(ch, mu=0, var=vari)
-        else:
-            skew = 0
-            kurtosis = 3
+        # Find the skew and the kurtosis of the low-pass residual. this is
+        # decided separately for each image, and we use a variance of 1 for
+        # those that get the default values, so that neither value nor
+        # gradient is ever nan
+        valid = vari / pixel_var > 1e-6
+        vari = torch.where(valid, vari, torch.ones_like(vari))
+        skew = self.__class__.skew(ch, mu=0, var=vari)
+        skew = torch.where(valid, skew, torch.zeros_like(skew))
+        kurtosis = self.__class__.kurtosis(ch, mu=0, var=vari)
+        kurtosis = torch.where(valid, kurtosis, torch.full_like(kurtosis, 3))
 
         return skew, kurtosis
 
@@ -883,23 +1343,29 @@ class PortillaSimoncelli(nn.Module):
         Parameters
         ----------
         X: torch.Tensor
-            matrix to compute the skew of.
+            matrix to compute the skew of, or tensor whose last two
+            dimensions are the matrices.
         mu: torch.Tensor or None, optional
-            pre-computed mean. If None, we compute it.
+            pre-computed mean, with the leading dimensions of X. If None,
+            we compute it.
         var: torch.Tensor or None, optional
-            pre-computed variance. If None, we compute it.
+            pre-computed variance, with the leading dimensions of X. If
+            None, we compute it.
 
         Returns
         -------
         skew: torch.Tensor
-            skew of the matrix X
+            skew of the matrix X, with its leading dimensions
 
         """
         if mu is None:
-            mu = X.mean()
+            mu = X.mean(dim=(-2, -1))
         if var is None:
-            var = X.var()
-        return torch.mean((X - mu).pow(3)) / (var.pow(1.5))
+            var = X.var(dim=(-2, -1))
+        if torch.is_tensor(mu):
+            # (numbers are used as they are, without copying them to the device)
+            mu = mu[..., None, None]
+        return torch.mean((X - mu).pow(3), dim=(-2, -1)) / (var.pow(1.5))
     
     @staticmethod
     def kurtosis(X, mu=None, var=None):
@@ -908,30 +1374,35 @@ class PortillaSimoncelli(nn.Module):
         Parameters
         ----------
         X: torch.Tensor
-            matrix to compute the kurtosis of.
+            matrix to compute the kurtosis of, or tensor whose last two
+            dimensions are the matrices.
         mu: torch.Tensor
-            pre-computed mean. If None, we compute it.
+            pre-computed mean, with the leading dimensions of X. If None,
+            we compute it.
         var: torch.Tensor
-            pre-computed variance. If None, we compute it.
+            pre-computed variance, with the leading dimensions of X. If
+            None, we compute it.
 
         Returns
         -------
         kurtosis: torch.Tensor
-            kurtosis of the matrix X
+            kurtosis of the matrix X, with its leading dimensions
 
         """
         # implementation is only for real components
         if mu is None:
-            mu = X.mean()
+            mu = X.mean(dim=(-2, -1))
         if var is None:
-            var = X.var()
-        return torch.mean(torch.abs(X - mu).pow(4)) / (var.pow(2))
+            var = X.var(dim=(-2, -1))
+        if torch.is_tensor(mu):
+            mu = mu[..., None, None]
+        return torch.mean(torch.abs(X - mu).pow(4), dim=(-2, -1)) / (var.pow(2))
 
 
 
 
     def plot_representation(
-        self, data=None, ax=None, figsize=(15, 15), ylim=None, batch_idx=0, title=None
+        self, data, ax=None, figsize=(15, 15), ylim=None, batch_idx=0, title=None
     ):
 
         r""" Plot the representation in a human viewable format -- stem
@@ -940,12 +1411,11 @@ class PortillaSimoncelli(nn.Module):
         
         Parameters
         ----------
-        data : torch.Tensor, dict, or None, optional
-            The data to show on the plot. If None, we use
-            ``self.representation``. Else, should look like
-            ``self.representation``, with the exact same structure
-            (e.g., as returned by ``metamer.representation_error()`` or
-            another instance of this class).
+        data : torch.Tensor or dict
+            The data to show on the plot: the statistics vector (e.g., as
+            returned by ``forward`` or ``metamer.representation_error()``),
+            or the dictionary of statistics returned by ``forward`` in its
+            intermediates (see ``convert_to_dict``).
         ax : 
             axis where we will plot the data
         figsize : (int, int), optional
@@ -967,10 +1437,12 @@ class PortillaSimoncelli(nn.Module):
         n_rows = 3
         n_cols = 3
 
-        if data is None:
-            rep = self.representation
-        else:
-            rep = self.convert_to_dict(data)
+        if isinstance(data, dict):
+            data = self.convert_to_vector(data)
+        if data.ndim == 3:
+            # only plot a single image (and its first channel)
+            data = data[batch_idx, 0]
+        rep = self.convert_to_dict(data)
 
         data = self._representation_for_plotting(rep)
 
@@ -1010,11 +1482,20 @@ class PortillaSimoncelli(nn.Module):
 
 
 
-    def _representation_for_plotting(self, rep, batch_idx=0):
+    def _representation_for_plotting(self, rep):
         r""" Converts the data into a dictionary representation that is more convenient for plotting.  Intended
         as a helper function for plot_representation.
 
+        With ``n_channels``, only the statistics of the first channel are
+        shown.
+
         """
+        if self.n_channels is not None:
+            rep = OrderedDict(
+                (k, OrderedDict((kk, vv[0]) for kk, vv in v.items())
+                 if isinstance(v, OrderedDict) else v[0])
+                for k, v in rep.items() if not k.startswith("cross_channel")
+            )
         data = OrderedDict()
         data["pixels+var_highpass"] = rep["pixel_statistics"]
         data["pixels+var_highpass"]["var_highpass_residual"] = rep[
@@ -1089,12 +1570,8 @@ class PortillaSimoncelli(nn.Module):
             in the correct order.
         batch_idx : int, optional
             Which index to take from the batch dimension (the first one)
-        data : torch.Tensor, dict, or None, optional
-            The data to show on the plot. If None, we use
-            ``self.representation``. Else, should look like
-            ``self.representation``, with the exact same structure
-            (e.g., as returned by ``metamer.representation_error()`` or
-            another instance of this class).
+        data : torch.Tensor or dict
+            The data to show on the plot, as for ``plot_representation``.
 
         Returns
         -------
@@ -1105,9 +1582,12 @@ class PortillaSimoncelli(nn.Module):
         """
         stem_artists = []
         axes = [ax for ax in axes if len(ax.containers) == 1]
-        if not isinstance(data, dict):
-            data = self.convert_to_dict(data)
-        rep = self._representation_for_plotting(data)
+        if isinstance(data, dict):
+            data = self.convert_to_vector(data)
+        if data.ndim == 3:
+            # only plot a single image (and its first channel)
+            data = data[batch_idx, 0]
+        rep = self._representation_for_plotting(self.convert_to_dict(data))
         for ax, d in zip(axes, rep.values()):
             if isinstance(d, dict):
                 vals = np.array([dd.detach() for dd in d.values()])
@@ -1155,6 +1635,12 @@ class PortillaSimoncelli(nn.Module):
         """
         self.pyr = self.pyr.to(*args, **kwargs)
         self.filterPyr = self.filterPyr.to(*args, **kwargs)
+        # (a shape-polymorphic model uses the same pyramid for all scales, so
+        # that pyramid gets moved more than once, which is harmless)
         self.unoriented_band_pyrs = [pyr.to(*args, **kwargs) for pyr in
                                      self.unoriented_band_pyrs]
+        # cache the constants for the device and dtype we ended up with, read
+        # back from the pyramid (e.g., "cuda" is "cuda:0" for the tensors on
+        # it, and to() may change only one of the two)
+        self._cache_constants(self.pyr._dtype_ref.device, self.pyr._dtype_ref.dtype)
         return self
@@ -3,3 +3,4 @@ from .metamer import Metamer
 from .geodesic import Geodesic
 from .mad_competition import MADCompetition
 from .simple_metamer import SimpleMetamer
+from .portilla_simoncelli_metamer import PortillaSimoncelliMetamer
@@ -0,0 +1,710 @@
+"""Synthesize Portilla-Simoncelli texture metamers by projection."""
+import functools
+import math
+import time
+import torch
+from torch import Tensor
+from tqdm.auto import tqdm
+from collections import OrderedDict
+from typing import Union, Dict
+from .synthesis import Synthesis
+from .metamer import Metamer
+from ..simulate.models.portilla_simoncelli import PortillaSimoncelli
+from ..tools import optim
+from ..tools.signal import upsample_fourier
+
+
+class PortillaSimoncelliMetamer(Synthesis):
+    r"""Synthesize metamers for the Portilla-Simoncelli texture model by projection.
+
+    Rather than descending the gradient of the representation error, like
+    ``Metamer``, this follows the original algorithm of [1]_: on each
+    iteration, the synthesized image is decomposed with the steerable
+    pyramid, the statistics of ``target_signal`` are imposed, coarse to
+    fine, by direct projections onto the magnitudes and real parts of the
+    coefficients and onto the low-pass images reconstructed from them, and
+    the image is reconstructed and its pixel statistics imposed. This
+    typically converges in a few tens of iterations, each of which costs
+    about as much as a couple of evaluations of the model.
+
+    The projections impose the original, unnormalized statistics (those of
+    a ``PortillaSimoncelli`` model with ``use_true_correlations=False``,
+    whose pyramids are used throughout), but progress is measured with the
+    representation error of ``model``. Each image and channel is synthesized
+    separately.
+
+    Parameters
+    ----------
+    target_signal :
+        A 4d tensor, this is the image whose representation we wish to
+        match.
+    model :
+        The ``PortillaSimoncelli`` model whose representation we wish to
+        match (without ``n_channels``). Only its number of scales and
+        orientations and its ``spatial_corr_width`` are used by the
+        projections.
+    initial_image :
+        4d Tensor to initialize our metamer with. If None, we draw a sample
+        of Gaussian noise with the mean and variance of ``target_signal``.
+
+    Attributes
+    ----------
+    target_model_response : torch.Tensor
+        ``model(target_signal)``, the representation we match.
+    synthesized_signal : torch.Tensor
+        The metamer. This may be unfinished depending on how many
+        iterations we've run for.
+    losses : list
+        The representation error (the mean-squared error between the
+        representations of ``synthesized_signal`` and ``target_signal``)
+        of the initial image and after each iteration.
+    times : list
+        The wall-clock time (in seconds) spent synthesizing when each of the
+        ``losses`` was reached.
+
+    References
+    ----------
+    .. [1] J Portilla and E P Simoncelli. A Parametric Texture Model
+       based on Joint Statistics of Complex Wavelet Coefficients. Int'l
+       Journal of Computer Vision. 40(1):49-71, October, 2000.
+       http://www.cns.nyu.edu/~eero/ABSTRACTS/portilla99-abstract.html
+       http://www.cns.nyu.edu/~lcv/texture/
+
+    """
+
+    def __init__(self, target_signal: Tensor, model: PortillaSimoncelli,
+                 initial_image: Union[None, Tensor] = None):
+        if not isinstance(model, PortillaSimoncelli):
+            raise Exception("model must be a PortillaSimoncelli model, but got "
+                            f"{type(model)}")
+        if model.n_channels is not None:
+            raise Exception("models with n_channels are not supported, the "
+                            "channels are synthesized separately")
+        if target_signal.ndimension() < 4:
+            raise Exception("target_signal must be torch.Size([n_batch, "
+                            "n_channels, im_height, im_width]) but got "
+                            f"{target_signal.size()}")
+        self.model = model
+        self.target_signal = target_signal
+        self._signal_shape = target_signal.shape
+        self.target_model_response = self.model(self.target_signal).detach()
+        # the model used for the projections, with the unnormalized statistics
+        self._projection_model = PortillaSimoncelli(
+            target_signal.shape[-2:], n_scales=model.n_scales,
+            n_orientations=model.n_orientations,
+            spatial_corr_width=model.spatial_corr_width,
+            use_true_correlations=False,
+        ).to(target_signal.device)
+        self._init_target_statistics()
+        self.losses = []
+        self.times = []
+        self._init_synthesized_signal(initial_image)
+
+    def _init_target_statistics(self):
+        r"""Compute the statistics of ``target_signal`` that the projections impose"""
+        with torch.no_grad():
+            _, intermediates = self._projection_model(self.target_signal,
+                                                      return_intermediates=True)
+        self._target_statistics = intermediates['representation']
+        # the masks that make the bands analytic, see _analytic
+        self._analytic_masks = {}
+
+    def _init_synthesized_signal(self, initial_image: Union[None, Tensor] = None):
+        """Initialize the synthesized image.
+
+        Parameters
+        ----------
+        initial_image :
+            The tensor we use to initialize the metamer. If None (the
+            default), we initialize with Gaussian noise with the mean and
+            variance of ``target_signal``.
+
+        """
+        if initial_image is None:
+            pixel_statistics = self._target_statistics['pixel_statistics']
+            synthesized_signal = (torch.randn_like(self.target_signal)
+                                  * pixel_statistics['var'].sqrt()[..., None, None]
+                                  + pixel_statistics['mean'][..., None, None])
+        else:
+            synthesized_signal = initial_image.clone().detach()
+            synthesized_signal = synthesized_signal.to(dtype=self.target_signal.dtype,
+                                                       device=self.target_signal.device)
+            if synthesized_signal.ndimension() < 4:
+                raise Exception("synthesized_signal must be torch.Size([n_batch"
+                                ", n_channels, im_height, im_width]) but got "
+                                f"{synthesized_signal.size()}")
+            if synthesized_signal.size() != self.target_signal.size():
+                raise Exception("synthesized_signal and target_signal must be"
+                                " same size!")
+        self.synthesized_signal = synthesized_signal
+        self.losses.append(self._representation_error())
+        self.times.append(0.)
+
+    def _representation_error(self) -> float:
+        r"""The mean-squared error between the representations of the metamer and the target"""
+        with torch.no_grad():
+            return optim.mse(self.model(self.synthesized_signal),
+                             self.target_model_response).item()
+
+    def synthesize(self, max_iter: int = 50,
+                   stop_criterion: Union[None, float] = None) -> Tensor:
+        r"""Synthesize a metamer.
+
+        If called multiple times, will continue where we left off.
+
+        Parameters
+        ----------
+        max_iter :
+            The maximum number of iterations to run.
+        stop_criterion :
+            If not None, we stop as soon as the representation error is
+            below this value.
+
+        Returns
+        -------
+        synthesized_signal : torch.Tensor
+            The metamer we've created
+
+        """
+        pbar = tqdm(range(max_iter))
+        for i in pbar:
+            start = time.perf_counter()
+            with torch.no_grad():
+                self.synthesized_signal = self._project(self.synthesized_signal)
+            loss = self._representation_error()
+            self.times.append(self.times[-1] + time.perf_counter() - start)
+            self.losses.append(loss)
+            pbar.set_postfix(loss=f"{loss:.04e}")
+            if stop_criterion is not None and loss < stop_criterion:
+                break
+        pbar.close()
+        return self.synthesized_signal
+
+    def _project(self, image: Tensor) -> Tensor:
+        r"""Impose the statistics of ``target_signal`` on ``image``, once
+
+        This is one iteration of the original algorithm: the statistics of
+        the low-pass residual, then those of each scale, from coarse to
+        fine, then those of the high-pass residual and of the pixels.
+
+        """
+        model = self._projection_model
+        stats = self._target_statistics
+        n_ori = model.n_orientations
+        center = (model.spatial_corr_width - 1) // 2
+
+        pyr_coeffs = OrderedDict(model.pyr(image))
+        # the real parts of the coefficients (with the mean of the low-pass
+        # residual subtracted) and their mean-subtracted magnitudes
+        _, magnitude_pyr_coeffs, real_pyr_coeffs = model._calculate_magnitude_means(pyr_coeffs)
+        lowpass = real_pyr_coeffs['residual_lowpass']
+
+        reconstructed_image = model.filterPyr(lowpass)['residual_lowpass']
+        reconstructed_image = self._impose_reconstructed_statistics(reconstructed_image,
+                                                                    model.n_scales)
+
+        for scale in range(model.n_scales - 1, -1, -1):
+            bands = torch.stack([pyr_coeffs[(scale, nor)] for nor in range(n_ori)], dim=-3)
+            band_shape = bands.shape[-2:]
+            # the "parents" of the bands: the (upsampled) bands of the next
+            # scale, which have already been projected, as in
+            # PortillaSimoncelli._calculate_crosscorrelations
+            if scale < model.n_scales - 1:
+                upsampled = upsample_fourier(
+                    torch.stack([pyr_coeffs[(scale + 1, nor)] for nor in range(n_ori)], dim=-3), 2
+                ) / 4.0
+                mag = upsampled.abs()
+                phase = 2 * torch.atan2(upsampled.real, upsampled.imag)
+                parents = (mag - mag.mean(dim=(-2, -1), keepdim=True)).flatten(-2)
+                real_parents = torch.cat([mag * torch.cos(phase), mag * torch.sin(phase)],
+                                         dim=-3).flatten(-2)
+            else:
+                upsampled = upsample_fourier(lowpass, 2) / 4.0
+                parents = None
+                real_parents = torch.stack([
+                    upsampled,
+                    upsampled.roll(1, -1),
+                    upsampled.roll(-1, -1),
+                    upsampled.roll(1, -2),
+                    upsampled.roll(-1, -2),
+                ], dim=-3).flatten(-2)
+
+            # the cross-orientation and cross-scale correlations of the
+            # magnitudes, then their auto-correlations
+            mags = torch.stack([magnitude_pyr_coeffs[(scale, nor)] for nor in range(n_ori)],
+                               dim=-3).flatten(-2)
+            covariance = stats['cross_orientation_correlation_magnitude'][..., :n_ori, :n_ori, scale]
+            if parents is None:
+                mags = _adjust_covariance(mags, covariance)
+            else:
+                mags = _adjust_covariance(mags, covariance, parents,
+                                          stats['cross_scale_correlation_magnitude'][..., scale])
+            le = int(min(min(band_shape) / 2.0 - 1, center))
+            autocorrelation = stats['auto_correlation_magnitude'][
+                ..., center - le : center + le + 1, center - le : center + le + 1, scale, :
+            ].movedim(-1, -3)
+            mags = _impose_autocorrelation(mags.unflatten(-1, band_shape), autocorrelation)
+            # impose the magnitudes, keeping the phases
+            magnitude_means = torch.stack([stats['magnitude_means'][(scale, nor)]
+                                           for nor in range(n_ori)], dim=-1)
+            mags = (mags + magnitude_means[..., None, None]).clamp(min=0)
+            abs_bands = bands.abs()
+            bands = bands * mags / torch.where(abs_bands > 0, abs_bands, torch.ones_like(abs_bands))
+
+            # the correlations of the real parts with their parents, for each
+            # band separately and keeping its variance
+            real = bands.real.flatten(-2).unsqueeze(-2)
+            n_parents = real_parents.shape[-2]
+            real = _adjust_covariance(
+                real, real.pow(2).mean(dim=-1, keepdim=True), real_parents.unsqueeze(-3),
+                stats['cross_scale_correlation_real'][..., :n_ori, :n_parents, scale].unsqueeze(-2)
+            )
+            real = real.squeeze(-2).unflatten(-1, band_shape)
+            bands = self._analytic(real, scale)
+            for nor in range(n_ori):
+                pyr_coeffs[(scale, nor)] = bands[..., nor, :, :]
+
+            # add the unoriented band of this scale to the low-pass image, as
+            # in PortillaSimoncelli._calculate_autocorrelation_skew_kurtosis
+            reconstructed_image = upsample_fourier(reconstructed_image, 2) / 4.0
+            unoriented_band_pyr = model.unoriented_band_pyrs[scale]
+            unoriented_pyr_coeffs = unoriented_band_pyr.forward(reconstructed_image)
+            for nor in range(n_ori):
+                unoriented_pyr_coeffs[(0, nor)] = real[..., nor, :, :]
+            unoriented_band = unoriented_band_pyr.recon_pyr(unoriented_pyr_coeffs, levels=[0])
+            reconstructed_image = self._impose_reconstructed_statistics(
+                reconstructed_image + unoriented_band, scale
+            )
+
+        # the variance of the high-pass residual can only go down
+        highpass = pyr_coeffs['residual_highpass']
+        variance = highpass.pow(2).mean(dim=(-2, -1), keepdim=True)
+        target = stats['var_highpass_residual'][..., None]
+        pyr_coeffs['residual_highpass'] = highpass * (target / variance).sqrt().clamp(max=1)
+        image = reconstructed_image + model.pyr.recon_pyr(pyr_coeffs, levels=['residual_highpass'])
+
+        # the pixel statistics
+        pixel_statistics = {k: v[..., None, None] for k, v in stats['pixel_statistics'].items()}
+        image = image - image.mean(dim=(-2, -1), keepdim=True)
+        image = (image * (pixel_statistics['var'] / image.var(dim=(-2, -1), keepdim=True)).sqrt()
+                 + pixel_statistics['mean'])
+        image = _modify_skew(image, stats['pixel_statistics']['skew'])
+        image = _modify_kurtosis(image, stats['pixel_statistics']['kurtosis'])
+        return image.clamp(pixel_statistics['min'], pixel_statistics['max'])
+
+    def _impose_reconstructed_statistics(self, image: Tensor, scale: int) -> Tensor:
+        r"""Impose the auto-correlation, skew and kurtosis of the low-pass image of ``scale``
+
+        As in the analysis, the low-pass images with a negligible variance
+        only get their variance imposed.
+
+        """
+        stats = self._target_statistics
+        center = (self._projection_model.spatial_corr_width - 1) // 2
+        le = int(min(min(image.shape[-2:]) / 2.0 - 1, center))
+        autocorrelation = stats['auto_correlation_reconstructed'][
+            ..., center - le : center + le + 1, center - le : center + le + 1, scale
+        ]
+        variance = autocorrelation[..., le, le]
+        valid = (variance / stats['pixel_statistics']['var'] > 1e-4)[..., None, None]
+        imposed = _impose_autocorrelation(image, autocorrelation)
+        imposed = _modify_skew(imposed, stats['skew_reconstructed'][..., scale])
+        imposed = _modify_kurtosis(imposed, stats['kurtosis_reconstructed'][..., scale])
+        rescaled = image * (variance[..., None, None]
+                            / image.var(dim=(-2, -1), keepdim=True)).sqrt()
+        return torch.where(valid, imposed, rescaled)
+
+    def _analytic(self, real: Tensor, scale: int) -> Tensor:
+        r"""Get the (complex) bands of ``scale`` whose real parts are ``real``
+
+        The bands of the complex pyramid are analytic: their spectrum is
+        confined to the half of the frequency plane where their angle mask
+        is non-zero. This is the inverse of taking their real part.
+
+        """
+        key = (scale, real.device, real.dtype)
+        if key not in self._analytic_masks:
+            anglemasks = getattr(self._projection_model.pyr, f'_anglemask_{scale}')
+            anglemasks = anglemasks.to(device=real.device, dtype=real.dtype).abs()
+            positive = anglemasks > 1e-6 * anglemasks.amax(dim=(-2, -1), keepdim=True)
+            # the mask at the opposite frequency, in the unshifted layout of fft2
+            negative = positive.flip(-2, -1).roll((1, 1), (-2, -1))
+            self._analytic_masks[key] = (2 * positive + (~positive & ~negative)).to(real.dtype)
+        return torch.fft.ifft2(torch.fft.fft2(real) * self._analytic_masks[key])
+
+    def save(self, file_path: str):
+        r"""Save all relevant (non-model) variables in .pt file.
+
+        Parameters
+        ----------
+        file_path :
+            The path to save the PortillaSimoncelliMetamer object to.
+
+        """
+        attrs = ['target_signal', 'target_model_response', 'synthesized_signal',
+                 'losses', 'times']
+        super().save(file_path, attrs=attrs)
+
+    def load(self, file_path: str,
+             map_location: Union[str, None] = None):
+        r"""Load all relevant attributes from a .pt file.
+
+        Note this operates in place and so doesn't return anything.
+
+        Parameters
+        ----------
+        file_path : str
+            The path to load the synthesis object from
+        """
+        check_attributes = ['target_model_response', 'target_signal']
+        super().load(file_path, check_attributes=check_attributes,
+                     map_location=map_location)
+
+    def to(self, *args, **kwargs):
+        r"""Moves and/or casts the parameters and buffers.
+
+        This can be called as
+
+        .. function:: to(device=None, dtype=None, non_blocking=False)
+
+        .. function:: to(dtype, non_blocking=False)
+
+        .. function:: to(tensor, non_blocking=False)
+
+        Its signature is similar to :meth:`torch.Tensor.to`, but only accepts
+        floating point desired :attr:`dtype` s. In addition, this method will
+        only cast the floating point parameters and buffers to :attr:`dtype`
+        (if given). The integral parameters and buffers will be moved
+        :attr:`device`, if that is given, but with dtypes unchanged. When
+        :attr:`non_blocking` is set, it tries to convert/move asynchronously
+        with respect to the host if possible, e.g., moving CPU Tensors with
+        pinned memory to CUDA devices.
+
+        .. note::
+            This method modifies the module in-place.
+
+        Args:
+            device (:class:`torch.device`): the desired device of the parameters
+                and buffers in this module
+            dtype (:class:`torch.dtype`): the desired floating point type of
+                the floating point parameters and buffers in this module
+            tensor (torch.Tensor): Tensor whose dtype and device are the desired
+                dtype and device for all parameters and buffers in this module
+
+        Returns:
+            Module: self
+        """
+        attrs = ['model', '_projection_model', 'target_signal', 'target_model_response',
+                 'synthesized_signal']
+        super().to(*args, attrs=attrs, **kwargs)
+        self._init_target_statistics()
+        return self
+
+
+def benchmark(target_signal: Tensor, model: PortillaSimoncelli,
+              representation_error: float, max_iter: int = 100,
+              metamer_max_iter: int = 5000, check_every: int = 10,
+              initial_image: Union[None, Tensor] = None,
+              synthesize_kwargs: Dict = {}) -> Dict[str, Dict]:
+    r"""Compare the wall-clock time projection and ``Metamer`` take to reach a representation error
+
+    Both start from the same ``initial_image``, and the representation
+    error is the mean-squared error between the representations of the
+    metamer and of ``target_signal`` under ``model``. The time to compute
+    the representation error is included, and the time to initialize each
+    synthesis isn't.
+
+    Parameters
+    ----------
+    target_signal :
+        A 4d tensor, the image whose representation we wish to match.
+    model :
+        The ``PortillaSimoncelli`` model whose representation we wish to
+        match.
+    representation_error :
+        The representation error to reach.
+    max_iter :
+        The maximum number of iterations of ``PortillaSimoncelliMetamer``.
+    metamer_max_iter :
+        The maximum number of iterations of ``Metamer``.
+    check_every :
+        How often (in iterations) to check the representation error of
+        ``Metamer``, which is then accurate to that many iterations.
+    initial_image :
+        The image both syntheses start from. If None, a sample of uniform
+        noise between 0 and 1.
+    synthesize_kwargs :
+        Additional arguments for ``Metamer.synthesize`` (e.g.,
+        ``optimizer`` or ``coarse_to_fine``).
+
+    Returns
+    -------
+    results : dict
+        For ``'PortillaSimoncelliMetamer'`` and ``'Metamer'``, a dictionary
+        with the ``time`` (in seconds) it took to reach
+        ``representation_error`` (None if it wasn't reached), the number of
+        ``iterations`` run and the final ``representation_error``.
+
+    """
+    if initial_image is None:
+        initial_image = torch.rand_like(target_signal)
+    results = OrderedDict()
+
+    ps_metamer = PortillaSimoncelliMetamer(target_signal, model, initial_image)
+    ps_metamer.synthesize(max_iter, stop_criterion=representation_error)
+    error = ps_metamer.losses[-1]
+    results['PortillaSimoncelliMetamer'] = dict(
+        time=ps_metamer.times[-1] if error < representation_error else None,
+        iterations=len(ps_metamer.losses) - 1, representation_error=error
+    )
+
+    metamer = Metamer(target_signal, model, initial_image=initial_image)
+    elapsed = 0.
+    iterations = 0
+    while iterations < metamer_max_iter:
+        start = time.perf_counter()
+        # (stop_criterion=0 never stops synthesis early)
+        metamer.synthesize(max_iter=check_every, stop_criterion=0, **synthesize_kwargs)
+        with torch.no_grad():
+            error = optim.mse(model(metamer.synthesized_signal),
+                              metamer.target_model_response).item()
+        elapsed += time.perf_counter() - start
+        iterations += check_every
+        if error < representation_error:
+            break
+    results['Metamer'] = dict(
+        time=elapsed if error < representation_error else None,
+        iterations=iterations, representation_error=error
+    )
+    return results
+
+
+@functools.lru_cache(maxsize=32)
+def _autocorrelation_system_indices(shape, le, device):
+    r"""Get the indices of the linear system solved by ``_impose_autocorrelation``
+
+    For the shifts ``l`` and ``k`` of the central auto-correlation (from
+    ``-le`` to ``le`` in both dimensions), ``rows`` and ``cols`` index the
+    shift ``l - k`` in the unshifted output of the inverse fft, and
+    ``positions`` the shift ``k`` in the flattened image.
+
+    """
+    shifts = torch.arange(-le, le + 1, device=device)
+    shifts_y, shifts_x = (s.flatten() for s in torch.meshgrid(shifts, shifts))
+    rows = (shifts_y.unsqueeze(-1) - shifts_y) % shape[0]
+    cols = (shifts_x.unsqueeze(-1) - shifts_x) % shape[1]
+    positions = (shifts_y % shape[0]) * shape[1] + shifts_x % shape[1]
+    return rows, cols, positions
+
+
+def _impose_autocorrelation(x: Tensor, autocorrelation: Tensor) -> Tensor:
+    r"""Filter ``x`` so that its central auto-correlation is ``autocorrelation``
+
+    This is ``modacor22`` of the original matlab code: the auto-correlation
+    of ``x`` filtered with ``h`` is that of ``x`` convolved with the
+    auto-correlation of ``h``, so the latter (restricted to the central
+    shifts) is the solution of a linear system, and ``h`` is the zero-phase
+    filter with the corresponding amplitude spectrum.
+
+    Parameters
+    ----------
+    x :
+        Tensor whose last two dimensions are the (real) images.
+    autocorrelation :
+        The desired central auto-correlation (the mean of the products of
+        the shifted images), of shape (..., 2*le+1, 2*le+1), with the
+        leading dimensions of ``x``.
+
+    Returns
+    -------
+    y :
+        The filtered images.
+
+    """
+    shape = tuple(x.shape[-2:])
+    rows, cols, positions = _autocorrelation_system_indices(
+        shape, autocorrelation.shape[-1] // 2, x.device
+    )
+    xdft = torch.fft.rfft2(x)
+    ac = torch.fft.irfft2(xdft.real.pow(2) + xdft.imag.pow(2), s=shape) / (shape[0] * shape[1])
+    system = ac[..., rows, cols].double()
+    # (regularized, for the images that are (almost) constant)
+    system.diagonal(dim1=-2, dim2=-1).add_(1e-10 * ac[..., :1, 0].double().abs() + 1e-30)
+    filter_ac = torch.linalg.solve(system, autocorrelation.flatten(-2).double()).to(x.dtype)
+    filter_ac = x.new_zeros(*filter_ac.shape[:-1], shape[0] * shape[1]).index_copy(
+        -1, positions, filter_ac
+    )
+    amplitude = torch.fft.rfft2(filter_ac.unflatten(-1, shape)).abs().sqrt()
+    return torch.fft.irfft2(xdft * amplitude, s=shape)
+
+
+def _polynomial_moments(z: Tensor, g: Tensor, degree: int) -> Tensor:
+    r"""The coefficients of the polynomial ``E[(z + lambda * g) ** degree]`` in ``lambda``
+
+    The expectations are the means over the last two dimensions, and the
+    coefficients are ordered from the highest degree.
+
+    """
+    return torch.stack([math.factorial(degree) // (math.factorial(j) * math.factorial(degree - j))
+                        * (z.pow(degree - j) * g.pow(j)).mean(dim=(-2, -1))
+                        for j in range(degree, -1, -1)], dim=-1)
+
+
+def _polymul(a: Tensor, b: Tensor) -> Tensor:
+    r"""Multiply the polynomials with coefficients ``a`` and ``b`` (along the last dimension)"""
+    out = a.new_zeros(*torch.broadcast_shapes(a.shape[:-1], b.shape[:-1]),
+                      a.shape[-1] + b.shape[-1] - 1)
+    for i in range(a.shape[-1]):
+        out[..., i:i + b.shape[-1]] += a[..., i:i + 1] * b
+    return out
+
+
+def _polyval(coeffs: Tensor, x: Tensor) -> Tensor:
+    r"""Evaluate the polynomials with coefficients ``coeffs`` at each of the points ``x``"""
+    out = torch.zeros_like(x)
+    for c in coeffs.unbind(-1):
+        out = out * x + c.unsqueeze(-1)
+    return out
+
+
+def _real_roots(coeffs: Tensor) -> Tensor:
+    r"""Find the real roots of the polynomials with coefficients ``coeffs``
+
+    The roots are the eigenvalues of the companion matrix; those that are
+    not real are nan.
+
+    """
+    degree = coeffs.shape[-1] - 1
+    leading = coeffs[..., :1]
+    leading = torch.where(leading != 0, leading, torch.ones_like(leading))
+    companion = coeffs.new_zeros(*coeffs.shape[:-1], degree, degree)
+    companion[..., 0, :] = -coeffs[..., 1:] / leading
+    companion[..., 1:, :-1] = torch.eye(degree - 1, dtype=coeffs.dtype, device=coeffs.device)
+    roots = torch.linalg.eigvals(companion.nan_to_num(0., 0., 0.))
+    return torch.where(roots.imag.abs() <= 1e-6 * roots.real.abs(), roots.real,
+                       torch.full_like(roots.real, float('nan')))
+
+
+def _smallest_root(roots: Tensor, valid: Tensor) -> Tensor:
+    r"""Get the valid root with the smallest magnitude, or 0 if there is none"""
+    magnitude = torch.where(valid & ~roots.isnan(), roots.abs(),
+                            torch.full_like(roots, float('inf')))
+    smallest, index = magnitude.min(dim=-1)
+    return torch.where(smallest.isfinite(), roots.gather(-1, index.unsqueeze(-1)).squeeze(-1),
+                       torch.zeros_like(smallest))
+
+
+def _standardize(x: Tensor):
+    r"""Standardize the images ``x``, returning their mean and (biased) standard deviation too"""
+    mean = x.mean(dim=(-2, -1), keepdim=True)
+    std = (x - mean).pow(2).mean(dim=(-2, -1), keepdim=True).sqrt()
+    std = torch.where(std > 0, std, torch.ones_like(std))
+    return (x - mean) / std, mean, std
+
+
+def _modify_skew(x: Tensor, skew: Tensor) -> Tensor:
+    r"""Impose the ``skew`` on the images ``x``, keeping their mean and variance
+
+    This is ``modskew`` of the original matlab code: the images move in the
+    direction of the gradient of the skew, by the smallest step that gives
+    the desired skew (if there is none, they are left as they are).
+
+    """
+    z, mean, std = _standardize(x)
+    zd = z.double()
+    skew = skew.double()
+    current = zd.pow(3).mean(dim=(-2, -1))
+    g = zd.pow(2) - 1 - current[..., None, None] * zd
+    # z and g are uncorrelated, so the variance of z + lambda * g is
+    # 1 + var_g * lambda ** 2, and we solve for the square of the skew
+    third_moment = _polynomial_moments(zd, g, 3)
+    var_g = g.pow(2).mean(dim=(-2, -1))
+    one, zero = torch.ones_like(var_g), torch.zeros_like(var_g)
+    variance_cubed = torch.stack([var_g**3, zero, 3 * var_g**2, zero, 3 * var_g, zero, one], dim=-1)
+    roots = _real_roots(_polymul(third_moment, third_moment)
+                        - skew.pow(2).unsqueeze(-1) * variance_cubed)
+    # (moving towards the desired skew, and without flipping its sign)
+    valid = ((roots * (skew - current).unsqueeze(-1) >= 0)
+             & (_polyval(third_moment, roots) * skew.unsqueeze(-1) >= 0))
+    lam = _smallest_root(roots, valid)
+    z = z + lam.to(z.dtype)[..., None, None] * g.to(z.dtype)
+    z = z / z.pow(2).mean(dim=(-2, -1), keepdim=True).sqrt()
+    return z * std + mean
+
+
+def _modify_kurtosis(x: Tensor, kurtosis: Tensor) -> Tensor:
+    r"""Impose the ``kurtosis`` on the images ``x``, keeping their mean and variance
+
+    This is ``modkurt`` of the original matlab code, see ``_modify_skew``.
+
+    """
+    z, mean, std = _standardize(x)
+    zd = z.double()
+    current = zd.pow(4).mean(dim=(-2, -1))
+    g = zd.pow(3) - current[..., None, None] * zd - zd.pow(3).mean(dim=(-2, -1), keepdim=True)
+    # z and g are uncorrelated, so the variance of z + lambda * g is
+    # 1 + var_g * lambda ** 2
+    fourth_moment = _polynomial_moments(zd, g, 4)
+    var_g = g.pow(2).mean(dim=(-2, -1))
+    one, zero = torch.ones_like(var_g), torch.zeros_like(var_g)
+    variance_squared = torch.stack([var_g**2, zero, 2 * var_g, zero, one], dim=-1)
+    roots = _real_roots(fourth_moment - kurtosis.double().unsqueeze(-1) * variance_squared)
+    lam = _smallest_root(roots, torch.ones_like(roots, dtype=torch.bool))
+    z = z + lam.to(z.dtype)[..., None, None] * g.to(z.dtype)
+    z = z / z.pow(2).mean(dim=(-2, -1), keepdim=True).sqrt()
+    return z * std + mean
+
+
+def _adjust_covariance(x: Tensor, covariance: Tensor, y: Union[None, Tensor] = None,
+                       cross_covariance: Union[None, Tensor] = None) -> Tensor:
+    r"""Linearly transform the rows of ``x`` to impose their covariances (and those with ``y``)
+
+    This is ``adjustCorr1s`` and ``adjustCorr2s`` (with the transform that
+    changes ``x`` the least) of the original matlab code. The covariances
+    are the means of the products of the rows, which are not
+    mean-subtracted.
+
+    Parameters
+    ----------
+    x :
+        Tensor of shape (..., n, n_pixels).
+    covariance :
+        The desired covariance of the rows of ``x``, of shape (..., n, n).
+    y :
+        Tensor of shape (..., m, n_pixels), which is not modified.
+    cross_covariance :
+        The desired covariance between the rows of ``x`` and ``y``, of
+        shape (..., n, m).
+
+    Returns
+    -------
+    new_x :
+        The transformed ``x``.
+
+    """
+    n_pixels = x.shape[-1]
+    current = (x @ x.transpose(-1, -2) / n_pixels).double()
+    covariance = covariance.double()
+    if y is not None:
+        current_cross = (x @ y.transpose(-1, -2) / n_pixels).double()
+        cross_covariance = cross_covariance.double()
+        inv_y = torch.linalg.pinv((y @ y.transpose(-1, -2) / n_pixels).double(), hermitian=True)
+        # the covariances of the part of x that's not explained by y
+        current = current - current_cross @ inv_y @ current_cross.transpose(-1, -2)
+        covariance = covariance - cross_covariance @ inv_y @ cross_covariance.transpose(-1, -2)
+    eigvals, eigvecs = torch.linalg.eigh(current)
+    target_eigvals, target_eigvecs = torch.linalg.eigh(covariance)
+    tiny = 1e-12 * eigvals.amax(dim=-1, keepdim=True).clamp(min=1e-30)
+    std = eigvals.clamp(min=tiny).sqrt()
+    target_std = target_eigvals.clamp(min=tiny).sqrt()
+    # the rotation between the whitened current and target rows that is
+    # closest to the identity
+    u, _, vh = torch.linalg.svd(std.unsqueeze(-1) * (eigvecs.transpose(-1, -2) @ target_eigvecs)
+                                / target_std.unsqueeze(-2))
+    mx = ((eigvecs / std.unsqueeze(-2)) @ (u @ vh)
+          @ (target_std.unsqueeze(-1) * target_eigvecs.transpose(-1, -2)))
+    new_x = mx.transpose(-1, -2).to(x.dtype) @ x
+    if y is not None:
+        my = inv_y @ (cross_covariance.transpose(-1, -2) - current_cross.transpose(-1, -2) @ mx)
+        new_x = new_x + my.transpose(-1, -2).to(x.dtype) @ y
+    return new_x
@@ -1,3 +1,4 @@
+import functools
 import numpy as np
 import torch
 import torch.fft as fft
@@ -198,30 +199,51 @@ def interpolate1d(x_new, Y, X):
 
     Returns the one-dimensional piecewise linear interpolant to a
     function with given discrete data points (X, Y), evaluated at x_new.
+    Values of x_new outside of the range of X get the first or last value
+    of Y, like ``np.interp()``.
 
-    Note: this function is just a wrapper around ``np.interp()``.
+    If x_new is a tensor, the interpolation is done with torch, on its
+    device. Otherwise, this is just a wrapper around ``np.interp()``.
 
     Parameters
     ----------
-    x_new: torch.Tensor
+    x_new: torch.Tensor or array_like
         The x-coordinates at which to evaluate the interpolated values.
     Y: array_like
         The y-coordinates of the data points.
     X: array_like
-        The x-coordinates of the data points, same length as X.
+        The x-coordinates of the data points, same length as X. Must be
+        increasing.
 
     Returns
     -------
-    Interpolated values of shape identical to `x_new`.
+    Interpolated values of shape identical to `x_new` (and, if it's a
+    tensor, with the same dtype and device).
 
     TODO
     ----
-    rename and reorder arguments, refactor corresponding use in SteerablePyr
+    rename and reorder arguments
     """
-
-    out = np.interp(x=x_new.flatten(), xp=X, fp=Y)
-
-    return np.reshape(out, x_new.shape)
+    if not torch.is_tensor(x_new):
+        out = np.interp(x=x_new.flatten(), xp=X, fp=Y)
+        return np.reshape(out, x_new.shape)
+
+    X = torch.as_tensor(X, dtype=x_new.dtype, device=x_new.device)
+    Y = torch.as_tensor(Y, dtype=x_new.dtype, device=x_new.device)
+    # start and slope of each of the segments, where segment i ends at
+    # X[i]. the first and last segments are constant, for extrapolation
+    dX = X[1:] - X[:-1]
+    slope = (Y[1:] - Y[:-1]) / dX
+    slope = torch.cat([slope.new_zeros(1), slope, slope.new_zeros(1)])
+    if torch.allclose(dX, dX.mean()):
+        # evenly spaced (e.g., lookup tables): we can find the segments
+        # directly, which is much faster than searching for them
+        idx = (x_new - X[0]).div_(dX.mean()).ceil_().clamp_(0, len(X)).long()
+    else:
+        idx = torch.searchsorted(X, x_new.contiguous())
+    X = torch.cat([X[:1], X])
+    Y = torch.cat([Y[:1], Y])
+    return (x_new - X.take(idx)).mul_(slope.take(idx)).add_(Y.take(idx))
 
 
 def rectangular_to_polar(x):
@@ -341,6 +363,119 @@ def autocorr(x, n_shifts=7):
                                   (W//2-n_shifts//2):(W//2+(n_shifts+1)//2)]
     return autocorr
 
+@functools.lru_cache(maxsize=128)
+def _upsample_fourier_indices(shape, factor, real, device, dtype):
+    r"""Cached index maps used by ``upsample_fourier``, for hashable arguments
+
+    Returns ``(dst, src, weight)``, such that the upsampled spectrum,
+    flattened over its last two dimensions, is the sum of
+    ``weight * spectrum[..., src]`` over the entries sharing the same ``dst``.
+    For real signals, ``spectrum`` is the flattened ``rfft2`` of the signal
+    followed by its complex conjugate, so that the negative frequencies can be
+    read from the half spectrum.
+
+    """
+    entries = []
+    for n in shape:
+        # (destination frequency, weight) of each frequency of the input. An
+        # even-sized signal has a single Nyquist frequency, which is split
+        # evenly between the positive and negative Nyquist frequency of the
+        # larger spectrum.
+        freqs = [(f, 1.) for f in range(-((n - 1) // 2), (n - 1) // 2 + 1)]
+        if n % 2 == 0:
+            freqs += [(-(n // 2), .5), (n // 2, .5)]
+        entries.append(freqs)
+    (h, w), (H, W) = shape, (factor * shape[0], factor * shape[1])
+
+    terms = []
+    for fy, wy in entries[0]:
+        for fx, wx in entries[1]:
+            # as in matlabPyrTools' ``expand``, the copies at the positive
+            # Nyquist frequencies are taken from the reflected frequency
+            reflect = (h % 2 == 0 and fy == h // 2) or (w % 2 == 0 and fx == w // 2)
+            sy, sx = (-fy, -fx) if reflect else (fy, fx)
+            terms.append((fy, fx, sy, sx, factor ** 2 * wy * wx))
+            if real:
+                # for real signals, only the real part of the inverse
+                # transform is kept, i.e. the hermitian part of the spectrum,
+                # whose conjugate symmetric terms are read from the reflected
+                # frequencies
+                terms[-1] = (fy, fx, sy, sx, terms[-1][-1] / 2)
+                terms.append((-fy, -fx, -sy, -sx, terms[-1][-1]))
+    fy, fx, sy, sx, weight = np.array(terms).T
+    fy, fx, sy, sx = [f.astype(np.int64) for f in (fy, fx, sy, sx)]
+    if real:
+        # only the non-negative frequencies of the last dimension are needed,
+        # and the others are the conjugate of their reflection
+        keep = fx % W <= W // 2
+        fy, fx, sy, sx, weight = fy[keep], fx[keep], sy[keep], sx[keep], weight[keep]
+        dst = (fy % H) * (W // 2 + 1) + fx % W
+        conj = sx % w > w // 2
+        sy, sx = np.where(conj, -sy, sy), np.where(conj, -sx, sx)
+        src = (sy % h) * (w // 2 + 1) + sx % w + conj * h * (w // 2 + 1)
+    else:
+        dst = (fy % H) * W + fx % W
+        src = (sy % h) * w + sx % w
+    # combine the terms reading the same frequency into the same destination
+    (dst, src), inverse = np.unique(np.stack([dst, src]), axis=1, return_inverse=True)
+    combined = np.zeros(dst.shape)
+    np.add.at(combined, inverse.reshape(-1), weight)
+    return (torch.as_tensor(dst, device=device), torch.as_tensor(src, device=device),
+            torch.as_tensor(combined, dtype=dtype, device=device))
+
+
+def upsample_fourier(x, factor=2):
+    r"""Upsample the last two dimensions of ``x`` by ``factor`` in the Fourier domain
+
+    The spectrum of ``x`` is zero-padded to ``factor`` times its size, which
+    interpolates ``x`` with periodic boundary conditions. The (single)
+    Nyquist frequency of even-sized dimensions is split evenly between the
+    positive and negative Nyquist frequencies of the larger spectrum, as in
+    matlabPyrTools' ``expand``, which is used by the Portilla-Simoncelli
+    texture statistics. The output is scaled by ``factor**2``, such that it
+    has the same amplitude as ``x``.
+
+    Any number of leading (batch, channel, stacked bands...) dimensions is
+    supported and they are all upsampled at once. The index maps of the
+    spectrum are computed once per shape and cached, and the Fourier
+    transforms of real signals only use the non-negative frequencies of the
+    last dimension.
+
+    Parameters
+    ----------
+    x: torch.Tensor
+        real or complex tensor whose last two dimensions are height and
+        width.
+    factor: int
+        integer factor by which to upsample both dimensions.
+
+    Returns
+    -------
+    x_large: torch.Tensor
+        upsampled tensor of the same dtype as ``x``, whose last two
+        dimensions are ``factor`` times larger.
+
+    """
+    shape = tuple(x.shape[-2:])
+    out_shape = (factor * shape[0], factor * shape[1])
+    real = not x.is_complex()
+    dst, src, weight = _upsample_fourier_indices(shape, int(factor), real, x.device,
+                                                 x.real.dtype)
+    if real:
+        spectrum = fft.rfft2(x).flatten(-2)
+        spectrum = torch.cat([spectrum, spectrum.conj()], dim=-1)
+        n_freqs = out_shape[0] * (out_shape[1] // 2 + 1)
+    else:
+        spectrum = fft.fft2(x).flatten(-2)
+        n_freqs = out_shape[0] * out_shape[1]
+    values = spectrum[..., src] * weight
+    spectrum = values.new_zeros(*values.shape[:-1], n_freqs).index_add(-1, dst, values)
+    spectrum = spectrum.unflatten(-1, (out_shape[0], -1))
+    if real:
+        return fft.irfft2(spectrum, s=out_shape)
+    return fft.ifft2(spectrum)
+
+
 def steer(basis, angle, harmonics=None, steermtx=None, return_weights=False,
           even_phase=True):
     """Steer BASIS to the specfied ANGLE.
@@ -429,6 +564,64 @@ def steer(basis, angle, harmonics=None, steermtx=None, return_weights=False,
         return res
 
 
+@functools.lru_cache(maxsize=128)
+def _steering_weights(num, angles, harmonics, even_phase):
+    r"""Cached computation of ``steering_weights``, which takes hashable arguments"""
+    harmonics = np.array(harmonics).reshape(-1, 1)
+    steermtx = steer_to_harmonics_mtx(harmonics, np.pi * np.arange(num) / num,
+                                      even_phase=even_phase)
+    arg = np.array(angles).reshape(-1, 1) * harmonics[np.nonzero(harmonics)[0]].T
+    steervect = np.zeros((len(angles), num))
+    if all(harmonics):
+        steervect[:, range(0, num, 2)] = np.cos(arg)
+        steervect[:, range(1, num, 2)] = np.sin(arg)
+    else:
+        steervect[:, 0] = 1
+        steervect[:, range(1, num, 2)] = np.cos(arg)
+        steervect[:, range(2, num, 2)] = np.sin(arg)
+    weights = np.dot(steervect, steermtx)
+    # the same array is returned on every call, so make sure it's not modified
+    weights.flags.writeable = False
+    return weights
+
+
+def steering_weights(num, angles, harmonics=None, even_phase=True):
+    r"""Weights that steer a basis of ``num`` steerable filters to each of ``angles``
+
+    Same weights as those used by ``steer``, for all the angles at once:
+    steering a basis whose last dimension indexes the ``num`` filters to
+    the angles is then ``basis @ weights.T``. The weights are cached, so
+    that repeatedly steering to the same angles is cheap.
+
+    Parameters
+    ----------
+    num : int
+        number of filters in the basis.
+    angles : array_like or float
+        angle(s) (in radians) to steer to.
+    harmonics : array_like or None
+        a list of harmonic numbers indicating the angular harmonic content of
+        the basis. if None (default), N even or odd low frequencies, as for
+        derivative filters
+    even_phase : bool
+        specifies whether the harmonics are cosine or sine phase aligned about
+        those positions.
+
+    Returns
+    -------
+    weights : np.ndarray
+        read-only array of shape (len(angles), num).
+
+    """
+    angles = tuple(float(a) for a in np.array(angles, ndmin=1).flatten())
+    if harmonics is None:
+        harmonics = np.arange(1 - (num % 2), num, 2)
+    harmonics = tuple(int(h) for h in np.array(harmonics).flatten())
+    if 2 * len(harmonics) - harmonics.count(0) != num:
+        raise Exception('harmonics list is incompatible with basis size!')
+    return _steering_weights(num, angles, harmonics, even_phase)
+
+
 def make_disk(img_size: Union[int, Tuple[int, int], torch.Size],
               outer_radius: float = None,
               inner_radius: float = None) -> torch.Tensor:
@@ -140,9 +140,10 @@ def translation_sequence(image, n_steps=10):
     sequence: torch.Tensor
         [T, C, H, W], with T = n_steps + 1
     """
-    sequence = torch.empty(n_steps+1, *image.shape)
-
-    for shift in range(n_steps+1):
-        sequence[shift] = torch.roll(image, shift, [2])
+    # all the shifts at once: frame t, column j is column (j - t) % W of image
+    width = image.shape[2]
+    shifts = torch.arange(n_steps+1, device=image.device)
+    columns = (torch.arange(width, device=image.device) - shifts[:, None]) % width
+    sequence = image[:, :, columns].permute(2, 0, 1, 3)
 
     return sequence
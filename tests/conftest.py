@@ -60,7 +60,9 @@ def get_model(name):
                 kwargs.pop('downsample', None)
                 super().__init__(*args, downsample=False, **kwargs)
             def forward(self, *args, **kwargs):
-                coeffs = super().forward(*args, **kwargs)
+                # packing the coefficients means convert_pyr_to_tensor
+                # doesn't need to copy them
+                coeffs = super().forward(*args, packed=True, **kwargs)
                 pyr_tensor, _ = po.simul.Steerable_Pyramid_Freq.convert_pyr_to_tensor(coeffs)
                 return pyr_tensor
         # setting height=1 and # order=1 limits the size
@@ -156,3 +156,92 @@ class TestMetamers(object):
         elif to_type == 'device' and DEVICE.type != 'cpu':
             met.to('cpu')
         met.synthesized_signal - met.target_signal
+
+
+@pytest.fixture(scope='module')
+def ps_model():
+    return po.simul.PortillaSimoncelli([64, 64], n_scales=3).to(DEVICE)
+
+
+class TestPortillaSimoncelliMetamer(object):
+
+    def test_ps_metamer_converges(self, einstein_img_small, ps_model):
+        met = po.synth.PortillaSimoncelliMetamer(einstein_img_small, ps_model)
+        met.synthesize(max_iter=10)
+        assert met.synthesized_signal.shape == einstein_img_small.shape
+        assert len(met.losses) == len(met.times) == 11
+        assert met.losses[-1] < met.losses[0] / 20
+
+    def test_ps_metamer_batch_channel(self, einstein_img_small, ps_model):
+        # each image and channel is synthesized separately
+        img = torch.cat([einstein_img_small, einstein_img_small.flip(-1)], 1)
+        img = torch.cat([img, img.flip(-2)], 0)
+        met = po.synth.PortillaSimoncelliMetamer(img, ps_model)
+        met.synthesize(max_iter=10)
+        assert met.synthesized_signal.shape == img.shape
+        assert met.losses[-1] < met.losses[0] / 20
+
+    def test_ps_metamer_stop_criterion(self, einstein_img_small, ps_model):
+        met = po.synth.PortillaSimoncelliMetamer(einstein_img_small, ps_model)
+        met.synthesize(max_iter=10)
+        stop_criterion = met.losses[3]
+        met = po.synth.PortillaSimoncelliMetamer(einstein_img_small, ps_model,
+                                                 torch.rand_like(einstein_img_small))
+        met.synthesize(max_iter=100, stop_criterion=stop_criterion)
+        assert met.losses[-1] < stop_criterion
+        assert len(met.losses) < 101
+
+    def test_ps_metamer_projections(self):
+        torch.manual_seed(0)
+        ps_metamer = po.synth.portilla_simoncelli_metamer
+        x = torch.randn(2, 3, 32, 32, device=DEVICE)
+        target = torch.tensor([[.8, -.5, 0], [.2, 1., -1.]], device=DEVICE)
+        y = ps_metamer._modify_skew(x, target)
+        y = y - y.mean(dim=(-2, -1), keepdim=True)
+        skew = y.pow(3).mean(dim=(-2, -1)) / y.pow(2).mean(dim=(-2, -1)).pow(1.5)
+        assert torch.allclose(skew, target, atol=1e-4)
+        assert torch.allclose(y.var(dim=(-2, -1)), x.var(dim=(-2, -1)), rtol=1e-4)
+        target = target.abs() + 2.5
+        y = ps_metamer._modify_kurtosis(x, target)
+        y = y - y.mean(dim=(-2, -1), keepdim=True)
+        kurtosis = y.pow(4).mean(dim=(-2, -1)) / y.pow(2).mean(dim=(-2, -1)).pow(2)
+        assert torch.allclose(kurtosis, target, atol=1e-3)
+        x = x.flatten(-2)
+        covariance = torch.tensor([[2, .5, .1], [.5, 1, .2], [.1, .2, 3]], device=DEVICE)
+        cross_covariance = torch.tensor([[.3, .1], [0, .2], [-.2, .4]], device=DEVICE)
+        parents = torch.randn(2, 2, x.shape[-1], device=DEVICE)
+        y = ps_metamer._adjust_covariance(x, covariance, parents, cross_covariance)
+        assert torch.allclose(y @ y.transpose(-1, -2) / x.shape[-1], covariance, atol=1e-4)
+        assert torch.allclose(y @ parents.transpose(-1, -2) / x.shape[-1], cross_covariance,
+                              atol=1e-4)
+
+    def test_ps_metamer_fail(self, einstein_img_small, ps_model):
+        with pytest.raises(Exception):
+            po.synth.PortillaSimoncelliMetamer(einstein_img_small, po.simul.models.naive.Identity())
+        model = po.simul.PortillaSimoncelli([64, 64], n_scales=3, n_channels=3).to(DEVICE)
+        with pytest.raises(Exception):
+            po.synth.PortillaSimoncelliMetamer(einstein_img_small.repeat(1, 3, 1, 1), model)
+
+    def test_ps_metamer_save_load(self, einstein_img_small, ps_model, tmp_path):
+        met = po.synth.PortillaSimoncelliMetamer(einstein_img_small, ps_model)
+        met.synthesize(max_iter=3)
+        met.save(op.join(tmp_path, 'test_ps_metamer_save_load.pt'))
+        met_copy = po.synth.PortillaSimoncelliMetamer(einstein_img_small, ps_model)
+        met_copy.load(op.join(tmp_path, 'test_ps_metamer_save_load.pt'),
+                      map_location=DEVICE)
+        assert torch.equal(met.synthesized_signal, met_copy.synthesized_signal)
+        assert met.losses == met_copy.losses
+        met_copy.synthesize(max_iter=3)
+
+    def test_ps_metamer_benchmark(self, einstein_img_small, ps_model):
+        met = po.synth.PortillaSimoncelliMetamer(einstein_img_small, ps_model)
+        met.synthesize(max_iter=5)
+        # loose enough for Metamer to reach it quickly too
+        error = met.losses[1]
+        results = po.synth.portilla_simoncelli_metamer.benchmark(
+            einstein_img_small, ps_model, error, metamer_max_iter=20, check_every=5
+        )
+        assert list(results.keys()) == ['PortillaSimoncelliMetamer', 'Metamer']
+        assert results['PortillaSimoncelliMetamer']['time'] is not None
+        assert results['PortillaSimoncelliMetamer']['representation_error'] < error
+        assert results['Metamer']['iterations'] <= 20
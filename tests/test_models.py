@@ -12,8 +12,11 @@ import numpy as np
 import scipy.io as sio
 import torch
 import os.path as op
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
 from test_metric import osf_download
 from plenoptic.simulate.canonical_computations import (gaussian1d, circular_gaussian2d)
+from plenoptic.tools.signal import _upsample_fourier_indices
 from conftest import DEVICE, DATA_DIR
 from packaging import version
 
@@ -390,6 +393,177 @@ class TestPortillaSimoncelli(object):
         
         assert out_im.shape == (im_shape[0] * mult, im_shape[1] * mult)
 
+    def test_ps_any_shape(self):
+        im = po.load_images(op.join(DATA_DIR, '256/einstein.pgm')).to(DEVICE)
+        model = po.simul.PortillaSimoncelli(None, n_scales=3, max_shapes=2).to(DEVICE)
+        for im_shape in [(256, 256), (128, 192), (256, 256), (96, 128)]:
+            x = im[..., :im_shape[0], :im_shape[1]]
+            fixed = po.simul.PortillaSimoncelli(im_shape, n_scales=3).to(DEVICE)
+            assert torch.equal(model(x), fixed(x))
+        assert list(model.pyr._shape_pyrs.keys()) == [(256, 256), (96, 128)]
+
+    @pytest.mark.parametrize("use_true_correlations", [False, True])
+    def test_ps_batch(self, use_true_correlations):
+        im = po.load_images([op.join(DATA_DIR, f'256/{im}.pgm') for im in
+                             ['curie', 'einstein', 'metal', 'nuts']]).to(DEVICE)
+        im = im.reshape(2, 2, *im.shape[-2:])
+        model = po.simul.PortillaSimoncelli(im.shape[-2:], n_scales=3,
+                                            use_true_correlations=use_true_correlations).to(DEVICE)
+        output = model(im)
+        assert output.shape == (2, 2, len(model.representation_scales))
+        # each image and channel is analyzed separately
+        for b, c in product(range(2), range(2)):
+            np.testing.assert_allclose(po.to_numpy(output[b, c]),
+                                       po.to_numpy(model(im[b:b+1, c:c+1])).squeeze(),
+                                       rtol=1e-5, atol=1e-5)
+        rep = model.convert_to_dict(output)
+        assert rep['auto_correlation_magnitude'].shape[:2] == (2, 2)
+        assert torch.equal(model.convert_to_dict(output[1, 0])['skew_reconstructed'],
+                           rep['skew_reconstructed'][1, 0])
+
+    @pytest.mark.parametrize("scales", [["pixel_statistics"], ["residual_lowpass"], [2],
+                                        [0, "residual_highpass"], [1, "residual_lowpass"]])
+    @pytest.mark.parametrize("use_true_correlations", [False, True])
+    def test_ps_scales(self, scales, use_true_correlations):
+        im = po.load_images(op.join(DATA_DIR, '256/einstein.pgm')).to(DEVICE)
+        model = po.simul.PortillaSimoncelli(im.shape[-2:], n_scales=3,
+                                            use_true_correlations=use_true_correlations).to(DEVICE)
+        # only the statistics of the requested scales are computed, and they
+        # are the same as those computed along with all the others
+        ind = [i for i, s in enumerate(model.representation_scales) if s in scales]
+        torch.testing.assert_close(model(im, scales=scales), model(im)[..., ind],
+                                   rtol=1e-5, atol=1e-6)
+
+    @pytest.mark.parametrize("im_shape", [(256, 256), (32, 48)])
+    @pytest.mark.parametrize("n_orientations", [2, 4])
+    @pytest.mark.parametrize("use_true_correlations", [False, True])
+    def test_ps_compact(self, im_shape, n_orientations, use_true_correlations):
+        im = po.load_images(op.join(DATA_DIR, '256/einstein.pgm')).to(DEVICE)
+        im = im[..., :im_shape[0], :im_shape[1]]
+        kwargs = dict(n_scales=3, n_orientations=n_orientations,
+                      use_true_correlations=use_true_correlations)
+        model = po.simul.PortillaSimoncelli(im_shape, **kwargs).to(DEVICE)
+        compact = po.simul.PortillaSimoncelli(im_shape, compact=True, **kwargs).to(DEVICE)
+        output = model(im)
+        compact_output = compact(im)
+        assert compact_output.shape[-1] == len(compact.representation_scales)
+        assert compact_output.shape[-1] < output.shape[-1] / 2
+        # the redundant statistics can be recovered
+        torch.testing.assert_close(compact.compact_to_full(compact_output), output,
+                                   rtol=1e-4, atol=1e-5)
+        rep = compact.convert_to_dict(compact_output)
+        assert torch.equal(compact.convert_to_vector(rep), compact_output)
+        scales = [1, 'residual_lowpass']
+        ind = [i for i, s in enumerate(compact.representation_scales) if s in scales]
+        assert torch.equal(compact(im, scales=scales), compact_output[..., ind])
+
+    @pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+    @pytest.mark.parametrize("compact", [False, True])
+    def test_ps_cached_constants(self, dtype, compact):
+        im = po.load_images(op.join(DATA_DIR, '256/einstein.pgm'))[..., :64, :64]
+        im = im.to(DEVICE, dtype)
+        # (the cache is shared with the other tests)
+        _upsample_fourier_indices.cache_clear()
+        # moving the device and the dtype separately caches the constants for
+        # both
+        model = po.simul.PortillaSimoncelli(im.shape[-2:], n_scales=3, compact=compact)
+        model = model.to(DEVICE).to(dtype)
+        upsample_info = _upsample_fourier_indices.cache_info()
+        autocorr_keys = set(model._autocorr_indices.keys())
+        model(im)
+        # forward didn't have to compute (on the host) and copy any constant
+        assert _upsample_fourier_indices.cache_info().misses == upsample_info.misses
+        assert set(model._autocorr_indices.keys()) == autocorr_keys
+        if DEVICE.type == 'cuda':
+            # nor to wait for the device
+            torch.cuda.set_sync_debug_mode('error')
+            try:
+                model(im)
+            finally:
+                torch.cuda.set_sync_debug_mode(0)
+
+    def test_ps_stateless(self):
+        im = po.load_images([op.join(DATA_DIR, f'256/{im}.pgm') for im in
+                             ['curie', 'einstein', 'metal', 'nuts']]).to(DEVICE)
+        model = po.simul.PortillaSimoncelli(im.shape[-2:], n_scales=3).to(DEVICE)
+        output, intermediates = model(im[:1], return_intermediates=True)
+        for attr in ['representation', 'pyr_coeffs', 'magnitude_pyr_coeffs',
+                     'real_pyr_coeffs']:
+            assert not hasattr(model, attr)
+        # the pyramid coefficients are left as they are
+        pyr_coeffs = model.pyr(im[:1])
+        for k, v in intermediates['pyr_coeffs'].items():
+            assert torch.equal(v, pyr_coeffs[k])
+        assert torch.equal(model.convert_to_vector(intermediates['representation']), output)
+        assert torch.equal(model.convert_to_vector(model.convert_to_dict(output)), output)
+        # a single model can analyze images concurrently
+        with ThreadPoolExecutor(4) as pool:
+            outputs = list(pool.map(model, [im[i:i+1] for i in range(4)] * 2))
+        for i, out in enumerate(outputs):
+            assert torch.equal(out, model(im[i % 4:i % 4 + 1]))
+
+    @pytest.mark.parametrize("compact", [False, True])
+    @pytest.mark.parametrize("use_true_correlations", [False, True])
+    def test_ps_color(self, compact, use_true_correlations):
+        im = po.load_images([op.join(DATA_DIR, f'256/{im}.pgm') for im in
+                             ['curie', 'einstein', 'metal']]).to(DEVICE)
+        # two color images, the second with identical channels
+        im = torch.cat([im.transpose(0, 1), im[:1].transpose(0, 1).repeat(1, 3, 1, 1)])
+        im = im[..., :128, :128]
+        kwargs = dict(n_scales=3, compact=compact, use_true_correlations=use_true_correlations)
+        model = po.simul.PortillaSimoncelli(im.shape[-2:], n_channels=3, **kwargs).to(DEVICE)
+        gray_model = po.simul.PortillaSimoncelli(im.shape[-2:], **kwargs).to(DEVICE)
+        output, intermediates = model(im, return_intermediates=True)
+        assert output.shape == (2, 1, len(model.representation_scales))
+        # the statistics of each channel come first
+        gray_output = gray_model(im)
+        n_stats = gray_output.shape[-1]
+        assert torch.equal(output[:, 0, :3 * n_stats].unflatten(-1, (3, n_stats)), gray_output)
+        rep = intermediates['representation']
+        assert torch.equal(model.convert_to_vector(rep), output)
+        assert torch.equal(model.convert_to_vector(model.convert_to_dict(output)), output)
+        # the bands of identical channels are correlated like those of a single one
+        for key in ['magnitude', 'real']:
+            torch.testing.assert_close(rep[f'cross_channel_correlation_{key}'][1],
+                                       rep[f'cross_orientation_correlation_{key}'][1, :, :4, :4, :3])
+        scales = [1, 'residual_lowpass']
+        ind = [i for i, s in enumerate(model.representation_scales) if s in scales]
+        assert torch.equal(model(im, scales=scales), output[..., ind])
+        with pytest.raises(ValueError):
+            model(im[:, :2])
+
+    @pytest.mark.parametrize("im_shape", [(32, 48), (6, 8)])
+    def test_ps_autocorrelation(self, im_shape):
+        model = po.simul.PortillaSimoncelli((64, 64), n_scales=2, spatial_corr_width=7,
+                                            use_true_correlations=False).to(DEVICE)
+        x = torch.randn(2, 3, *im_shape, device=DEVICE)
+        ac, vari = model.compute_autocorrelation(x)
+        # the window is cropped to fit in small images
+        le = min(3, min(im_shape) // 2 - 1)
+        assert ac.shape == (2, 3, 2*le+1, 2*le+1)
+        for dy, dx in product(range(-le, le+1), range(-le, le+1)):
+            direct = (x * torch.roll(x, (dy, dx), dims=(-2, -1))).mean((-2, -1))
+            np.testing.assert_allclose(po.to_numpy(ac[..., le+dy, le+dx]), po.to_numpy(direct),
+                                       rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(po.to_numpy(vari), po.to_numpy(x.pow(2).mean((-2, -1))),
+                                   rtol=1e-5, atol=1e-5)
+
+    @pytest.mark.parametrize("use_true_correlations", [False, True])
+    def test_ps_crosscorrelation(self, use_true_correlations):
+        model = po.simul.PortillaSimoncelli((64, 64), n_scales=2,
+                                            use_true_correlations=use_true_correlations).to(DEVICE)
+        bands = torch.randn(2, 3, 7, 100, device=DEVICE) + torch.arange(7, device=DEVICE).unsqueeze(-1)
+        covariances = bands[..., :4, :] @ bands.transpose(-1, -2)
+        mean = bands.mean(dim=-1)
+        moments = ((bands - mean.unsqueeze(-1)).pow(2).mean(dim=-1), mean, bands.shape[-1])
+        rows, cols = slice(0, 4), slice(2, 7)
+        corr = model.compute_crosscorrelation(covariances, moments, rows, cols, 100)
+        expected = bands[..., rows, :] @ bands[..., cols, :].transpose(-1, -2) / 100
+        if use_true_correlations:
+            expected = expected / (bands[..., rows, :].std(dim=(-2, -1)) *
+                                   bands[..., cols, :].std(dim=(-2, -1)))[..., None, None]
+        np.testing.assert_allclose(po.to_numpy(corr), po.to_numpy(expected), rtol=1e-5, atol=1e-5)
+
 
 class TestFilters:
     @pytest.mark.parametrize("std", [5., torch.tensor(1.), -1., 0.])
@@ -423,4 +597,4 @@ class TestFilters:
         else:
             filt = gaussian1d(kernel_size, std)
             assert filt.sum().isclose(torch.ones(1))
-            assert filt.shape == torch.Size([kernel_size])
\ No newline at end of file
+            assert filt.shape == torch.Size([kernel_size])
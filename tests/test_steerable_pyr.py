@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+import copy
+import gc
 import os.path as op
 import imageio
 import torch
@@ -229,6 +231,98 @@ class TestSteerablePyramid(object):
         recon = to_numpy(spyr_multi.recon_pyr(pyr_coeffs))
         np.testing.assert_allclose(recon, to_numpy(multichannel_img), rtol=1e-4, atol=1e-4)
 
+    @pytest.mark.parametrize('dtype', [torch.float32, torch.float64])
+    @pytest.mark.parametrize('spyr', [f'3-{o}-{c}-{d}-False' for o, c, d in
+                                      product([1, 3], [True, False], [True, False])],
+                             indirect=True)
+    def test_recon_dtype(self, img, spyr, dtype):
+        spyr = copy.deepcopy(spyr).to(dtype)
+        img = img.to(dtype)
+        pyr_coeffs = spyr.forward(img)
+        recon = spyr.recon_pyr(pyr_coeffs)
+        assert recon.dtype == dtype
+        # reconstruction is linear, so reconstructing from each level
+        # separately and summing should give back the full reconstruction
+        levels = [0, 1, 2, 'residual_lowpass']
+        recon_sum = sum([spyr.recon_pyr(pyr_coeffs, lev) for lev in levels])
+        recon_sum = recon_sum + spyr.recon_pyr(pyr_coeffs, 'residual_highpass')
+        np.testing.assert_allclose(to_numpy(recon_sum), to_numpy(recon), rtol=1e-4, atol=1e-4)
+
+    @pytest.mark.parametrize("scales", [[], [0, 2], ['residual_highpass', 1, 'residual_lowpass']])
+    @pytest.mark.parametrize('spyr', [f'3-{o}-{c}-{d}-False' for o, c, d in
+                                      product([1, 3], [True, False], [True, False])],
+                             indirect=True)
+    @pytest.mark.skipif(not hasattr(torch.Tensor, 'untyped_storage'),
+                        reason="untyped_storage requires torch>=2.0")
+    def test_packed(self, img, spyr, scales):
+        pyr_coeffs = spyr.forward(img, scales)
+        packed_coeffs = spyr.forward(img, scales, packed=True)
+        assert list(pyr_coeffs.keys()) == list(packed_coeffs.keys())
+        check_pyr_coeffs(pyr_coeffs, packed_coeffs, rtol=0, atol=0)
+        # all bands are views into the same buffer
+        flat = packed_coeffs.flatten()
+        for v in packed_coeffs.values():
+            assert v.storage_offset() >= 0
+            assert v.untyped_storage().data_ptr() == flat.untyped_storage().data_ptr()
+        energy = sum([v.abs().pow(2).sum() for v in pyr_coeffs.values()])
+        assert torch.allclose(flat.pow(2).sum(), energy)
+        if not scales:
+            recon = to_numpy(spyr.recon_pyr(packed_coeffs))
+            np.testing.assert_allclose(recon, to_numpy(img), rtol=1e-4, atol=1e-4)
+        if not spyr.downsample and not spyr.is_complex:
+            pyr_tensor, _ = spyr.convert_pyr_to_tensor(packed_coeffs)
+            assert pyr_tensor.data_ptr() == flat.data_ptr()
+            np.testing.assert_array_equal(to_numpy(pyr_tensor),
+                                          to_numpy(spyr.convert_pyr_to_tensor(pyr_coeffs)[0]))
+
+    @pytest.mark.parametrize('spyr', [f'{h}-{o}-False-{d}-{tf}' for h, o, d, tf in
+                                      product(['auto', 1, 3], [1, 2, 3], [True, False],
+                                              [True, False])],
+                             indirect=True)
+    def test_rfft(self, img, spyr):
+        pyr_coeffs = spyr.forward(img)
+        spyr_rfft = po.simul.Steerable_Pyramid_Freq(img.shape[-2:], spyr.num_scales, spyr.order,
+                                                    downsample=spyr.downsample,
+                                                    tight_frame=spyr.tight_frame, use_rfft=True)
+        spyr_rfft.to(DEVICE)
+        pyr_coeffs_rfft = spyr_rfft.forward(img)
+        check_pyr_coeffs(pyr_coeffs, pyr_coeffs_rfft, rtol=1e-4, atol=1e-4)
+        recon = to_numpy(spyr_rfft.recon_pyr(pyr_coeffs_rfft))
+        np.testing.assert_allclose(recon, to_numpy(img), rtol=1e-4, atol=1e-4)
+        recon = to_numpy(spyr_rfft.recon_pyr(pyr_coeffs_rfft, [0, 'residual_lowpass'], [0]))
+        np.testing.assert_allclose(recon, to_numpy(spyr.recon_pyr(pyr_coeffs, [0, 'residual_lowpass'], [0])),
+                                   rtol=1e-4, atol=1e-4)
+
+    @pytest.mark.parametrize('spyr_multi', [f'3-{o}-{c}-{d}-False' for o, c, d in
+                                            product([1, 3], [True, False], [True, False])],
+                             indirect=True)
+    def test_channels_independent(self, multichannel_img, spyr_multi):
+        # each channel's coefficients should be the same as if it had been
+        # passed through the pyramid on its own
+        pyr_coeffs = spyr_multi.forward(multichannel_img)
+        for ch in range(multichannel_img.shape[1]):
+            pyr_coeffs_ch = spyr_multi.forward(multichannel_img[:, ch:ch+1])
+            for k, v in pyr_coeffs_ch.items():
+                np.testing.assert_allclose(to_numpy(pyr_coeffs[k][:, ch:ch+1]), to_numpy(v),
+                                           rtol=1e-5, atol=1e-5)
+
+    @pytest.mark.parametrize('spyr', [f'3-3-{c}-{d}-False' for c, d in
+                                      product([True, False], [True, False])],
+                             indirect=True)
+    @pytest.mark.skipif(not hasattr(torch, 'compile'), reason="torch.compile requires torch>=2.0")
+    def test_compile(self, img, spyr):
+        # forward should be traceable as a single graph, without side effects
+        pyr_size = copy.deepcopy(spyr.pyr_size)
+        # build the masks before compiling, so they're not computed in the graph
+        pyr_coeffs = spyr(img)
+        # every pyramid instance gets its own graph, so don't let the ones
+        # compiled in previous tests count against the recompile limit
+        torch._dynamo.reset()
+        compiled = torch.compile(spyr, fullgraph=True)
+        compiled_coeffs = compiled(img)
+        assert spyr.pyr_size == pyr_size
+        check_pyr_coeffs(pyr_coeffs, compiled_coeffs, rtol=1e-5, atol=1e-5)
+
     @pytest.mark.parametrize('spyr', [f'{h}-{o}-{c}-{d}-{tf}' for h, o, c, d, tf in
                                       product(['auto'], [3], [True, False],
                                               [True, False], [True, False])],
@@ -266,7 +360,8 @@ class TestSteerablePyramid(object):
 
     @pytest.mark.parametrize("scales", [[0], [4], [0, 1, 2], [0, 3, 4],
                                         ['residual_highpass', 'residual_lowpass'],
-                                        ['residual_highpass', 0, 1, 'residual_lowpass']])
+                                        ['residual_highpass', 0, 1, 'residual_lowpass'],
+                                        [3, 'residual_lowpass'], ['residual_lowpass']])
     @pytest.mark.parametrize('spyr', [f'auto-3-{c}-{d}-False' for c, d in product([True, False],
                                                                                   [True, False])],
                              indirect=True)
@@ -283,3 +378,288 @@ class TestSteerablePyramid(object):
             spyr.recon_pyr()
         with pytest.raises(Exception):
             spyr.recon_pyr(scales)
+
+    @pytest.mark.parametrize("scales", [[2, 3], [3, 'residual_lowpass'], ['residual_lowpass']])
+    @pytest.mark.parametrize('downsample', [True, False])
+    def test_coarse_scales(self, basic_stim, scales, downsample):
+        # only the masks of the requested scales are built
+        spyr = po.simul.Steerable_Pyramid_Freq(basic_stim.shape[-2:], height=4,
+                                               downsample=downsample).to(DEVICE)
+        spyr(basic_stim.to(DEVICE), scales)
+        built = set(k for k in spyr._buffers.keys() if k.startswith('_anglemask_'))
+        assert built == set(f'_anglemask{r}_{i}' for i in scales if isinstance(i, int)
+                            for r in ['', '_recon'])
+        assert '_lomask_0' not in spyr._buffers
+
+    @pytest.mark.parametrize('is_complex', [True, False])
+    @pytest.mark.parametrize('downsample', [True, False])
+    def test_steer_coeffs(self, basic_stim, is_complex, downsample):
+        img = basic_stim[:1, :1].to(DEVICE)
+        spyr = po.simul.Steerable_Pyramid_Freq(img.shape[-2:], height=3, order=3, is_complex=is_complex,
+                                               downsample=downsample).to(DEVICE)
+        pyr_coeffs = spyr(img)
+        angles = np.linspace(0, 2*np.pi, 9)
+        steered, weights = spyr.steer_coeffs(pyr_coeffs, angles)
+        assert len(steered) == len(weights) == 3 * len(angles)
+        pyr_pt = pt.pyramids.SteerablePyramidFreq(to_numpy(img.squeeze()), height=3, order=3,
+                                                  is_complex=is_complex)
+        steered_pt, weights_pt = pyr_pt.steer_coeffs(angles)
+        for (i, j), w in weights.items():
+            np.testing.assert_allclose(to_numpy(w), weights_pt[(i, j)], rtol=1e-6, atol=1e-6)
+            band = to_numpy(steered[(i, spyr.num_orientations + j)].squeeze())
+            if downsample:
+                np.testing.assert_allclose(band, steered_pt[(i, j)], rtol=1e-4, atol=1e-4)
+        # steering to the angles of the pyramid's own filters gives back their coefficients
+        angles = np.pi * np.arange(spyr.num_orientations) / spyr.num_orientations
+        steered, _ = spyr.steer_coeffs(pyr_coeffs, angles)
+        for (i, j), v in steered.items():
+            np.testing.assert_allclose(to_numpy(v), to_numpy(pyr_coeffs[(i, j - spyr.num_orientations)]),
+                                       rtol=1e-5, atol=1e-5)
+
+    @pytest.mark.parametrize('is_complex', [True, False])
+    @pytest.mark.parametrize('downsample', [True, False])
+    @pytest.mark.parametrize('packed', [True, False])
+    def test_video(self, basic_stim, is_complex, downsample, packed):
+        # videos are BxCxTxHxW, and each frame is transformed like an image
+        video = torch.stack([basic_stim[:1], basic_stim[:1].flip(-1), basic_stim[:1].transpose(-1, -2)],
+                            dim=2).to(DEVICE)
+        spyr = po.simul.Steerable_Pyramid_Freq(video.shape[-2:], height=3, is_complex=is_complex,
+                                               downsample=downsample).to(DEVICE)
+        pyr_coeffs = spyr(video, packed=packed)
+        for t in range(video.shape[2]):
+            frame_coeffs = spyr(video[:, :, t])
+            check_pyr_coeffs({k: v[:, :, t] for k, v in pyr_coeffs.items()}, frame_coeffs,
+                             rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(to_numpy(spyr.recon_pyr(pyr_coeffs)), to_numpy(video),
+                                   rtol=1e-4, atol=1e-4)
+        # chunking over time gives the same coefficients
+        chunked_coeffs = spyr(video, packed=packed, chunk_size=2)
+        assert list(chunked_coeffs.keys()) == list(pyr_coeffs.keys())
+        check_pyr_coeffs(chunked_coeffs, pyr_coeffs, rtol=0, atol=0)
+
+    @pytest.mark.parametrize('is_complex', [True, False])
+    @pytest.mark.parametrize('height', ['auto', 2])
+    def test_any_shape(self, basic_stim, is_complex, height):
+        img = basic_stim[:1].to(DEVICE)
+        spyr = po.simul.Steerable_Pyramid_Freq(None, height=height, is_complex=is_complex,
+                                               max_shapes=2).to(DEVICE)
+        for shape in [(256, 256), (128, 96), (256, 256), (64, 128)]:
+            x = img[..., :shape[0], :shape[1]]
+            fixed = po.simul.Steerable_Pyramid_Freq(shape, height=height,
+                                                    is_complex=is_complex).to(DEVICE)
+            pyr_coeffs = spyr(x)
+            fixed_coeffs = fixed(x)
+            assert list(pyr_coeffs.keys()) == list(fixed_coeffs.keys())
+            check_pyr_coeffs(pyr_coeffs, fixed_coeffs, rtol=0, atol=0)
+            np.testing.assert_allclose(to_numpy(spyr.recon_pyr(pyr_coeffs)),
+                                       to_numpy(fixed.recon_pyr(fixed_coeffs)), rtol=1e-6, atol=1e-6)
+        # the least recently used shapes get evicted
+        assert list(spyr._shape_pyrs.keys()) == [(256, 256), (64, 128)]
+        # and so do those that take up too much memory
+        spyr.max_mask_bytes = 1
+        spyr(img[..., :32, :32])
+        assert list(spyr._shape_pyrs.keys()) == [(32, 32)]
+        # the pyramids follow the dtype of the shape-polymorphic one
+        spyr = spyr.to(torch.float64)
+        assert spyr(img[..., :32, :32].to(torch.float64))['residual_lowpass'].dtype == torch.float64
+
+    @pytest.mark.parametrize('is_complex', [True, False])
+    def test_shared_masks(self, basic_stim, is_complex):
+        pyr = po.simul.Steerable_Pyramid_Freq(basic_stim.shape[-2:], is_complex=is_complex)
+        pyr2 = po.simul.Steerable_Pyramid_Freq(basic_stim.shape[-2:], is_complex=is_complex)
+        # masks are only built once they're needed
+        assert not any(['mask' in k for k, _ in pyr.named_buffers()])
+        pyr.forward(basic_stim.to('cpu'))
+        pyr2.forward(basic_stim.to('cpu'))
+        # masks are cached, and so shared between pyramids with the same parameters
+        for (k, v), v2 in zip(pyr.named_buffers(), pyr2.buffers()):
+            if 'mask' in k:
+                assert v is v2, f"Mask {k} is not shared between pyramids"
+        # masks are non-persistent buffers
+        assert len(pyr.state_dict()) == 0
+        pyr.to(DEVICE).to(torch.float64)
+        pyr_copy = copy.deepcopy(pyr)
+        assert pyr_copy.hi0mask.dtype == torch.float64
+        assert pyr_copy.hi0mask is pyr.hi0mask
+        # pyr2 still has its original masks
+        assert pyr2.hi0mask.dtype == torch.float32
+        x = basic_stim.to(torch.float64)
+        check_pyr_coeffs(pyr.forward(x), pyr_copy.forward(x))
+
+    @pytest.mark.parametrize('is_complex', [True, False])
+    def test_shared_masks_conflicting(self, basic_stim, is_complex):
+        # pyramids whose masks differ must not share them, even when they're
+        # alive at the same time
+        img = basic_stim[:1].to(DEVICE)
+        pyr_kwargs = [dict(tight_frame=tf, downsample=d) for tf, d in
+                      product([True, False], [True, False])]
+        uncached = []
+        for kwargs in pyr_kwargs:
+            pyr = po.simul.Steerable_Pyramid_Freq(img.shape[-2:], height=3, is_complex=is_complex,
+                                                  **kwargs).to(DEVICE)
+            uncached.append(pyr.forward(img))
+            del pyr
+            gc.collect()
+        pyrs = [po.simul.Steerable_Pyramid_Freq(img.shape[-2:], height=3, is_complex=is_complex,
+                                                **kwargs).to(DEVICE)
+                for kwargs in pyr_kwargs]
+        for scales in [[2], []]:
+            for pyr, pyr_coeffs in zip(pyrs, uncached):
+                coeffs = pyr.forward(img, scales=scales)
+                check_pyr_coeffs(coeffs, {k: pyr_coeffs[k] for k in coeffs.keys()},
+                                 rtol=1e-6, atol=1e-6)
+
+    @pytest.mark.parametrize('is_complex', [True, False])
+    @pytest.mark.parametrize('downsample', [True, False])
+    @pytest.mark.parametrize('tight_frame', [True, False])
+    @pytest.mark.parametrize('use_rfft', [True, False])
+    @pytest.mark.parametrize('scales', [[], [0, 2, 'residual_lowpass'], [1, 'residual_highpass']])
+    def test_adjoint_backward(self, basic_stim, is_complex, downsample, tight_frame, use_rfft,
+                              scales):
+        if is_complex and use_rfft:
+            pytest.skip("use_rfft is only supported for real pyramids")
+        x = basic_stim[:2, :, :64, :96].to(DEVICE).to(torch.float64).requires_grad_()
+        grads = []
+        for adjoint_backward in [True, False]:
+            spyr = po.simul.Steerable_Pyramid_Freq(x.shape[-2:], height=3, is_complex=is_complex,
+                                                   downsample=downsample, tight_frame=tight_frame,
+                                                   use_rfft=use_rfft,
+                                                   adjoint_backward=adjoint_backward)
+            pyr_coeffs = spyr.to(DEVICE).to(torch.float64)(x, scales=scales)
+            # skip some coefficients, so that not all of them have gradients
+            loss = sum([(i+1) * v.abs().pow(2).sum() for i, v in enumerate(pyr_coeffs.values())
+                        if i % 3 != 1])
+            grad, = torch.autograd.grad(loss, x, create_graph=True)
+            # second derivatives go through the adjoint as well
+            grad2, = torch.autograd.grad(grad.pow(2).sum(), x)
+            grads.append((grad, grad2))
+        for g, g_autograd in zip(*grads):
+            np.testing.assert_allclose(to_numpy(g), to_numpy(g_autograd),
+                                       rtol=1e-10, atol=1e-10 * g_autograd.abs().max().item())
+
+
+class TestTiledSteerablePyramid(object):
+
+    @pytest.fixture(scope='class')
+    def img(self):
+        return po.load_images(op.join(DATA_DIR, '256/einstein.pgm'))[0, 0]
+
+    @pytest.mark.parametrize('is_complex', [True, False])
+    @pytest.mark.parametrize('downsample', [True, False])
+    def test_tiled_vs_full(self, img, is_complex, downsample):
+        # with a single tile and no halo, this is the full-image transform
+        tiled = po.simul.Tiled_Steerable_Pyramid_Freq(img.shape, 0, height=3, is_complex=is_complex,
+                                                      downsample=downsample).to(DEVICE)
+        errors = tiled.boundary_error(img)
+        assert max(errors.values()) < 1e-5
+        # the error of proper tiles decreases with the size of the halo
+        errors = [po.simul.Tiled_Steerable_Pyramid_Freq((64, 64), halo, height=3, is_complex=is_complex,
+                                                        downsample=downsample).to(DEVICE).boundary_error(img)
+                  for halo in [16, 64]]
+        for k in errors[0].keys():
+            assert errors[1][k] < errors[0][k]
+        assert max(errors[1].values()) < .05
+
+    def test_tiled_memmap(self, img, tmp_path):
+        img = torch.stack([img, img.T])
+        tiled = po.simul.Tiled_Steerable_Pyramid_Freq((64, 64), 32, height=2, is_complex=True).to(DEVICE)
+        pyr_coeffs = tiled(img.numpy())
+        pyr_coeffs_mmap = tiled(img.numpy(), out_dir=tmp_path)
+        assert list(pyr_coeffs.keys()) == list(pyr_coeffs_mmap.keys())
+        for k, v in pyr_coeffs.items():
+            assert isinstance(pyr_coeffs_mmap[k], np.memmap)
+            name = k if isinstance(k, str) else f'{k[0]}_{k[1]}'
+            np.testing.assert_array_equal(np.load(op.join(tmp_path, f'{name}.npy')), v)
+        # channels are analyzed independently
+        pyr_coeffs_1 = tiled(img[1])
+        for k, v in pyr_coeffs_1.items():
+            np.testing.assert_allclose(pyr_coeffs[k][1], v, rtol=1e-5, atol=1e-5)
+
+    def test_tiled_shapes(self, img):
+        with pytest.raises(ValueError):
+            po.simul.Tiled_Steerable_Pyramid_Freq((60, 64), 16, height=3)
+        with pytest.raises(ValueError):
+            po.simul.Tiled_Steerable_Pyramid_Freq((64, 64), 12, height=3)
+        tiled = po.simul.Tiled_Steerable_Pyramid_Freq((64, 64), 16, height=3)
+        with pytest.raises(ValueError):
+            tiled(img[:32])
+        # tiles don't need to evenly divide the image
+        pyr_coeffs = tiled(img[:, :200])
+        assert pyr_coeffs[(2, 0)].shape == (64, 50)
+        assert pyr_coeffs['residual_lowpass'].shape == (32, 25)
+
+
+class TestSpatialSteerablePyramid(object):
+
+    @pytest.fixture(scope='class')
+    def img(self):
+        return po.load_images(op.join(DATA_DIR, '256/einstein.pgm'))[..., :250, :200]
+
+    @pytest.mark.parametrize('order', [0, 1, 3, 5])
+    @pytest.mark.parametrize('edge_type', ['reflect1', 'circular', 'zero'])
+    def test_match_pyrtools(self, img, order, edge_type):
+        pyr = po.simul.Steerable_Pyramid_Space(img.shape[-2:], order=order,
+                                               edge_type=edge_type).to(DEVICE)
+        pyr_coeffs = pyr(img.to(DEVICE))
+        pyr_pt = pt.pyramids.SteerablePyramidSpace(to_numpy(img.squeeze()), order=order,
+                                                   edge_type=edge_type)
+        assert list(pyr_coeffs.keys()) == list(pyr_pt.pyr_coeffs.keys())
+        check_pyr_coeffs(pyr_coeffs, pyr_pt.pyr_coeffs, rtol=1e-4, atol=1e-4)
+        for levels, bands in [('all', 'all'), ([0, 'residual_lowpass'], [0]), ('residual_highpass', 'all')]:
+            recon = to_numpy(pyr.recon_pyr(pyr_coeffs, levels, bands).squeeze())
+            np.testing.assert_allclose(recon, pyr_pt.recon_pyr(levels=levels, bands=bands),
+                                       rtol=1e-4, atol=1e-4)
+
+    def test_multichannel(self, img):
+        pyr = po.simul.Steerable_Pyramid_Space(img.shape[-2:], order=3).to(DEVICE)
+        imgs = torch.cat([img, img.flip(-1)], dim=1).repeat(2, 1, 1, 1).to(DEVICE)
+        pyr_coeffs = pyr(imgs)
+        for i in range(2):
+            check_pyr_coeffs(pyr(imgs[:1, i:i+1]), {k: v[1, i] for k, v in pyr_coeffs.items()},
+                             rtol=1e-5, atol=1e-5)
+        assert pyr.recon_pyr(pyr_coeffs).shape == imgs.shape
+
+    def test_steer_coeffs(self, img):
+        img = img.to(DEVICE)
+        pyr = po.simul.Steerable_Pyramid_Space(img.shape[-2:], height=3, order=3).to(DEVICE)
+        pyr_freq = po.simul.Steerable_Pyramid_Freq(img.shape[-2:], height=3, order=3).to(DEVICE)
+        pyr_coeffs = pyr(img)
+        angles = np.linspace(0, 2*np.pi, 9)
+        steered, weights = pyr.steer_coeffs(pyr_coeffs, angles)
+        steered_freq, weights_freq = pyr_freq.steer_coeffs(pyr_freq(img), angles)
+        # the filters differ, but the steering doesn't
+        assert list(steered.keys()) == list(steered_freq.keys())
+        for k, w in weights.items():
+            np.testing.assert_allclose(to_numpy(w), to_numpy(weights_freq[k]), rtol=1e-6, atol=1e-6)
+            assert steered[k[0], pyr.num_orientations + k[1]].shape == pyr_coeffs[(k[0], 0)].shape
+        # steering to the angles of the pyramid's own filters gives back their coefficients
+        angles = np.pi * np.arange(pyr.num_orientations) / pyr.num_orientations
+        steered, _ = pyr.steer_coeffs(pyr_coeffs, angles)
+        for (i, j), v in steered.items():
+            np.testing.assert_allclose(to_numpy(v), to_numpy(pyr_coeffs[(i, j - pyr.num_orientations)]),
+                                       rtol=1e-5, atol=1e-5)
+
+    @pytest.mark.parametrize('backend', ['auto', 'fft', 'spatial'])
+    def test_backend(self, img, backend):
+        pyr = po.simul.steerable_pyramid(img.shape[-2:], order=3, backend=backend, device=DEVICE,
+                                         n_repeats=1)
+        if backend == 'fft':
+            assert isinstance(pyr, po.simul.Steerable_Pyramid_Freq)
+        elif backend == 'spatial':
+            assert isinstance(pyr, po.simul.Steerable_Pyramid_Space)
+        else:
+            # the choice is cached
+            pyr2 = po.simul.steerable_pyramid(img.shape[-2:], order=3, backend=backend,
+                                              device=DEVICE, n_repeats=1)
+            assert type(pyr2) == type(pyr)
+        # both backends have the same coefficient keys and shapes
+        pyr_coeffs = pyr(img.to(DEVICE))
+        spatial = po.simul.Steerable_Pyramid_Space(img.shape[-2:], order=3)
+        assert {k: v.shape[-2:] for k, v in pyr_coeffs.items()} == spatial.pyr_size
+        assert pyr.num_scales == spatial.num_scales
+
+    def test_benchmark(self, img):
+        times = po.simul.benchmark_steerable_pyramids(img.shape[-2:], order=3, device=DEVICE,
+                                                      n_repeats=1)
+        assert list(times.keys()) == ['fft', 'spatial']
+        assert all(t > 0 for t in times.values())
@@ -1,5 +1,6 @@
 from math import pi
 
+import numpy as np
 import plenoptic as po
 import pytest
 import torch
@@ -70,6 +71,43 @@ class TestSignal(object):
                 - a[..., n//2, n//2+w])
                 < 1e-5).all()
 
+    @pytest.mark.parametrize("shape", [(16, 16), (12, 20), (15, 9)])
+    @pytest.mark.parametrize("factor", [2, 3])
+    def test_upsample_fourier(self, shape, factor):
+        x = torch.randn(2, 3, *shape, dtype=torch.float64, device=DEVICE)
+        x_large = po.tools.signal.upsample_fourier(x, factor)
+        assert x_large.shape == (2, 3, factor * shape[0], factor * shape[1])
+        assert not x_large.is_complex()
+        # a real signal is upsampled as the real part of the complex one
+        x_complex = po.tools.signal.upsample_fourier(x.to(torch.complex128), factor)
+        assert torch.allclose(x_large, x_complex.real)
+        # the signal itself is interpolated when there is no nyquist frequency
+        if all(n % 2 for n in shape):
+            assert torch.allclose(x_large[..., ::factor, ::factor], x)
+        # sinusoids below the nyquist frequency are interpolated exactly
+        yy, xx = torch.meshgrid(*[torch.arange(factor * n, dtype=torch.float64,
+                                             device=DEVICE) / (factor * n)
+                                for n in shape], indexing='ij')
+        sinusoid = torch.cos(2 * pi * (2 * yy - 3 * xx) + 1)
+        assert torch.allclose(
+            po.tools.signal.upsample_fourier(sinusoid[::factor, ::factor], factor),
+            sinusoid)
+
+    @pytest.mark.parametrize("uniform", [True, False])
+    def test_interpolate1d(self, uniform):
+        if uniform:
+            X, Y = po.tools.signal.raised_cosine()
+        else:
+            X = np.sort(np.random.randn(50))
+            Y = np.random.randn(50)
+        # include values outside of the range of X and exactly on the knots
+        x = torch.cat([3 * torch.randn(1000, dtype=torch.float64),
+                       torch.as_tensor(X[[0, 1, 10, -1]])]).to(DEVICE)
+        interp = po.tools.signal.interpolate1d(x, Y, X)
+        assert interp.device == x.device
+        np.testing.assert_allclose(po.to_numpy(interp), np.interp(po.to_numpy(x), X, Y),
+                                   rtol=1e-12, atol=1e-12)
+
 
 class TestStats(object):
 